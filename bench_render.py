@@ -0,0 +1,435 @@
+"""
+Edienai Lanches - Benchmark de renderização de tickets
+Mede tempo, pico de memória e bytes de saída por ticket para cada combinação
+de largura de papel, tamanho de texto, tamanho de pedido e modo de renderização
+
+Uso:
+    python bench_render.py [--font DejaVuSans-Bold.ttf] [--repeat 5] [--quick]
+                           [--json-out resultado.json]
+                           [--baseline referencia.json --threshold 0.25]
+                           [--memory-threshold 0.25] [--bytes-threshold 0.05]
+    python bench_render.py --templates [--iterations 2000]
+
+A fonte pode ser passada por --font, pela variável EDIENAI_FONT ou ser copiada
+para fonts/DejaVuSans-Bold.ttf ao lado do cliente (a pasta não faz parte do
+repositório), para rodar igual no Linux e no Windows. Tempo, memória e bytes
+dependem da fonte: a checagem avisa quando a referência usou outra.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+CLIENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test.py')
+
+# Tamanhos de pedido: de 1 item até comanda de mesa com 40 itens
+ORDER_SIZES = {
+    'xs': {'items': 1, 'complements': 0, 'long_notes': False},
+    'm': {'items': 5, 'complements': 2, 'long_notes': False},
+    'l': {'items': 15, 'complements': 3, 'long_notes': True},
+    'tab40': {'items': 40, 'complements': 4, 'long_notes': True},
+}
+
+# Modos de renderização: sobrescritas de configuração aplicadas ao processador
+RENDER_MODES = {
+    'bitmap': {'rotation_degrees': 0},
+    'bitmap-rot90': {'rotation_degrees': 90},
+    'escpos': {'force_bitmap': False, 'header_graphics': 'off'},
+    'escpos-nv': {'force_bitmap': False, 'header_graphics': 'nv'},
+}
+
+PRINT_TYPES = ['client', 'kitchen']
+
+# Diferenças abaixo destes valores são tratadas como ruído
+NOISE_FLOOR_MS = 1.0
+NOISE_FLOOR_KB = 64.0
+NOISE_FLOOR_BYTES = 16
+NOISE_FLOOR_RSS_MB = 4.0
+
+PRODUCT_NAMES = [
+    'X-Burguer', 'X-Bacon', 'X-Calabresa', 'X-Frango', 'Meu Tudão', 'X-Topa Tudo',
+    'Super Mega Bacon', 'Nordestino', 'Portuense', 'Coca-Cola 1L', 'Guaraná Antarctica 2L',
+    'Suco de Maracujá', 'Água sem gás',
+]
+COMPLEMENT_NAMES = [
+    'Bacon', 'Cheddar', 'Catupiry', 'Ovo', 'Queijo', 'Calabresa', 'Geleia de pimenta',
+    'Carne artesanal', 'Carne industrial',
+]
+SHORT_NOTES = ['Sem cebola', 'Bem passado', 'Sem maionese', 'Pão sem gergelim']
+LONG_NOTES = [
+    'Cliente alérgico a amendoim, por favor não usar molho da casa e trocar o pão por pão '
+    'de batata; caprichar no ponto da carne e mandar guardanapos extras',
+    'Separar os lanches das crianças em embalagens diferentes, sem pimenta e sem cebola, '
+    'com ketchup e mostarda à parte',
+]
+CUSTOMERS = ['João da Silva', 'Maria Conceição Araújo', 'Antônio Gonçalves de Assunção Júnior', 'Lúcia']
+ADDRESSES = [
+    'Rua das Flores, 123 - Centro',
+    'Avenida Presidente Getúlio Vargas, 4567, Bloco B, Apartamento 1203 - Jardim São José, '
+    'próximo à padaria Pão Dourado',
+]
+
+
+def load_client():
+    """Carrega o cliente de impressão (test.py) como módulo"""
+    spec = importlib.util.spec_from_file_location('edienai_client', CLIENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['edienai_client'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_order(items=5, complements=2, long_notes=False, seed=0):
+    """Gera um pedido sintético no formato de orderData"""
+    rng = random.Random(seed)
+    order_id = f"bench-{seed:06d}-{items:02d}"
+    table_tab = items >= 20
+    if table_tab:
+        delivery = {'type': 'No Local', 'tableNumber': rng.randint(1, 30)}
+    else:
+        delivery = rng.choice([
+            {'type': 'Entrega', 'address': rng.choice(ADDRESSES)},
+            {'type': 'Retirada'},
+            {'type': 'No Local', 'tableNumber': rng.randint(1, 30)},
+        ])
+
+    order_items = []
+    for n in range(items):
+        quantity = rng.randint(1, 3)
+        item_complements = [
+            {'name': rng.choice(COMPLEMENT_NAMES), 'price': 3.0}
+            for _ in range(rng.randint(0, complements))
+        ]
+        notes = None
+        if long_notes and n % 3 == 0:
+            notes = rng.choice(LONG_NOTES)
+        elif n % 4 == 0:
+            notes = rng.choice(SHORT_NOTES)
+        order_items.append({
+            'id': f"{order_id}-{n}",
+            'name': rng.choice(PRODUCT_NAMES),
+            'quantity': quantity,
+            'totalItemPrice': round(quantity * rng.uniform(8, 42) + 3.0 * len(item_complements), 2),
+            'complements': item_complements,
+            'notes': notes,
+        })
+
+    total = round(sum(item['totalItemPrice'] for item in order_items), 2)
+    order = {
+        'id': order_id,
+        'customerName': rng.choice(CUSTOMERS),
+        'deliveryOption': delivery,
+        'sentAt': datetime(2026, 1, 15, 20, 30, tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'items': order_items,
+        'total': total,
+        'paymentMethod': rng.choice(['Pix', 'Dinheiro', 'Cartão de Crédito']),
+    }
+    if order['paymentMethod'] == 'Dinheiro':
+        order['trocoPara'] = float(int(total // 50 + 1) * 50)
+    return order
+
+
+def legacy_receipt_lines(order_data, print_type):
+    """Montagem de linhas codificada à mão (anterior aos templates) - referência do benchmark"""
+    lines = []
+    lines.append(('center', 'Edienai Lanches', 'title', ''))
+    lines.append(('rule', '-' * 32, 'normal', ''))
+    if print_type == 'kitchen':
+        lines.append(('center', '--- PEDIDO PARA COZINHA ---', 'bold', ''))
+    else:
+        lines.append(('center', '--- COMPROVANTE DE PEDIDO ---', 'bold', ''))
+    lines.append(('rule', '-' * 32, 'normal', ''))
+
+    order_id = order_data.get('orderId', order_data.get('id', 'N/A'))
+    lines.append(('left', f"Pedido #: {order_id}", 'normal', ''))
+    customer_name = str(order_data.get('customerName', 'N/A'))
+    lines.append(('left', f"Cliente: {customer_name}", 'normal', ''))
+
+    delivery_option = order_data.get('deliveryOption', {})
+    delivery_type = delivery_option.get('type', 'N/A')
+    lines.append(('left', f"Tipo: {delivery_type}", 'normal', ''))
+    if delivery_type == 'No Local':
+        lines.append(('left', f"Mesa: {delivery_option.get('tableNumber', 'N/A')}", 'normal', ''))
+    elif delivery_type == 'Entrega':
+        lines.append(('left', f"Endereço: {delivery_option.get('address', 'N/A')}", 'normal', ''))
+
+    sent_at = order_data.get('sentAt')
+    if sent_at:
+        if isinstance(sent_at, str):
+            dt = datetime.fromisoformat(sent_at.replace('Z', '+00:00'))
+        else:
+            dt = datetime.now()
+        lines.append(('left', f"Data: {dt.strftime('%d/%m/%Y %H:%M')}", 'normal', ''))
+
+    lines.append(('rule', '-' * 32, 'normal', ''))
+    lines.append(('left', 'ITENS:', 'header', ''))
+    for item in order_data.get('items', []):
+        name = str(item.get('name', 'Item'))
+        qty = item.get('quantity', 1)
+        price = item.get('totalItemPrice', 0)
+        lines.append(('left', f"{qty}x {name}", 'bold', ''))
+        for comp in item.get('complements', []):
+            lines.append(('left', f"  - {str(comp.get('name', 'Comp'))}", 'normal', "  - "))
+        notes = item.get('notes') or item.get('observations')
+        if notes:
+            lines.append(('left', f"  OBS: {str(notes)}", 'normal', "  OBS: "))
+        if print_type != 'kitchen':
+            lines.append(('right', f"Subtotal: R$ {price:.2f}".replace('.', ','), 'normal', ''))
+
+    lines.append(('rule', '-' * 32, 'normal', ''))
+    if print_type != 'kitchen':
+        total = order_data.get('total', 0)
+        lines.append(('right', f"TOTAL: R$ {total:.2f}".replace('.', ','), 'total', ''))
+        lines.append(('left', f"Pagamento: {order_data.get('paymentMethod', 'N/A')}", 'normal', ''))
+        troco_para = order_data.get('trocoPara')
+        if troco_para:
+            troco = float(troco_para) - float(total)
+            lines.append(('left', f"Troco para: R$ {troco_para:.2f}".replace('.', ','), 'normal', ''))
+            lines.append(('left', f"Troco: R$ {max(0, troco):.2f}".replace('.', ','), 'normal', ''))
+    lines.append(('rule', '-' * 32, 'normal', ''))
+    if print_type == 'kitchen':
+        lines.append(('center', 'Bom trabalho!', 'normal', ''))
+    else:
+        lines.append(('center', 'Obrigado pelo seu pedido!', 'normal', ''))
+    return lines
+
+
+def bench_templates(client, iterations):
+    """Compara o tempo da montagem de linhas codificada à mão com o template compilado
+
+    A equivalência das duas saídas é verificada em tests/test_templates.py.
+    """
+    template = client.load_receipt_template()
+    print(f"{'caso':<20} {'manual µs':>11} {'template µs':>12} {'razão':>8}")
+    print('-' * 54)
+    for index, (name, spec) in enumerate(ORDER_SIZES.items()):
+        order = generate_order(seed=index, **spec)
+        for print_type in PRINT_TYPES:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                legacy_receipt_lines(order, print_type)
+            legacy_us = (time.perf_counter() - start) / iterations * 1e6
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                template.render(client.build_order_view(order, print_type))
+            template_us = (time.perf_counter() - start) / iterations * 1e6
+
+            print(f"{name + '|' + print_type:<20} {legacy_us:>11.1f} {template_us:>12.1f} {template_us / legacy_us:>7.2f}x")
+
+
+def output_bytes(ticket):
+    """Bytes enviados à impressora: stream ESC/POS ou raster de 1 bit"""
+    if isinstance(ticket, (bytes, bytearray)):
+        return len(ticket)
+    return len(ticket.convert('1').tobytes())
+
+
+def image_kb(ticket):
+    """Tamanho do buffer de pixels do ticket (alocado em C, invisível ao tracemalloc)"""
+    if isinstance(ticket, (bytes, bytearray)):
+        return 0.0
+    return ticket.width * ticket.height * len(ticket.getbands()) / 1024
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (MB), ou None se a plataforma não informar"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_case(client, base_config, mode_overrides, order, print_type, repeat):
+    """Mede um caso: tempo (mediana/mínimo), pico de memória e bytes de saída
+
+    O pico de memória soma o pico de objetos Python (tracemalloc) ao buffer
+    de pixels da imagem final, que o Pillow aloca fora do heap do Python.
+    """
+    config = {**base_config, **mode_overrides}
+    processor = client.PrintCommandProcessor(config, lambda *a, **k: None, backend=client.NullPrinterBackend())
+
+    # Aquecimento (carrega fontes e caches, grava gráficos estáticos) fora da medição
+    ticket = processor.render_ticket(order, print_type, commit_graphics=True)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ticket = processor.render_ticket(order, print_type)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    processor.render_ticket(order, print_type)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'peak_kb': round(peak / 1024 + image_kb(ticket), 1),
+        'output_bytes': output_bytes(ticket),
+    }
+
+
+def run_suite(client, args):
+    """Executa a matriz completa de casos"""
+    paper_widths = list(client.PAPER_WIDTHS)
+    text_sizes = list(client.FONT_SIZES)
+    order_sizes = list(ORDER_SIZES)
+    modes = list(RENDER_MODES)
+    if args.quick:
+        paper_widths = ['58mm', '80mm']
+        text_sizes = ['normal', 'extra']
+        order_sizes = ['xs', 'tab40']
+    if args.modes:
+        modes = [m for m in modes if m in args.modes]
+
+    base_config = {**client.DEFAULT_CONFIG, 'font_path': args.font or ''}
+    orders = {name: generate_order(seed=i, **spec) for i, (name, spec) in enumerate(ORDER_SIZES.items())}
+
+    results = {}
+    for mode in modes:
+        for paper in paper_widths:
+            for text_size in text_sizes:
+                for size in order_sizes:
+                    for print_type in PRINT_TYPES:
+                        key = f"{mode}|{paper}|{text_size}|{size}|{print_type}"
+                        config = {**base_config, 'paper_width': paper, 'text_size': text_size}
+                        results[key] = bench_case(client, config, RENDER_MODES[mode], orders[size], print_type, args.repeat)
+                        print(f"  {key:<45} {results[key]['median_ms']:>9.2f} ms", file=sys.stderr)
+    return results
+
+
+def print_report(results, baseline=None):
+    """Exibe a tabela de resultados (com variação contra a referência, se houver)"""
+    header = f"{'caso':<45} {'mediana':>10} {'mín':>9} {'pico KB':>9} {'bytes':>9}"
+    if baseline:
+        header += f" {'Δ tempo':>9}"
+    print(header)
+    print('-' * len(header))
+    for key, r in results.items():
+        line = f"{key:<45} {r['median_ms']:>8.2f}ms {r['min_ms']:>7.2f}ms {r['peak_kb']:>9.1f} {r['output_bytes']:>9}"
+        if baseline and key in baseline:
+            before = baseline[key]['median_ms']
+            line += f" {((r['median_ms'] - before) / before * 100 if before else 0):>+8.1f}%"
+        print(line)
+
+
+# Métrica do caso -> (limite em args, piso de ruído, formato)
+REGRESSION_METRICS = {
+    'median_ms': ('threshold', NOISE_FLOOR_MS, '{:.2f}ms'),
+    'peak_kb': ('memory_threshold', NOISE_FLOOR_KB, '{:.1f}KB'),
+    'output_bytes': ('bytes_threshold', NOISE_FLOOR_BYTES, '{} bytes'),
+}
+
+
+def _regressed(before, after, threshold, floor):
+    delta = after - before
+    return delta > floor and delta > before * threshold
+
+
+def check_regressions(results, baseline, args, meta=None, baseline_meta=None):
+    """Casos mais lentos, com mais memória ou mais bytes que a referência além dos limites"""
+    regressions = []
+    for key, r in results.items():
+        before = baseline.get(key)
+        if not before:
+            continue
+        for metric, (option, floor, fmt) in REGRESSION_METRICS.items():
+            if metric in before and _regressed(before[metric], r[metric], getattr(args, option), floor):
+                regressions.append(f"{key} [{metric}]: {fmt.format(before[metric])} -> {fmt.format(r[metric])}")
+    before_rss = (baseline_meta or {}).get('peak_rss_mb')
+    after_rss = (meta or {}).get('peak_rss_mb')
+    if before_rss and after_rss and _regressed(before_rss, after_rss, args.memory_threshold, NOISE_FLOOR_RSS_MB):
+        regressions.append(f"processo [peak_rss_mb]: {before_rss:.1f}MB -> {after_rss:.1f}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de renderização de tickets")
+    parser.add_argument('--font', help="Fonte TTF (padrão: config/EDIENAI_FONT/busca automática)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help="Subconjunto reduzido da matriz")
+    parser.add_argument('--modes', nargs='*', help=f"Modos a medir: {', '.join(RENDER_MODES)}")
+    parser.add_argument('--json-out', help="Salva os resultados em JSON")
+    parser.add_argument('--baseline', help="JSON de referência para checagem de regressão")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Regressão relativa de tempo tolerada (0.25 = 25%%)")
+    parser.add_argument('--memory-threshold', type=float, default=0.25,
+                        help="Aumento relativo tolerado do pico de memória por caso e do RSS do processo")
+    parser.add_argument('--bytes-threshold', type=float, default=0.05,
+                        help="Aumento relativo tolerado dos bytes enviados à impressora")
+    parser.add_argument('--templates', action='store_true', help="Compara template compilado x montagem manual")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    client = load_client()
+    if args.templates:
+        bench_templates(client, args.iterations)
+        return
+    font_path = client.resolve_font_path({'font_path': args.font or ''})
+    print(f"Fonte: {font_path or 'embutida do Pillow'}", file=sys.stderr)
+
+    # Os logs de depuração do cliente distorcem as medições
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run_suite(client, args)
+
+    meta = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pillow': client.Image.__version__,
+        'font': font_path,
+        'repeat': args.repeat,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    baseline = baseline_meta = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            reference = json.load(f)
+        baseline, baseline_meta = reference['results'], reference.get('meta', {})
+        if os.path.basename(baseline_meta.get('font') or '') != os.path.basename(font_path or ''):
+            print(f"⚠️ Referência medida com outra fonte ({baseline_meta.get('font') or 'embutida do Pillow'}); "
+                  f"tempo, memória e bytes não são comparáveis", file=sys.stderr)
+
+    print_report(results, baseline)
+    if meta['peak_rss_mb']:
+        print(f"\nPico de memória do processo: {meta['peak_rss_mb']:.1f} MB")
+
+    if args.json_out:
+        report = {'meta': meta, 'results': results}
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if baseline:
+        regressions = check_regressions(results, baseline, args, meta, baseline_meta)
+        limits = (f"tempo {args.threshold:.0%}, memória {args.memory_threshold:.0%}, "
+                  f"bytes {args.bytes_threshold:.0%}")
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressões acima dos limites ({limits}):")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ Nenhuma regressão acima dos limites ({limits})")
+
+
+if __name__ == "__main__":
+    main()
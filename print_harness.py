@@ -0,0 +1,1394 @@
+"""
+Edienai Lanches - Harness offline do cliente de impressão
+Servidor substituto do worker, gravação de streams reais e teste de carga
+
+Uso:
+    python print_harness.py serve  [--port 8787] [--replay gravacao.jsonl] [--speed 1]
+    python print_harness.py record --output gravacao.jsonl [--duration 600]
+    python print_harness.py load   [--replay gravacao.jsonl | --orders 200 [--updates 20]] [--speed 10]
+                                   [--backend null|file] [--max-p99-ms 500] [--min-throughput 5]
+                                   [--batch 8] [--job-overhead-ms 150]
+                                   [--drop-every 2] [--stall-every 5 --stall-seconds 3]
+                                   [--min-retry 0.1] [--healthy-after 1]
+    python print_harness.py burst  [--orders 50] [--batch 8] [--job-overhead-ms 150]
+    python print_harness.py stress [--producers 8] [--events 20000] [--copies 2]
+    python print_harness.py tenants [--tenants 4] [--orders 30] [--workers 2]
+    python print_harness.py coord  [--nodes 2] [--fail-after 4] [--graceful]
+
+Testes de unidade (config, ingestão, arquivo, ESC/POS, coordenação):
+    python -m pytest tests
+
+Para apontar o cliente real (test.py) para o servidor substituto:
+    EDIENAI_WORKERS_URL=http://127.0.0.1:8787 python test.py
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import queue
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+CLIENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test.py')
+
+HEARTBEAT_INTERVAL = 15   # Segundos entre comentários ": ping" nos streams
+JOB_NAME_PATTERN = re.compile(r'^Pedido #(.+) - (\w+)$')
+
+
+def load_client():
+    """Carrega o cliente de impressão (test.py) como módulo"""
+    spec = importlib.util.spec_from_file_location('edienai_client', CLIENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['edienai_client'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def log(message):
+    """Mensagens do harness vão para stderr (stdout pode estar silenciado)"""
+    print(f"[HARNESS] {message}", file=sys.stderr, flush=True)
+
+# ============================================================================
+# SERVIDOR SUBSTITUTO DO WORKER
+# ============================================================================
+
+class StandInState:
+    """Estado compartilhado do servidor: fila de comandos, confirmações e assinantes"""
+
+    def __init__(self, role, pin):
+        self.role = role
+        self.pin = pin
+        self.lock = threading.Lock()
+        self.pending = {}          # commandId -> comando ainda não confirmado
+        self.confirmations = {}    # commandId -> (status, horário)
+        self.subscribers = {'print': set(), 'orders': set()}
+        self.orders = {}           # id -> última versão do pedido (snapshot de pedidos)
+        self.served = []           # (stream, evento) na ordem em que foram escritos nas conexões
+        self.last_fault = 0.0
+        self.last_snapshot = {'print': 0.0, 'orders': 0.0}
+        self.faults = 0
+        self.stopping = threading.Event()
+
+    def subscribe(self, stream):
+        """Registra um novo assinante de stream"""
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers[stream].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, stream, subscriber):
+        """Remove um assinante de stream
+
+        Como o worker real, eventos que ele não chegou a enviar se perdem: o
+        cliente só os recupera pelo snapshot da reconexão.
+        """
+        with self.lock:
+            self.subscribers[stream].discard(subscriber)
+
+    def subscriber_count(self, stream):
+        """Quantidade de conexões abertas em um stream"""
+        with self.lock:
+            return len(self.subscribers[stream])
+
+    def publish(self, stream, payload):
+        """Envia evento aos assinantes atuais do stream (sem assinantes, se perde)"""
+        with self.lock:
+            name = payload.get('event')
+            if name == 'print:enqueue' and payload.get('command'):
+                command = payload['command']
+                self.pending[command.get('commandId')] = command
+            elif name in ('orders:insert', 'orders:update') and payload.get('order'):
+                order = payload['order']
+                self.orders[order.get('id') or order.get('orderId')] = order
+            subscribers = list(self.subscribers[stream])
+        for subscriber in subscribers:
+            subscriber.put(payload)
+
+    def interrupt(self, mode, seconds=0.0):
+        """Falha simulada em todas as conexões abertas
+
+        'drop' fecha os streams na hora; 'stall' para de escrever (nem
+        heartbeats) por `seconds` antes de fechar, como um proxy travado.
+        """
+        with self.lock:
+            self.faults += 1
+            self.last_fault = time.monotonic()
+            subscribers = [s for stream in self.subscribers.values() for s in stream]
+        for subscriber in subscribers:
+            subscriber.put({'__fault__': mode, 'seconds': seconds})
+
+    def record_served(self, stream, payload):
+        """Registra um evento escrito com sucesso em uma conexão"""
+        with self.lock:
+            self.served.append((stream, payload))
+            if payload.get('event', '').endswith(':snapshot'):
+                self.last_snapshot[stream] = time.monotonic()
+
+    def wait_settled(self, timeout):
+        """Aguarda os streams reconectarem depois da última falha e entregarem tudo
+
+        Só então o registro 'served' está completo para calcular os tickets
+        esperados.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                settled = all(
+                    self.subscribers[stream] and self.last_snapshot[stream] > self.last_fault
+                    and all(subscriber.empty() for subscriber in self.subscribers[stream])
+                    for stream in self.subscribers)
+            if settled:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def snapshot(self, stream):
+        """Evento de snapshot enviado ao abrir um stream"""
+        if stream == 'print':
+            with self.lock:
+                return {'event': 'print:snapshot', 'commands': list(self.pending.values())}
+        with self.lock:
+            return {'event': 'orders:snapshot', 'orders': list(self.orders.values())}
+
+    def queued_commands(self):
+        """Comandos pendentes (endpoint de polling)"""
+        with self.lock:
+            return list(self.pending.values())
+
+    def confirm(self, body):
+        """Registra confirmação de impressão"""
+        command_id = body.get('commandId')
+        with self.lock:
+            self.pending.pop(command_id, None)
+            self.confirmations[command_id] = (body.get('status'), time.time())
+
+    def authorized(self, role, pin):
+        """Valida credenciais"""
+        return role == self.role and pin == self.pin
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Implementa os endpoints usados pelo cliente de impressão"""
+
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    STREAMS = {
+        '/api/print/stream': 'print',
+        '/realtime/orders/stream': 'orders',
+    }
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        role = params.get('role', [None])[0]
+        pin = params.get('pin', [None])[0]
+        if not self.state.authorized(role, pin):
+            self._send_json(401, {'error': 'unauthorized'})
+            return
+
+        if url.path in self.STREAMS:
+            self._stream(self.STREAMS[url.path])
+        elif url.path == '/api/print/queue':
+            self._send_json(200, {'commands': self.state.queued_commands()})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not self.state.authorized(self.headers.get('X-User-Role'), self.headers.get('X-User-Pin')):
+            self._send_json(401, {'error': 'unauthorized'})
+            return
+
+        if url.path == '/api/print/confirm':
+            try:
+                body = json.loads(raw or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': 'invalid json'})
+                return
+            self.state.confirm(body)
+            self._send_json(200, {'ok': True})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, stream):
+        """Stream SSE com codificação chunked (como o worker do Cloudflare)"""
+        subscriber = self.state.subscribe(stream)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            snapshot = self.state.snapshot(stream)
+            self._write_chunk(f"data: {json.dumps(snapshot)}\n\n")
+            self.state.record_served(stream, snapshot)
+
+            while not self.state.stopping.is_set():
+                try:
+                    payload = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+                    if '__fault__' in payload:
+                        if payload['__fault__'] == 'stall':
+                            self.state.stopping.wait(payload['seconds'])
+                        break
+                    self._write_chunk(f"data: {json.dumps(payload)}\n\n")
+                    self.state.record_served(stream, payload)
+                except queue.Empty:
+                    self._write_chunk(": ping\n\n")
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            self.state.unsubscribe(stream, subscriber)
+        self.close_connection = True
+
+
+def start_server(host, port, role, pin):
+    """Sobe o servidor substituto em uma thread"""
+    state = StandInState(role, pin)
+    handler = type('BoundStandInHandler', (StandInHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def stop_server(server, state):
+    """Encerra servidor e streams abertos"""
+    state.stopping.set()
+    server.shutdown()
+    server.server_close()
+
+# ============================================================================
+# GRAVAÇÃO E REPRODUÇÃO DE EVENTOS
+# ============================================================================
+
+def record_streams(client, output_path, duration):
+    """Grava os eventos dos streams reais em JSONL: {"t", "stream", "payload"}"""
+    base = client.WORKERS_BASE_URL
+    auth = f"role={client.AUTH_ROLE}&pin={client.AUTH_PIN}"
+    urls = {
+        'print': f"{base}/api/print/stream?{auth}",
+        'orders': f"{base}/realtime/orders/stream?{auth}",
+    }
+    write_lock = threading.Lock()
+    stop = threading.Event()
+    start = time.time()
+    counts = {'print': 0, 'orders': 0}
+
+    with open(output_path, 'w', encoding='utf-8') as out:
+        def listen(stream, url):
+            session = requests.Session()
+            while not stop.is_set():
+                try:
+                    with session.get(url, headers={'Accept': 'text/event-stream'}, stream=True, timeout=60) as resp:
+                        for line in resp.iter_lines(decode_unicode=True):
+                            if stop.is_set():
+                                return
+                            if not line or not line.startswith('data:'):
+                                continue
+                            try:
+                                payload = json.loads(line[5:].strip())
+                            except ValueError:
+                                continue
+                            record = {'t': round(time.time() - start, 4), 'stream': stream, 'payload': payload}
+                            with write_lock:
+                                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                                out.flush()
+                                counts[stream] += 1
+                except Exception as e:
+                    log(f"Erro no stream {stream}: {e} - reconectando")
+                    time.sleep(2)
+
+        for stream, url in urls.items():
+            threading.Thread(target=listen, args=(stream, url), daemon=True).start()
+
+        log(f"Gravando streams de {base} em {output_path} ({duration}s, Ctrl+C para parar)")
+        try:
+            stop.wait(duration)
+        except KeyboardInterrupt:
+            pass
+        stop.set()
+    log(f"Gravação concluída: {counts['print']} eventos de impressão, {counts['orders']} de pedidos")
+
+
+def load_recording(path):
+    """Carrega gravação JSONL ordenada por tempo"""
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    events.sort(key=lambda e: e['t'])
+    return events
+
+
+def normalize_events(events):
+    """Converte snapshots gravados em eventos reproduzíveis
+
+    O servidor substituto gera seus próprios snapshots a partir do que foi
+    publicado; comandos presentes no snapshot de impressão viram
+    'print:enqueue' e o snapshot de pedidos é descartado (o inicial não é
+    impresso pelo cliente).
+    """
+    normalized = []
+    for event in events:
+        payload = event['payload']
+        name = payload.get('event')
+        if name == 'print:snapshot':
+            for command in payload.get('commands', []):
+                normalized.append({**event, 'payload': {'event': 'print:enqueue', 'command': command}})
+        elif name in ('orders:snapshot', 'print:noop', 'orders:noop'):
+            continue
+        else:
+            normalized.append(event)
+    return normalized
+
+
+def synthetic_order(index, items=3):
+    """Pedido sintético no formato de orderData"""
+    order_id = f"sim-{index:06d}"
+    delivery = random.choice([
+        {'type': 'No Local', 'tableNumber': random.randint(1, 20)},
+        {'type': 'Entrega', 'address': 'Rua das Flores, 123 - Centro'},
+        {'type': 'Retirada'},
+    ])
+    order_items = []
+    for n in range(items):
+        price = round(random.uniform(12, 45), 2)
+        order_items.append({
+            'id': f"{order_id}-{n}",
+            'name': random.choice(['X-Burguer', 'X-Bacon', 'X-Calabresa', 'Meu Tudão', 'Coca-Cola 1L']),
+            'quantity': random.randint(1, 3),
+            'totalItemPrice': price,
+            'complements': [{'name': 'Bacon'}] if n % 2 else [],
+            'notes': 'Sem cebola' if n % 3 == 0 else None,
+        })
+    return {
+        'id': order_id,
+        'customerName': f"Cliente {index}",
+        'deliveryOption': delivery,
+        'sentAt': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'items': order_items,
+        'total': round(sum(i['totalItemPrice'] for i in order_items), 2),
+        'paymentMethod': random.choice(['Pix', 'Dinheiro', 'Cartão']),
+    }
+
+
+def synthetic_events(orders, interval, manual=0, updates=0):
+    """Gera eventos de pedidos (e comandos manuais/acréscimos opcionais) espaçados por 'interval'"""
+    events = []
+    for i in range(orders):
+        order = synthetic_order(i)
+        events.append({'t': i * interval, 'stream': 'orders', 'payload': {'event': 'orders:insert', 'order': order}})
+        if updates and i < updates:
+            # Comanda de mesa: um item novo e mais uma unidade do primeiro
+            updated = json.loads(json.dumps(order))
+            updated['items'][0]['quantity'] += 1
+            updated['items'].append({'id': f"{order['id']}-extra", 'name': 'Batata Frita', 'quantity': 1,
+                                     'totalItemPrice': 18.0, 'complements': [], 'notes': None})
+            events.append({'t': (i + 0.5) * interval, 'stream': 'orders',
+                           'payload': {'event': 'orders:update', 'order': updated}})
+        if manual and i < manual:
+            command = {
+                'commandId': f"{order['id']}_manual",
+                'type': 'print',
+                'printType': 'client',
+                'orderData': {**order, 'id': f"{order['id']}-m"},
+            }
+            events.append({'t': i * interval, 'stream': 'print', 'payload': {'event': 'print:enqueue', 'command': command}})
+    events.sort(key=lambda event: event['t'])
+    return events
+
+
+def order_deliveries(events, served=None):
+    """Versões de pedidos que chegam ao cliente: (tipo, pedido, índice do evento de origem)
+
+    Sem 'served' são os eventos de pedidos do roteiro. Com 'served' (registro
+    StandInState.served) é o que o servidor substituto de fato escreveu nos
+    streams: eventos ao vivo e, por pedido, cada snapshot ('seed' no
+    primeiro, 'resync' nos das reconexões).
+    """
+    kinds = {'orders:insert': 'insert', 'orders:update': 'update'}
+    origin = {}
+    for index, event in enumerate(events):
+        order = event['payload'].get('order')
+        if order is not None:
+            origin.setdefault(id(order), index)
+    if served is None:
+        return [(kinds[event['payload']['event']], event['payload']['order'], index)
+                for index, event in enumerate(events)
+                if event['payload'].get('event') in kinds and event['payload'].get('order')]
+
+    deliveries = []
+    snapshots = 0
+    for stream, payload in served:
+        name = payload.get('event')
+        if name in kinds and payload.get('order'):
+            deliveries.append((kinds[name], payload['order'], origin.get(id(payload['order']))))
+        elif name == 'orders:snapshot':
+            kind = 'resync' if snapshots else 'seed'
+            snapshots += 1
+            deliveries.extend((kind, order, origin.get(id(order))) for order in payload.get('orders', []))
+    return deliveries
+
+
+def expected_tickets(events, config, snapshots=None, served=None):
+    """Mapeia cada ticket esperado ("pedido:tipo") para o índice do evento que o origina
+
+    'snapshots' (OrderSnapshots do cliente) reproduz a detecção de acréscimos
+    para prever os tickets de adicional gerados por 'orders:update'.
+    'served' (registro do servidor substituto) aplica a regra dos snapshots de
+    reconexão aos pedidos que o servidor entregou: um pedido visto pela
+    primeira vez num desses snapshots é impresso como novo e uma versão já
+    conhecida vira adicional se os itens mudaram.
+    """
+    expected = {}
+    inserted = set()
+    for kind, order, index in order_deliveries(events, served):
+        order_id = order.get('orderId', order.get('id'))
+        if kind == 'resync':
+            known = order_id in inserted or (snapshots is not None and order_id in snapshots.orders)
+            kind = 'seed' if known else 'insert'
+        if kind in ('update', 'seed'):
+            if snapshots is not None and snapshots.diff(order) and config.get('auto_print_addendum', True):
+                expected.setdefault(f"{order_id}:addendum", index)
+        elif kind == 'insert':
+            if snapshots is not None and order_id not in inserted:
+                # Como o canal de ingestão: inserts repetidos não tocam no resumo
+                snapshots.seed(order)
+            inserted.add(order_id)
+            if config.get('auto_print_client', True):
+                expected.setdefault(f"{order_id}:client", index)
+            if config.get('auto_print_kitchen', True):
+                expected.setdefault(f"{order_id}:kitchen", index)
+    for index, event in enumerate(events):
+        payload = event['payload']
+        if payload.get('event') == 'print:enqueue' and payload.get('command'):
+            command = payload['command']
+            order = command.get('orderData') or {}
+            order_id = order.get('orderId', order.get('id'))
+            expected.setdefault(f"{order_id}:{command.get('printType', 'client')}", index)
+    return expected
+
+
+class Replayer:
+    """Reproduz eventos gravados no servidor substituto a N× a velocidade original"""
+
+    def __init__(self, state, events, speed):
+        self.state = state
+        self.events = events
+        self.speed = max(speed, 0.001)
+        self.emitted_at = {}   # índice do evento -> horário de emissão
+
+    def run(self):
+        start = time.perf_counter()
+        origin = self.events[0]['t'] if self.events else 0
+        for index, event in enumerate(self.events):
+            delay = (event['t'] - origin) / self.speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            self.emitted_at[index] = time.perf_counter()
+            self.state.publish(event['stream'], event['payload'])
+
+
+class FaultInjector:
+    """Derruba ou trava os streams periodicamente durante a reprodução"""
+
+    def __init__(self, state, drop_every=0.0, stall_every=0.0, stall_seconds=3.0):
+        self.state = state
+        self.drop_every = drop_every
+        self.stall_every = stall_every
+        self.stall_seconds = stall_seconds
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.drop_every or self.stall_every:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        now = time.monotonic()
+        next_drop = now + self.drop_every if self.drop_every else float('inf')
+        next_stall = now + self.stall_every if self.stall_every else float('inf')
+        while not self.stopping.wait(max(0.0, min(next_drop, next_stall) - time.monotonic())):
+            if time.monotonic() >= next_drop:
+                self.state.interrupt('drop')
+                next_drop += self.drop_every
+            else:
+                self.state.interrupt('stall', self.stall_seconds)
+                next_stall += self.stall_every
+
+# ============================================================================
+# TESTE DE CARGA
+# ============================================================================
+
+class MeasuringBackend:
+    """Envolve um backend real registrando o horário de conclusão de cada ticket
+
+    'job_overhead_ms' simula o custo fixo de cada job no spooler (abrir a
+    impressora, criar o DC, StartDoc/EndDoc), ausente nos backends de teste.
+    """
+
+    def __init__(self, inner, job_overhead_ms=0):
+        self.inner = inner
+        self.name = f"measuring({inner.name})"
+        self.job_overhead = job_overhead_ms / 1000
+        self.jobs = 0
+        self.lock = threading.Lock()
+        self.completed = {}     # "pedido:tipo" -> horário da primeira conclusão
+        self.duplicates = 0
+        self.done = threading.Condition(self.lock)
+
+    def print_image(self, img, printer_name, job_name):
+        self._job()
+        self.inner.print_image(img, printer_name, job_name)
+        self._completed([job_name])
+
+    def print_raw(self, data, printer_name, job_name):
+        self._job()
+        self.inner.print_raw(data, printer_name, job_name)
+        self._completed([job_name])
+
+    def print_image_batch(self, images, printer_name, job_names):
+        self._job()
+        self.inner.print_image_batch(images, printer_name, job_names)
+        self._completed(job_names)
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        self._job()
+        self.inner.print_raw_batch(chunks, printer_name, job_names)
+        self._completed(job_names)
+
+    def _job(self):
+        self.jobs += 1
+        if self.job_overhead:
+            time.sleep(self.job_overhead)
+
+    def _completed(self, job_names):
+        finished = time.perf_counter()
+        with self.lock:
+            for job_name in job_names:
+                match = JOB_NAME_PATTERN.match(job_name)
+                key = f"{match.group(1)}:{match.group(2)}" if match else job_name
+                if key not in self.completed:
+                    self.completed[key] = finished
+                elif not key.endswith(':addendum'):
+                    # Um pedido pode receber vários adicionais legítimos
+                    self.duplicates += 1
+            self.done.notify_all()
+
+    def wait_for(self, keys, timeout):
+        """Aguarda até que todos os tickets esperados tenham sido impressos"""
+        deadline = time.time() + timeout
+        with self.lock:
+            while not all(key in self.completed for key in keys):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.done.wait(remaining)
+            return True
+
+
+def percentile(values, pct):
+    """Percentil pelo método nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def run_load(args):
+    """Executa o teste de carga e retorna o relatório"""
+    global HEARTBEAT_INTERVAL
+    client = load_client()
+    if args.drop_every or args.stall_every:
+        # Falhas simuladas: heartbeats e detecção de stream parado em escala de teste
+        HEARTBEAT_INTERVAL = 0.5
+        client.STREAM_STALE_AFTER = args.stale_after
+        client.STREAM_CHECK_INTERVAL = 0.1
+        client.STREAM_MIN_RETRY = args.min_retry
+        client.STREAM_HEALTHY_AFTER = args.healthy_after
+    server, state = start_server('127.0.0.1', args.port, client.AUTH_ROLE, client.AUTH_PIN)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    client.WORKERS_BASE_URL = base_url
+
+    if args.replay:
+        events = normalize_events(load_recording(args.replay))
+    else:
+        events = synthetic_events(args.orders, args.interval, args.manual, args.updates)
+
+    config = {
+        **client.DEFAULT_CONFIG,
+        'printer_backend': args.backend,
+        'output_dir': args.output_dir,
+        'rotation_degrees': args.rotation,
+        'batch_max_tickets': args.batch,
+        'batch_max_wait_ms': args.batch_wait_ms,
+    }
+    expected = expected_tickets(events, config, client.OrderSnapshots())
+    backend = MeasuringBackend(client.create_printer_backend(config), args.job_overhead_ms)
+    log(f"Servidor substituto em {base_url} - {len(events)} eventos, {len(expected)} tickets esperados")
+
+    errors = []
+
+    def on_log(message, level="info", order_id=None):
+        if level == 'error':
+            errors.append(message)
+
+    silence = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with silence:
+        connections = client.ConnectionManager()
+        processor = client.PrintCommandProcessor(config, on_log, backend=backend, connections=connections)
+        ingestion = client.IngestionChannel(
+            on_command_callback=processor.enqueue,
+            on_new_order_callback=processor.enqueue_order_auto_print,
+            on_order_update_callback=processor.enqueue_order_addendum,
+        )
+        sse_client = client.PrinterSSEClient(ingestion, on_status_callback=lambda s: None, connections=connections)
+        orders_client = client.OrdersSSEClient(ingestion, on_status_callback=lambda s: None, connections=connections)
+        processor.start()
+        ingestion.start()
+        sse_client.start()
+        orders_client.start()
+
+        # Aguarda os dois streams conectarem antes de reproduzir
+        deadline = time.time() + 10
+        while time.time() < deadline and not (state.subscriber_count('print') and state.subscriber_count('orders')):
+            time.sleep(0.05)
+
+        replayer = Replayer(state, events, args.speed)
+        faults = FaultInjector(state, args.drop_every, args.stall_every, args.stall_seconds)
+        started = time.perf_counter()
+        faults.start()
+        replayer.run()
+        faults.stop()
+        # Tickets esperados calculados uma única vez, do roteiro e do que o
+        # servidor entregou (snapshots de reconexão incluídos), nunca do cliente
+        settled = state.wait_settled(args.timeout)
+        expected = expected_tickets(events, config, client.OrderSnapshots(), served=list(state.served))
+        all_done = backend.wait_for(expected.keys(), args.timeout) and settled
+        finished = time.perf_counter()
+
+        sse_client.stop()
+        orders_client.stop()
+        ingestion.stop()
+        processor.stop()
+        time.sleep(0.5)  # Deixa as confirmações assíncronas chegarem
+    stop_server(server, state)
+
+    latencies = [
+        (backend.completed[key] - replayer.emitted_at[index]) * 1000
+        for key, index in expected.items() if key in backend.completed
+    ]
+    printed = len(latencies)
+    last_print = max(backend.completed.values()) if backend.completed else finished
+    elapsed = max(last_print - started, 1e-9)
+    return {
+        'events': len(events),
+        'speed': args.speed,
+        'backend': args.backend,
+        'tickets_expected': len(expected),
+        'tickets_printed': printed,
+        'tickets_missing': len(expected) - printed,
+        'duplicates': backend.duplicates,
+        'confirmations': len(state.confirmations),
+        'jobs': backend.jobs,
+        'batch_max_tickets': args.batch,
+        'errors': len(errors),
+        'faults': state.faults,
+        'network': connections.stats(),
+        'completed': all_done,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_tps': round(printed / elapsed, 2),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 1),
+            'p90': round(percentile(latencies, 90), 1),
+            'p99': round(percentile(latencies, 99), 1),
+            'max': round(max(latencies), 1) if latencies else 0.0,
+        },
+    }
+
+
+def print_report(report):
+    """Exibe o relatório do teste de carga"""
+    lat = report['latency_ms']
+    print("=" * 60)
+    print("RELATÓRIO DE CARGA")
+    print("=" * 60)
+    print(f"Eventos reproduzidos : {report['events']} (velocidade {report['speed']}x)")
+    print(f"Tickets              : {report['tickets_printed']}/{report['tickets_expected']} "
+          f"(faltando {report['tickets_missing']}, duplicados {report['duplicates']})")
+    print(f"Confirmações         : {report['confirmations']}  Erros: {report['errors']}")
+    print(f"Jobs no spooler      : {report['jobs']} (lote máx. {report['batch_max_tickets']})")
+    print(f"Tempo                : {report['elapsed_s']}s")
+    print(f"Vazão                : {report['throughput_tps']} tickets/s")
+    print(f"Latência (ms)        : p50 {lat['p50']}  p90 {lat['p90']}  p99 {lat['p99']}  máx {lat['max']}")
+    if report['faults']:
+        print(f"Falhas simuladas     : {report['faults']}")
+        for stream, metric in sorted(report['network']['reconnects'].items()):
+            print(f"Reconexão {stream:<11}: {metric['count']}x até o 1º evento "
+                  f"p50 {metric['p50_ms']}ms  máx {metric['max_ms']}ms")
+
+
+def print_burst_report(reports, job_overhead_ms):
+    """Compara a rajada com e sem agrupamento de jobs"""
+    print("=" * 60)
+    print(f"RAJADA - custo simulado por job: {job_overhead_ms:.0f}ms")
+    print("=" * 60)
+    print(f"{'lote':>5} {'tickets':>9} {'jobs':>6} {'tempo s':>9} {'tickets/s':>10} {'p99 ms':>9}")
+    for batch, report in reports.items():
+        print(f"{batch:>5} {report['tickets_printed']:>4}/{report['tickets_expected']:<4} {report['jobs']:>6} "
+              f"{report['elapsed_s']:>9.2f} {report['throughput_tps']:>10.2f} {report['latency_ms']['p99']:>9.1f}")
+    baseline, batched = list(reports.values())[0], list(reports.values())[-1]
+    if baseline['throughput_tps']:
+        print(f"Ganho de vazão: {batched['throughput_tps'] / baseline['throughput_tps']:.2f}x")
+
+
+def check_thresholds(report, args):
+    """Retorna a lista de violações dos limites de regressão"""
+    failures = []
+    if report['tickets_missing']:
+        failures.append(f"{report['tickets_missing']} tickets não impressos")
+    if report['duplicates']:
+        failures.append(f"{report['duplicates']} tickets duplicados")
+    if args.max_p99_ms is not None and report['latency_ms']['p99'] > args.max_p99_ms:
+        failures.append(f"p99 {report['latency_ms']['p99']}ms > {args.max_p99_ms}ms")
+    if args.min_throughput is not None and report['throughput_tps'] < args.min_throughput:
+        failures.append(f"vazão {report['throughput_tps']} < {args.min_throughput} tickets/s")
+    return failures
+
+# ============================================================================
+# VÁRIAS LOJAS EM UM PROCESSO
+# ============================================================================
+
+def rss_mb():
+    """Memória residente do processo (MB)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_tenants(args):
+    """N lojas (cada uma com seu servidor substituto) atendidas por um único TenantHost
+
+    Mede a memória com a primeira loja já aquecida (custo de um processo por
+    loja) e depois com todas, para o custo marginal de cada loja adicional.
+    """
+    client = load_client()
+    silence = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    baseline = rss_mb()
+    stores = []
+    with silence:
+        host = client.TenantHost(workers=args.workers, persist=False,
+                                 connections=client.ConnectionManager(tenants=args.tenants))
+        host.pool.start()
+        for index in range(args.tenants):
+            pin = f"{1000 + index}"
+            server, state = start_server('127.0.0.1', 0, client.AUTH_ROLE, pin)
+            tenant = client.Tenant(f"loja{index + 1}", f"http://127.0.0.1:{server.server_address[1]}",
+                                   client.AUTH_ROLE, pin, {'printer_backend': 'null', 'rotation_degrees': 0,
+                                                           'printer_name': f"Impressora loja{index + 1}"})
+            events = synthetic_events(args.orders, args.interval, args.manual, args.updates)
+            config = {**client.DEFAULT_CONFIG, **tenant.config}
+            backend = MeasuringBackend(client.NullPrinterBackend())
+            errors = []
+            runtime = host.add(tenant, backend=backend,
+                               on_log=lambda message, level="info", order_id=None, errors=errors:
+                               errors.append(message) if level == 'error' else None)
+            stores.append({
+                'tenant': tenant, 'server': server, 'state': state, 'runtime': runtime, 'backend': backend,
+                'events': events, 'errors': errors,
+                'expected': expected_tickets(events, config, client.OrderSnapshots()),
+            })
+
+        def serve(stores):
+            """Conecta as lojas, reproduz os eventos em paralelo e aguarda as impressões"""
+            for store in stores:
+                store['runtime'].start()
+            deadline = time.time() + 10
+            while time.time() < deadline and not all(
+                    store['state'].subscriber_count('print') and store['state'].subscriber_count('orders')
+                    for store in stores):
+                time.sleep(0.05)
+            replayers = [threading.Thread(target=Replayer(store['state'], store['events'], args.speed).run)
+                         for store in stores]
+            for thread in replayers:
+                thread.start()
+            for thread in replayers:
+                thread.join()
+            return all(store['backend'].wait_for(store['expected'].keys(), args.timeout) for store in stores)
+
+        started = time.perf_counter()
+        completed = serve(stores[:1])
+        single = rss_mb()
+        completed = serve(stores[1:]) and completed
+        elapsed = time.perf_counter() - started
+        total = rss_mb()
+
+        host.stop()
+        time.sleep(0.5)
+    for store in stores:
+        stop_server(store['server'], store['state'])
+
+    rows = []
+    for store in stores:
+        backend = store['backend']
+        printed = sum(1 for key in store['expected'] if key in backend.completed)
+        rows.append({
+            'tenant': store['tenant'].name,
+            'tickets_expected': len(store['expected']),
+            'tickets_printed': printed,
+            'duplicates': backend.duplicates,
+            # Tickets de outra loja impressos aqui (roteamento errado)
+            'foreign': sum(1 for key in backend.completed if key not in store['expected']),
+            'confirmations': len(store['state'].confirmations),
+            'errors': len(store['errors']),
+        })
+    return {
+        'tenants': rows,
+        'completed': completed,
+        'elapsed_s': round(elapsed, 3),
+        'workers': args.workers,
+        'rss_mb': {
+            'baseline': round(baseline, 1),
+            'one_tenant': round(single, 1),
+            'all_tenants': round(total, 1),
+            'per_extra_tenant': round((total - single) / max(len(stores) - 1, 1), 1),
+        },
+    }
+
+
+def print_tenants_report(report):
+    """Exibe o resultado do teste com várias lojas"""
+    print("=" * 60)
+    print(f"VÁRIAS LOJAS - {len(report['tenants'])} lojas, {report['workers']} threads de impressão")
+    print("=" * 60)
+    print(f"{'loja':<8} {'tickets':>9} {'dupl.':>6} {'outras':>7} {'confirm.':>9} {'erros':>6}")
+    for row in report['tenants']:
+        print(f"{row['tenant']:<8} {row['tickets_printed']:>4}/{row['tickets_expected']:<4} {row['duplicates']:>6} "
+              f"{row['foreign']:>7} {row['confirmations']:>9} {row['errors']:>6}")
+    rss = report['rss_mb']
+    print(f"Tempo                : {report['elapsed_s']}s")
+    print(f"Memória (MB)         : 1 loja {rss['one_tenant']} (processo vazio {rss['baseline']}), "
+          f"todas {rss['all_tenants']}, +{rss['per_extra_tenant']} por loja adicional")
+
+# ============================================================================
+# COORDENAÇÃO ENTRE CLIENTES (VÁRIOS PROCESSOS)
+# ============================================================================
+
+class JournalBackend:
+    """Backend dos nós do teste de coordenação: anota cada ticket no diário do processo"""
+
+    name = 'journal'
+
+    def __init__(self, record):
+        self.record = record
+
+    def print_image(self, img, printer_name, job_name):
+        self.record('print', job=job_name)
+
+    def print_raw(self, data, printer_name, job_name):
+        self.record('print', job=job_name)
+
+    def print_image_batch(self, images, printer_name, job_names):
+        for job_name in job_names:
+            self.record('print', job=job_name)
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        for job_name in job_names:
+            self.record('print', job=job_name)
+
+
+def run_coord_node(args):
+    """Um cliente completo (streams, canal, processador, coordenador) em processo próprio"""
+    client = load_client()
+    client.WORKERS_BASE_URL = args.url
+    client.COORD_HEARTBEAT_INTERVAL = args.heartbeat
+    client.COORD_PEER_TIMEOUT = args.peer_timeout
+    journal = open(args.journal, 'a', encoding='utf-8', buffering=1)
+    journal_lock = threading.Lock()
+
+    def record(kind, **fields):
+        with journal_lock:
+            journal.write(json.dumps({'t': time.time(), 'kind': kind, **fields}) + '\n')
+
+    config = {
+        **client.DEFAULT_CONFIG,
+        'printer_backend': 'null',
+        'rotation_degrees': 0,
+        'coordination': True,
+        'coordination_priority': args.priority,
+        'coordination_port': args.coord_port,
+        'coordination_secret': 'harness',
+    }
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+        coordinator = client.create_coordinator(config, client.Tenant.default())
+        processor = client.PrintCommandProcessor(config, lambda *a, **k: None, backend=JournalBackend(record),
+                                                 coordinator=coordinator, connections=client.ConnectionManager())
+        announce = coordinator.on_change
+        coordinator.on_change = lambda leader, node: (record('leader' if leader else 'standby', node=node),
+                                                       announce(leader, node))
+        ingestion = client.IngestionChannel(
+            on_command_callback=processor.enqueue,
+            on_new_order_callback=processor.enqueue_order_auto_print,
+            on_order_update_callback=processor.enqueue_order_addendum,
+        )
+        sse_client = client.PrinterSSEClient(ingestion, lambda s: None, processor.connections)
+        orders_client = client.OrdersSSEClient(ingestion, lambda s: None, processor.connections)
+        processor.start()
+        ingestion.start()
+        sse_client.start()
+        orders_client.start()
+        record('started', node=coordinator.node_id)
+        stopping.wait()
+        sse_client.stop()
+        orders_client.stop()
+        ingestion.stop()
+        processor.stop()
+    record('stopped')
+
+
+def read_journal(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def run_coord(args):
+    """Vários processos-cliente da mesma loja; o líder é derrubado no meio da reprodução"""
+    client = load_client()
+    server, state = start_server('127.0.0.1', 0, client.AUTH_ROLE, client.AUTH_PIN)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(('', 0))
+        coord_port = probe.getsockname()[1]
+
+    events = synthetic_events(args.orders, args.interval, args.manual, args.updates)
+    expected = expected_tickets(events, {**client.DEFAULT_CONFIG}, client.OrderSnapshots())
+    workdir = os.path.abspath(args.workdir or f"coord-{os.getpid()}")
+    os.makedirs(workdir, exist_ok=True)
+    journals = [os.path.join(workdir, f"node{index}.jsonl") for index in range(args.nodes)]
+    for path in journals:
+        if os.path.exists(path):
+            os.remove(path)
+    nodes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'coord-node', '--url', url,
+                          '--journal', path, '--priority', str(100 + index), '--coord-port', str(coord_port),
+                          '--heartbeat', str(args.heartbeat), '--peer-timeout', str(args.peer_timeout)],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for index, path in enumerate(journals)
+    ]
+
+    def leader_index():
+        """Nó que se declarou líder por último (entre os vivos)"""
+        latest = None
+        for index, path in enumerate(journals):
+            if nodes[index].poll() is not None:
+                continue
+            for entry in read_journal(path):
+                if entry['kind'] == 'leader' and (latest is None or entry['t'] > latest[0]):
+                    latest = (entry['t'], index)
+        return latest[1] if latest else None
+
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline and not (state.subscriber_count('print') >= args.nodes and
+                                              state.subscriber_count('orders') >= args.nodes and
+                                              leader_index() is not None):
+            time.sleep(0.1)
+        first_leader = leader_index()
+        if first_leader is None:
+            raise RuntimeError("Nenhum líder eleito")
+        log(f"{args.nodes} clientes conectados; líder inicial: nó {first_leader}")
+
+        replayer = Replayer(state, events, args.speed)
+        replay = threading.Thread(target=replayer.run)
+        replay.start()
+        time.sleep(args.fail_after)
+        killed_at = time.time()
+        if args.graceful:
+            nodes[first_leader].terminate()
+        else:
+            nodes[first_leader].kill()
+        nodes[first_leader].wait()
+        log(f"Líder (nó {first_leader}) {'encerrado' if args.graceful else 'derrubado'}; aguardando o reserva")
+        replay.join()
+
+        deadline = time.time() + args.timeout
+        while time.time() < deadline:
+            printed = {entry['job'] for path in journals for entry in read_journal(path) if entry['kind'] == 'print'}
+            keys = {f"{m.group(1)}:{m.group(2)}" for m in map(JOB_NAME_PATTERN.match, printed) if m}
+            if all(key in keys for key in expected):
+                break
+            time.sleep(0.2)
+    finally:
+        for node in nodes:
+            if node.poll() is None:
+                node.terminate()
+        for node in nodes:
+            try:
+                node.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                node.kill()
+        stop_server(server, state)
+
+    counts = {}
+    printers = {}
+    new_leader_at = None
+    for index, path in enumerate(journals):
+        for entry in read_journal(path):
+            if entry['kind'] == 'print':
+                match = JOB_NAME_PATTERN.match(entry['job'])
+                key = f"{match.group(1)}:{match.group(2)}" if match else entry['job']
+                counts[key] = counts.get(key, 0) + 1
+                printers.setdefault(index, 0)
+                printers[index] += 1
+            elif entry['kind'] == 'leader' and index != first_leader and entry['t'] >= killed_at:
+                new_leader_at = entry['t'] if new_leader_at is None else min(new_leader_at, entry['t'])
+    return {
+        'nodes': args.nodes,
+        'graceful': args.graceful,
+        'tickets_expected': len(expected),
+        'tickets_printed': sum(1 for key in expected if key in counts),
+        'duplicates': sum(count - 1 for key, count in counts.items() if not key.endswith(':addendum')),
+        'prints_per_node': printers,
+        'takeover_s': round(new_leader_at - killed_at, 2) if new_leader_at else None,
+        'journals': workdir,
+    }
+
+
+def print_coord_report(report):
+    print("=" * 60)
+    print(f"COORDENAÇÃO - {report['nodes']} clientes, líder "
+          f"{'encerrado normalmente' if report['graceful'] else 'derrubado (SIGKILL)'}")
+    print("=" * 60)
+    print(f"Tickets              : {report['tickets_printed']}/{report['tickets_expected']} "
+          f"(duplicados {report['duplicates']})")
+    print(f"Impressos por nó     : {report['prints_per_node']}")
+    print(f"Troca de líder       : {report['takeover_s']}s após a falha")
+    print(f"Diários              : {report['journals']}")
+
+# ============================================================================
+# ESTRESSE DO CANAL DE INGESTÃO
+# ============================================================================
+
+def run_stress(args):
+    """Produtores concorrentes (streams, polling, manuais) despejando eventos no canal
+
+    Cada comando/pedido é enviado por 'copies' produtores diferentes; o canal
+    deve despachar cada ID exatamente uma vez, sem erros, na ordem de chegada.
+    """
+    client = load_client()
+    dispatched = []
+    latencies = []
+
+    def on_command(command):
+        dispatched.append(command['commandId'])
+        latencies.append(time.perf_counter() - command['submitted'])
+
+    def on_order(order):
+        dispatched.append(order['id'])
+        latencies.append(time.perf_counter() - order['submitted'])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        channel = client.IngestionChannel(on_command, on_order, lambda order, changes: None)
+    # Janela do tamanho do teste: produtores podem se distanciar mais do que
+    # a janela padrão, o que num cenário real não acontece
+    unique = args.producers * args.events
+    channel.commands = client.RecentIds(unique)
+    channel.orders = client.RecentIds(unique)
+
+    sources = ['print-sse', 'polling', 'orders-sse', 'manual']
+    copies = min(args.copies, args.producers)
+
+    def producer(index):
+        source = sources[index % len(sources)]
+        for n in range(args.events):
+            # IDs de 'copies' produtores vizinhos: mesmo evento chegando por vários caminhos
+            for owner in range(index, index - copies, -1):
+                key = f"{owner % args.producers}-{n}"
+                if n % 4 == 3:
+                    channel.submit(source, 'order', {'id': f"order-{key}", 'items': [], 'submitted': time.perf_counter()})
+                else:
+                    channel.submit(source, 'command', {'commandId': f"cmd-{key}", 'submitted': time.perf_counter()})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        channel.start()
+        threads = [threading.Thread(target=producer, args=(i,)) for i in range(args.producers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        produced = time.perf_counter()
+        channel.join()
+        finished = time.perf_counter()
+        channel.stop()
+
+    submitted = args.producers * args.events * copies
+    counts = {}
+    for key in dispatched:
+        counts[key] = counts.get(key, 0) + 1
+    latencies_ms = [value * 1000 for value in latencies]
+    return {
+        'producers': args.producers,
+        'submitted': submitted,
+        'unique': unique,
+        'dispatched': len(dispatched),
+        'repeated': sum(count - 1 for count in counts.values() if count > 1),
+        'missing': unique - len(counts),
+        'stats': channel.stats,
+        'produce_s': round(produced - started, 3),
+        'elapsed_s': round(finished - started, 3),
+        'events_per_s': round(submitted / max(finished - started, 1e-9)),
+        'dispatch_latency_ms': {
+            'p50': round(percentile(latencies_ms, 50), 2),
+            'p99': round(percentile(latencies_ms, 99), 2),
+            'max': round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        },
+    }
+
+
+def print_stress_report(report):
+    lat = report['dispatch_latency_ms']
+    print("=" * 60)
+    print("ESTRESSE DO CANAL DE INGESTÃO")
+    print("=" * 60)
+    print(f"Produtores           : {report['producers']}")
+    print(f"Eventos enviados     : {report['submitted']} ({report['unique']} IDs únicos)")
+    print(f"Despachados          : {report['dispatched']} (repetidos {report['repeated']}, faltando {report['missing']})")
+    for source, counters in sorted(report['stats'].items()):
+        print(f"  {source:<19}: recebidos {counters['received']}, despachados {counters['dispatched']}, "
+              f"duplicados {counters['duplicates']}")
+    print(f"Tempo                : {report['elapsed_s']}s (produção {report['produce_s']}s)")
+    print(f"Vazão                : {report['events_per_s']} eventos/s")
+    print(f"Latência de despacho : p50 {lat['p50']}ms  p99 {lat['p99']}ms  máx {lat['max']}ms")
+
+# ============================================================================
+# PONTO DE ENTRADA
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Harness offline do cliente de impressão")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help="Sobe o servidor substituto do worker")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8787)
+    serve.add_argument('--replay', help="Gravação JSONL a reproduzir após a conexão dos clientes")
+    serve.add_argument('--speed', type=float, default=1.0)
+
+    record = sub.add_parser('record', help="Grava os streams do worker real")
+    record.add_argument('--output', required=True)
+    record.add_argument('--duration', type=float, default=600)
+
+    load = sub.add_parser('load', help="Teste de carga com backend nulo/arquivo")
+    load.add_argument('--replay', help="Gravação JSONL (padrão: pedidos sintéticos)")
+    load.add_argument('--orders', type=int, default=100, help="Pedidos sintéticos")
+    load.add_argument('--interval', type=float, default=1.0, help="Segundos entre pedidos sintéticos (a 1x)")
+    load.add_argument('--manual', type=int, default=0, help="Comandos manuais sintéticos")
+    load.add_argument('--updates', type=int, default=0, help="Pedidos sintéticos com itens acrescentados (orders:update)")
+    load.add_argument('--speed', type=float, default=10.0)
+    load.add_argument('--backend', choices=['null', 'file'], default='null')
+    load.add_argument('--output-dir', default='')
+    load.add_argument('--rotation', type=int, default=0)
+    load.add_argument('--port', type=int, default=0)
+    load.add_argument('--timeout', type=float, default=120)
+    load.add_argument('--max-p99-ms', type=float)
+    load.add_argument('--min-throughput', type=float)
+    load.add_argument('--batch', type=int, default=8, help="Tickets por job no spooler (1 = sem agrupamento)")
+    load.add_argument('--batch-wait-ms', type=float, default=0, help="Espera extra para completar o lote")
+    load.add_argument('--job-overhead-ms', type=float, default=0, help="Custo fixo simulado por job")
+    load.add_argument('--drop-every', type=float, default=0, help="Derruba os streams a cada N segundos")
+    load.add_argument('--stall-every', type=float, default=0, help="Trava os streams (sem heartbeat) a cada N segundos")
+    load.add_argument('--stall-seconds', type=float, default=3.0, help="Duração de cada travamento")
+    load.add_argument('--stale-after', type=float, default=1.5,
+                      help="Segundos sem dados até abrir o stream reserva (com falhas simuladas)")
+    load.add_argument('--min-retry', type=float, default=0.1,
+                      help="Espera mínima antes de reconectar (com falhas simuladas)")
+    load.add_argument('--healthy-after', type=float, default=1.0,
+                      help="Segundos no ar até a conexão zerar o backoff (com falhas simuladas)")
+    load.add_argument('--json-out', help="Salva o relatório em JSON")
+    load.add_argument('--verbose', action='store_true', help="Mostra os logs do cliente")
+
+    stress = sub.add_parser('stress', help="Produtores concorrentes no canal de ingestão")
+    stress.add_argument('--producers', type=int, default=8)
+    stress.add_argument('--events', type=int, default=20000, help="Eventos por produtor")
+    stress.add_argument('--copies', type=int, default=2, help="Produtores que enviam o mesmo evento")
+
+    tenants = sub.add_parser('tenants', help="Várias lojas atendidas por um único processo")
+    tenants.add_argument('--tenants', type=int, default=4)
+    tenants.add_argument('--orders', type=int, default=30, help="Pedidos sintéticos por loja")
+    tenants.add_argument('--interval', type=float, default=1.0)
+    tenants.add_argument('--manual', type=int, default=2)
+    tenants.add_argument('--updates', type=int, default=2)
+    tenants.add_argument('--speed', type=float, default=10.0)
+    tenants.add_argument('--workers', type=int, default=2, help="Threads de impressão compartilhadas")
+    tenants.add_argument('--timeout', type=float, default=120)
+    tenants.add_argument('--verbose', action='store_true', help="Mostra os logs do cliente")
+
+    coord = sub.add_parser('coord', help="Vários processos-cliente da mesma loja com falha do líder")
+    coord.add_argument('--nodes', type=int, default=2)
+    coord.add_argument('--orders', type=int, default=40)
+    coord.add_argument('--interval', type=float, default=1.0)
+    coord.add_argument('--manual', type=int, default=3)
+    coord.add_argument('--updates', type=int, default=3)
+    coord.add_argument('--speed', type=float, default=4.0)
+    coord.add_argument('--fail-after', type=float, default=4.0, help="Segundos de reprodução até derrubar o líder")
+    coord.add_argument('--graceful', action='store_true', help="Encerra o líder com SIGTERM em vez de SIGKILL")
+    coord.add_argument('--heartbeat', type=float, default=1.0)
+    coord.add_argument('--peer-timeout', type=float, default=3.5)
+    coord.add_argument('--timeout', type=float, default=60)
+    coord.add_argument('--workdir', help="Pasta dos diários dos nós (padrão: ./coord-<pid>)")
+
+    node = sub.add_parser('coord-node', help=argparse.SUPPRESS)
+    node.add_argument('--url', required=True)
+    node.add_argument('--journal', required=True)
+    node.add_argument('--priority', type=int, default=100)
+    node.add_argument('--coord-port', type=int, required=True)
+    node.add_argument('--heartbeat', type=float, default=1.0)
+    node.add_argument('--peer-timeout', type=float, default=3.5)
+    node.add_argument('--verbose', action='store_true')
+
+    burst = sub.add_parser('burst', help="Rajada de pedidos com e sem agrupamento de jobs")
+    burst.add_argument('--orders', type=int, default=50)
+    burst.add_argument('--batch', type=int, default=8)
+    burst.add_argument('--job-overhead-ms', type=float, default=150,
+                       help="Custo fixo simulado por job (OpenPrinter/CreateDC/StartDoc/EndDoc)")
+    burst.add_argument('--backend', choices=['null', 'file'], default='null')
+    burst.add_argument('--rotation', type=int, default=0)
+    burst.add_argument('--timeout', type=float, default=300)
+    burst.add_argument('--verbose', action='store_true', help="Mostra os logs do cliente")
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        client = load_client()
+        server, state = start_server(args.host, args.port, client.AUTH_ROLE, client.AUTH_PIN)
+        log(f"Servidor substituto em http://{args.host}:{server.server_address[1]} (Ctrl+C para parar)")
+        try:
+            if args.replay:
+                events = normalize_events(load_recording(args.replay))
+                log("Aguardando clientes conectarem aos dois streams...")
+                while not (state.subscriber_count('print') and state.subscriber_count('orders')):
+                    time.sleep(0.2)
+                Replayer(state, events, args.speed).run()
+                log(f"Reprodução concluída ({len(events)} eventos)")
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop_server(server, state)
+
+    elif args.command == 'record':
+        record_streams(load_client(), args.output, args.duration)
+
+    elif args.command == 'load':
+        report = run_load(args)
+        print_report(report)
+        if args.json_out:
+            with open(args.json_out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        failures = check_thresholds(report, args)
+        if failures:
+            print(f"❌ REGRESSÃO: {'; '.join(failures)}")
+            sys.exit(1)
+        print("✅ Dentro dos limites")
+
+    elif args.command == 'stress':
+        report = run_stress(args)
+        print_stress_report(report)
+        if report['repeated'] or report['missing']:
+            print("❌ Deduplicação falhou")
+            sys.exit(1)
+        print("✅ Cada evento despachado exatamente uma vez")
+
+    elif args.command == 'tenants':
+        report = run_tenants(args)
+        print_tenants_report(report)
+        if not report['completed'] or any(row['duplicates'] or row['foreign'] or
+                                          row['tickets_printed'] < row['tickets_expected']
+                                          for row in report['tenants']):
+            print("❌ Lojas com tickets faltando, duplicados ou trocados")
+            sys.exit(1)
+        print("✅ Cada loja imprimiu exatamente os seus tickets")
+
+    elif args.command == 'coord':
+        report = run_coord(args)
+        print_coord_report(report)
+        if report['tickets_printed'] < report['tickets_expected'] or report['takeover_s'] is None:
+            print("❌ Tickets perdidos ou reserva não assumiu")
+            sys.exit(1)
+        print("✅ Um único cliente imprimiu por vez e o reserva assumiu")
+
+    elif args.command == 'coord-node':
+        run_coord_node(args)
+
+    elif args.command == 'burst':
+        reports = {}
+        for batch in (1, args.batch):
+            log(f"Rajada de {args.orders} pedidos com lote máximo {batch}...")
+            reports[batch] = run_load(argparse.Namespace(
+                replay=None, orders=args.orders, interval=0, manual=0, updates=0, speed=1.0,
+                backend=args.backend, output_dir='', rotation=args.rotation, port=0,
+                timeout=args.timeout, batch=batch, batch_wait_ms=0,
+                job_overhead_ms=args.job_overhead_ms, verbose=args.verbose,
+                drop_every=0, stall_every=0, stall_seconds=0, stale_after=0, min_retry=0, healthy_after=0,
+            ))
+        print_burst_report(reports, args.job_overhead_ms)
+        if any(report['tickets_missing'] or report['duplicates'] for report in reports.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,7 @@ Edienai Lanches - Cliente de Impressão em Tempo Real (SSE)
 Versão simplificada e otimizada com Server-Sent Events nativo
 """
 
-import customtkinter as ctk
-import tkinter as tk
-from tkinter import messagebox, scrolledtext
+import argparse
 import threading
 import time
 from datetime import datetime, timezone
@@ -13,17 +11,47 @@ import os
 import sys
 import json
 import queue
+import re
+import hashlib
+import hmac
+import signal
+import random
+import socket
+import ssl
+import struct
+import tempfile
+import unicodedata
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from itertools import accumulate, chain, islice
 import requests
-import win32print
-import win32ui
-import win32con
+import urllib3
+from requests.adapters import HTTPAdapter
 from PIL import Image, ImageFont, ImageDraw, ImageWin
 
+# Interface gráfica e spooler do Windows são opcionais: sem eles o cliente
+# ainda pode ser importado (harness de testes, backends 'null' e 'file')
+try:
+    import customtkinter as ctk
+    import tkinter as tk
+    from tkinter import messagebox, scrolledtext
+except ImportError:
+    ctk = tk = messagebox = scrolledtext = None
+
+try:
+    import win32print
+    import win32ui
+    import win32con
+except ImportError:
+    win32print = win32ui = win32con = None
+
 # ============================================================================
 # CONFIGURAÇÕES DO BACKEND
 # ============================================================================
 
-WORKERS_BASE_URL = 'https://edienai-lanches-worker.mackenziederick13.workers.dev'
+WORKERS_BASE_URL = os.getenv('EDIENAI_WORKERS_URL', 'https://edienai-lanches-worker.mackenziederick13.workers.dev')
 AUTH_ROLE = 'owner'
 AUTH_PIN = '3007'
 
@@ -37,9 +65,31 @@ DEFAULT_CONFIG = {
     'text_size': 'extra',
     'rotation_degrees': 90,
     'line_spacing_px': 8,
-    'force_bitmap': True,
+    'force_bitmap': True,         # True: bitmap via driver (GDI); False: ESC/POS direto (RAW)
     'auto_print_client': True,
     'auto_print_kitchen': True,
+    'auto_print_addendum': True,  # Itens acrescentados/alterados (orders:update) vão para a cozinha
+    'batch_max_tickets': 8,       # Tickets em espera agrupados em um único job (1 = sem agrupamento)
+    'batch_max_wait_ms': 0,       # Espera extra por tickets para completar o lote (0 = só os já na fila)
+    'gdi_page_cut': False,        # Bitmap/GDI: driver corta a cada página (lote vira um só documento)
+    'printer_backend': 'win32',   # 'win32', 'network' (host:porta RAW), 'file' ou 'null'
+    'output_dir': '',             # Pasta do backend 'file' (padrão: APPDATA_DIR/tickets)
+    'font_path': '',              # Fonte TTF explícita (padrão: busca automática)
+    'template_path': '',          # Template de recibo personalizado (padrão: embutido)
+    'logo_path': '',              # Logo (imagem) usado pela diretiva 'logo' dos templates
+    'header_graphics': 'nv',      # Modo ESC/POS: gráficos estáticos em 'nv', 'download' ou 'off'
+    'native_codes': True,         # Modo ESC/POS: QR e código de barras gerados pela impressora
+    'tracking_url': '',           # Link de acompanhamento no QR do cliente ({order_id} é substituído)
+    'pix_key': '',                # Chave PIX para o QR de pagamento (pedidos pagos com Pix)
+    'pix_merchant_name': '',      # Nome do recebedor no payload PIX
+    'pix_merchant_city': '',      # Cidade do recebedor no payload PIX
+    'archive_enabled': True,      # Guarda os tickets impressos (reimpressão sem renderizar, auditoria)
+    'archive_retention_days': 30, # Dias mantidos no arquivo de tickets (0 = sem limite)
+    'coordination': False,        # Vários PCs na mesma loja: só o líder eleito imprime (requer reiniciar)
+    'coordination_station': '',   # Separa grupos de PCs da mesma loja (ex.: 'balcao', 'cozinha')
+    'coordination_priority': 100, # Menor valor é preferido na eleição do líder
+    'coordination_port': 47999,   # Porta UDP dos heartbeats (multicast na rede local)
+    'coordination_secret': '',    # Segredo da loja (igual em todos os PCs), somado ao PIN na chave dos heartbeats
 }
 
 # Mapeamento de larguras de papel
@@ -65,26 +115,1407 @@ APPDATA_DIR = os.path.join(os.getenv('APPDATA') or os.path.expanduser('~'), 'Edi
 os.makedirs(APPDATA_DIR, exist_ok=True)
 CONFIG_FILE = os.path.join(APPDATA_DIR, 'config.json')
 
-def load_config():
-    """Carrega configurações do arquivo"""
+class ConfigError(ValueError):
+    """Arquivo de configuração ilegível (gravação externa incompleta, JSON inválido)"""
+
+
+def load_config(path=CONFIG_FILE, strict=False):
+    """Carrega configurações do arquivo
+
+    Com strict=True um arquivo existente mas ilegível gera ConfigError em vez
+    de voltar aos padrões (a recarga a quente mantém a versão atual).
+    """
     try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return {**DEFAULT_CONFIG, **json.load(f)}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"esperado um objeto JSON, encontrado {type(data).__name__}")
+            return {**DEFAULT_CONFIG, **data}
     except Exception as e:
+        if strict:
+            raise ConfigError(f"{path}: {e}") from e
         print(f"Erro ao carregar config: {e}")
     return DEFAULT_CONFIG.copy()
 
-def save_config(config):
-    """Salva configurações no arquivo"""
+def write_json_atomic(path, data):
+    """Grava JSON de forma atômica (arquivo temporário + fsync + rename)
+
+    Levanta a exceção original se não for possível gravar; o arquivo anterior
+    fica intacto e o temporário é removido.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_config(config, path=CONFIG_FILE):
+    """Salva configurações no arquivo de forma atômica (arquivo temporário + rename)"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        write_json_atomic(path, dict(config))
         return True
     except Exception as e:
         print(f"Erro ao salvar config: {e}")
         return False
 
+
+class ConfigSnapshot(Mapping):
+    """Visão imutável e versionada da configuração
+
+    Cada comando é processado contra um snapshot consistente; sobrescritas
+    por comando (printerConfig) geram um snapshot derivado que nunca é salvo.
+    """
+
+    def __init__(self, data, version, base_version=None):
+        self._data = dict(data)
+        self.version = version
+        self.base_version = version if base_version is None else base_version
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"ConfigSnapshot(v{self.version}, {self._data!r})"
+
+    def with_overrides(self, overrides):
+        """Snapshot derivado com sobrescritas aplicadas (não afeta a config global)"""
+        if not overrides:
+            return self
+        key = json.dumps(overrides, sort_keys=True, default=str)
+        return ConfigSnapshot({**self._data, **overrides}, (self.version, key), self.version)
+
+
+class ConfigStore:
+    """Configuração atual com troca atômica de snapshots e recarga a quente
+
+    Leitores obtêm 'current' sem bloqueio; atualizações criam uma nova versão,
+    gravam o arquivo atomicamente e só então publicam o novo snapshot.
+    Edições externas do config.json são recarregadas por uma thread em
+    segundo plano (start_watching); 'current' só devolve o snapshot publicado.
+    'overrides' (chaves fixadas no tenants.json) prevalecem sobre o arquivo
+    em toda versão, mas não são gravadas nele.
+    """
+
+    RELOAD_CHECK_INTERVAL = 2  # Segundos entre verificações do arquivo
+
+    def __init__(self, initial=None, path=CONFIG_FILE, overrides=None):
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.lock = threading.Lock()
+        self.listeners = []
+        self._mtime = self._file_mtime()
+        self._watch_stop = threading.Event()
+        self._watcher = None
+        data = initial if initial is not None else load_config(path)
+        self._saved = {**DEFAULT_CONFIG, **data}   # Configuração do arquivo, sem as sobrescritas
+        self._current = ConfigSnapshot({**self._saved, **self.overrides}, 1)
+
+    @classmethod
+    def in_memory(cls, config):
+        """Store sem arquivo (harness, benchmarks, testes)"""
+        return cls(initial=dict(config), path=None)
+
+    @property
+    def current(self):
+        """Snapshot atual da configuração"""
+        return self._current
+
+    def start_watching(self):
+        """Verifica o arquivo a cada RELOAD_CHECK_INTERVAL em uma thread própria (sem arquivo, nada)"""
+        if not self.path or self._watcher is not None:
+            return
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name='config-watch', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._watch_stop.set()
+            watcher.join(timeout=5)
+
+    def _watch(self):
+        while not self._watch_stop.wait(self.RELOAD_CHECK_INTERVAL):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"[CONFIG] Erro ao verificar o arquivo: {e}")
+
+    def add_listener(self, callback):
+        """Registra callback(snapshot) chamado a cada nova versão (na thread que atualizou)"""
+        self.listeners.append(callback)
+
+    def update(self, changes):
+        """Aplica alterações, salva atomicamente e publica nova versão
+
+        Retorna False (mantendo a versão atual) se não for possível salvar.
+        """
+        with self.lock:
+            current = self._current
+            saved = {**self._saved, **changes}
+            snapshot = ConfigSnapshot({**saved, **self.overrides}, current.version + 1)
+            if self.path:
+                if not save_config(saved, self.path):
+                    return False
+                self._mtime = self._file_mtime()
+            self._saved = saved
+            self._current = snapshot
+        self._notify(snapshot)
+        return True
+
+    def reload_if_changed(self):
+        """Recarrega o arquivo se ele foi alterado fora do cliente"""
+        with self.lock:
+            mtime = self._file_mtime()
+            if mtime is None or mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            current = self._current
+            try:
+                data = load_config(self.path, strict=True)
+            except ConfigError as e:
+                # Edição pela metade ou JSON inválido: segue com a versão atual até
+                # a próxima alteração do arquivo
+                print(f"[CONFIG] ⚠️ Arquivo inválido, mantendo a versão {current.version}: {e}")
+                return False
+            self._saved = data
+            snapshot = ConfigSnapshot({**data, **self.overrides}, current.version + 1)
+            if dict(snapshot) == dict(current):
+                return False
+            self._current = snapshot
+        print(f"[CONFIG] 🔄 Configuração recarregada do arquivo (versão {snapshot.version})")
+        self._notify(snapshot)
+        return True
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def _notify(self, snapshot):
+        for callback in self.listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"[CONFIG] Erro no listener: {e}")
+
+# ============================================================================
+# FONTES
+# ============================================================================
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fontes com bom suporte a acentos, em ordem de preferência
+FONT_CANDIDATES = [
+    "C:\\Windows\\Fonts\\seguisb.ttf",  # Segoe UI Bold (melhor para acentos)
+    "C:\\Windows\\Fonts\\segoeui.ttf",  # Segoe UI
+    "C:\\Windows\\Fonts\\arialuni.ttf", # Arial Unicode MS
+    "C:\\Windows\\Fonts\\arial.ttf",    # Arial (fallback)
+    os.path.join(SCRIPT_DIR, 'fonts', 'DejaVuSans-Bold.ttf'),  # Cópia opcional ao lado do cliente (não versionada)
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",  # Linux
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+]
+
+# Cache de fontes carregadas: (caminho, tamanho do texto) -> dict de fontes
+_font_cache = {}
+_font_cache_lock = threading.Lock()
+
+def resolve_font_path(config):
+    """Resolve a fonte do recibo: config 'font_path', variável EDIENAI_FONT ou busca automática"""
+    explicit = config.get('font_path') or os.getenv('EDIENAI_FONT')
+    if explicit:
+        if os.path.exists(explicit):
+            return explicit
+        print(f"[FONT] ⚠️ Fonte configurada não encontrada: {explicit} - usando busca automática")
+    for path in FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_receipt_fonts(font_path, text_size):
+    """Carrega (uma única vez) as fontes do recibo para um tamanho de texto"""
+    key = (font_path, text_size)
+    with _font_cache_lock:
+        fonts = _font_cache.get(key)
+        if fonts is not None:
+            return fonts
+
+    font_sizes = FONT_SIZES[text_size]
+    if font_path:
+        fonts = {name: ImageFont.truetype(font_path, size, encoding='unic') for name, size in font_sizes.items()}
+    else:
+        # Fallback final (sem fontes no sistema): fonte embutida do Pillow
+        print("[FONT] ⚠️ Nenhuma fonte TTF encontrada - usando fonte embutida do Pillow")
+        fonts = {name: ImageFont.load_default(size) for name, size in font_sizes.items()}
+
+    with _font_cache_lock:
+        return _font_cache.setdefault(key, fonts)
+
+# ============================================================================
+# LAYOUT DE TEXTO (QUEBRA DE LINHAS)
+# ============================================================================
+
+class TextLayoutEngine:
+    """Quebra textos na largura do papel usando larguras de caractere em cache
+
+    A largura de cada caractere é medida uma única vez por fonte; a quebra
+    usa busca binária sobre as larguras acumuladas (prefixos) da linha, e
+    cada linha final é medida uma única vez com a fonte real (kerning).
+    Os caches são compartilhados pelas threads de impressão (lock); o de
+    áreas desenhadas é por texto e por isso limitado (LRU).
+    """
+
+    # Texto de referência para altura de linha (acentos e descendentes)
+    LINE_HEIGHT_SAMPLE = 'ÁÇÉgjpqy'
+    INK_BOX_CACHE_SIZE = 1024   # Linhas distintas lembradas (nomes de itens se repetem)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.advances = {}                # fonte -> {caractere: largura}
+        self.line_heights = OrderedDict() # (fonte, texto) -> (topo, altura) da área desenhada
+
+    def char_widths(self, font, text):
+        """Larguras de cada caractere do texto (com cache por fonte)"""
+        with self.lock:
+            table = self.advances.setdefault(font, {})
+            widths = [table.get(char) for char in text]
+        missing = {}
+        for index, char in enumerate(text):
+            if widths[index] is None:
+                width = missing.get(char)
+                if width is None:
+                    # Acentos combinantes não ocupam espaço próprio
+                    width = missing[char] = 0.0 if unicodedata.combining(char) else font.getlength(char)
+                widths[index] = width
+        if missing:
+            with self.lock:
+                table.update(missing)
+        return widths
+
+    def text_width(self, font, text):
+        """Largura aproximada do texto (soma das larguras em cache)"""
+        return sum(self.char_widths(font, text))
+
+    def line_height(self, font, sample=None):
+        """Altura de linha da fonte (medida uma vez)"""
+        return self.ink_box(font, sample or self.LINE_HEIGHT_SAMPLE)[1]
+
+    def ink_box(self, font, text):
+        """(topo, altura) da área desenhada do texto, medidos uma vez por fonte/texto"""
+        key = (font, text)
+        with self.lock:
+            box = self.line_heights.get(key)
+            if box is not None:
+                self.line_heights.move_to_end(key)
+                return box
+        bbox = font.getbbox(text)
+        box = (bbox[1], bbox[3] - bbox[1])
+        with self.lock:
+            self.line_heights[key] = box
+            if len(self.line_heights) > self.INK_BOX_CACHE_SIZE:
+                self.line_heights.popitem(last=False)
+        return box
+
+    def fit(self, text, font, max_width):
+        """Trunca o texto (sem quebrar) para caber na largura - usado em separadores"""
+        text = unicodedata.normalize('NFC', text)
+        prefix = [0.0, *accumulate(self.char_widths(font, text))]
+        end = bisect_right(prefix, max_width) - 1
+        line = text[:max(end, 0)]
+        return line, font.getlength(line)
+
+    def wrap(self, text, font, max_width, hang=0):
+        """Quebra o texto em linhas que cabem em max_width
+
+        Retorna uma lista de (deslocamento x, linha, largura). As linhas de
+        continuação recebem recuo 'hang' (recuo pendente, ex.: complementos).
+        """
+        text = unicodedata.normalize('NFC', text)
+        if not text:
+            return [(0, '', 0)]
+
+        prefix = [0.0, *accumulate(self.char_widths(font, text))]
+        size = len(text)
+        lines = []
+        start = 0
+        offset = 0
+
+        while start < size:
+            available = max_width - offset
+            # Maior prefixo que cabe na largura disponível (busca binária)
+            end = bisect_right(prefix, prefix[start] + available, lo=start + 1) - 1
+            if end >= size:
+                end = size
+            else:
+                if end <= start:
+                    end = start + 1  # Caractere mais largo que a linha
+                else:
+                    space = text.rfind(' ', start + 1, end + 1)
+                    if space > start:
+                        end = space
+
+            line = text[start:end].rstrip()
+            width = font.getlength(line)
+            # Correção rara: kerning real excedeu a soma das larguras em cache
+            while width > available and len(line) > 1:
+                space = line.rfind(' ')
+                end = start + (space if space > 0 else len(line) - 1)
+                line = text[start:end].rstrip()
+                width = font.getlength(line)
+
+            lines.append((offset, line, width))
+            start = end
+            # Linhas de continuação não começam com espaços
+            while start < size and text[start] == ' ':
+                start += 1
+            offset = hang
+        return lines
+
+
+# Instância compartilhada (caches por fonte valem para todos os tickets)
+text_layout = TextLayoutEngine()
+
+# ============================================================================
+# TEMPLATES DE RECIBO
+# ============================================================================
+#
+# Formato (uma diretiva por linha, indentação livre, '#' inicia comentário):
+#
+#   <alinhamento> <fonte> [hang="<prefixo>"] | <texto com {campos}>
+#   rule                                  separador horizontal
+#   logo                                  imagem de 'logo_path' (se configurada)
+#   qr <texto com {campos}>               QR code (vazio = omitido)
+#   barcode <texto com {campos}>          código de barras CODE128 (vazio = omitido)
+#   if <cond> / else / end                condicional
+#   for <var> in <campo> / end            repetição
+#   static <chave> / end                  bloco fixo (sem campos): no modo ESC/POS
+#                                         é gravado uma vez na memória da impressora
+#                                         e referenciado pela chave em cada ticket
+#
+# Alinhamentos: left, center, right. Fontes: chaves de FONT_SIZES.
+# Condições: campo, not campo, campo == 'valor', campo != 'valor'.
+# Campos: {caminho.com.pontos} ou {campo|filtro} (filtros: money, date).
+# Valores ausentes (None) viram texto vazio.
+
+DEFAULT_RECEIPT_TEMPLATE = """
+static header
+    logo
+    center title | Edienai Lanches
+    rule
+end
+if addendum
+    center bold | --- ADICIONAL PARA COZINHA ---
+else
+    if kitchen
+        center bold | --- PEDIDO PARA COZINHA ---
+    else
+        center bold | --- COMPROVANTE DE PEDIDO ---
+    end
+end
+rule
+left normal | Pedido #: {order_id}
+left normal | Cliente: {customer_name}
+left normal | Tipo: {delivery_type}
+if delivery_type == 'No Local'
+    left normal | Mesa: {table}
+end
+if delivery_type == 'Entrega'
+    left normal | Endereço: {address}
+end
+if sent_at
+    left normal | Data: {sent_at|date}
+end
+rule
+if addendum
+    left header | ALTERAÇÕES:
+    for change in changes
+        left bold | {change.action}: {change.quantity}x {change.name}
+        for comp in change.complements
+            left normal hang="  - " |   - {comp.name}
+        end
+        if change.notes
+            left normal hang="  OBS: " |   OBS: {change.notes}
+        end
+    end
+else
+    left header | ITENS:
+    for item in items
+        left bold | {item.quantity}x {item.name}
+        for comp in item.complements
+            left normal hang="  - " |   - {comp.name}
+        end
+        if item.notes
+            left normal hang="  OBS: " |   OBS: {item.notes}
+        end
+        if not kitchen
+            right normal | Subtotal: {item.price|money}
+        end
+    end
+end
+rule
+if not kitchen
+    right total | TOTAL: {total|money}
+    left normal | Pagamento: {payment_method}
+    if troco_para
+        left normal | Troco para: {troco_para|money}
+        left normal | Troco: {troco|money}
+    end
+    if pix_payload
+        center normal | Pague com PIX:
+        qr {pix_payload}
+    end
+    if tracking_url
+        center normal | Acompanhe seu pedido:
+        qr {tracking_url}
+    end
+    barcode {order_id}
+end
+if kitchen
+    static footer_kitchen
+        rule
+        center normal | Bom trabalho!
+    end
+else
+    static footer_client
+        rule
+        center normal | Obrigado pelo seu pedido!
+    end
+end
+"""
+
+RULE_TEXT = '-' * 32
+
+
+class TemplateError(ValueError):
+    """Erro de sintaxe em template de recibo"""
+
+
+def format_money(value):
+    """Formata valor em reais: R$ 12,50"""
+    return f"R$ {float(value):.2f}".replace('.', ',')
+
+
+def format_date(value):
+    """Formata data/hora do pedido"""
+    return value.strftime('%d/%m/%Y %H:%M')
+
+
+TEMPLATE_FILTERS = {
+    'money': format_money,
+    'date': format_date,
+}
+
+_TEMPLATE_FIELD = re.compile(r'\{([\w.]+)(?:\|(\w+))?\}')
+_TEMPLATE_COND = re.compile(r"^(not\s+)?([\w.]+)(?:\s*(==|!=)\s*'([^']*)')?$")
+_TEMPLATE_FOR = re.compile(r'^for\s+(\w+)\s+in\s+([\w.]+)$')
+_TEMPLATE_STATIC = re.compile(r'^static\s+(\w+)$')
+_TEMPLATE_CODE = re.compile(r'^(qr|barcode)\s+(.+)$')
+_TEMPLATE_LINE = re.compile(r'^(left|center|right)\s+(\w+)(?:\s+hang="([^"]*)")?\s*\|(.*)$')
+
+
+def _template_get(value, key):
+    """Acesso a campo tolerante a None (caminhos com pontos)"""
+    return None if value is None else value.get(key)
+
+
+def _template_str(value):
+    """Converte valor de campo em texto (None vira vazio)"""
+    return '' if value is None else str(value)
+
+
+class CompiledTemplate:
+    """Template compilado em uma função Python que emite as operações de layout
+
+    O texto do template é analisado uma única vez; a árvore resultante é
+    transformada em código Python (literais via repr, campos validados por
+    regex) e compilada. Cada execução apenas percorre o pedido e acrescenta
+    entradas (alinhamento, texto, fonte, prefixo do recuo) à lista de saída.
+    """
+
+    def __init__(self, source, version):
+        self.version = version
+        self.static_blocks = {}   # chave -> linhas fixas do bloco 'static'
+        tree = self._parse(source)
+        self.code = self._generate(tree)
+        namespace = {
+            '_get': _template_get,
+            '_str': _template_str,
+            **{f"_filter_{name}": func for name, func in TEMPLATE_FILTERS.items()},
+        }
+        exec(compile(self.code, f"<template {version}>", 'exec'), namespace)
+        self._render = namespace['render']
+
+    def render(self, scope):
+        """Executa o template contra um pedido e retorna as linhas do recibo
+
+        Blocos 'static' aparecem como uma única entrada ('static', chave, '', '');
+        QR e códigos de barras como ('qr' | 'barcode', conteúdo, '', '').
+        """
+        return self._render(scope)
+
+    def expand_static(self, lines):
+        """Substitui as referências a blocos 'static' pelas suas linhas"""
+        expanded = []
+        for entry in lines:
+            if entry[0] == 'static':
+                expanded.extend(self.static_blocks[entry[1]])
+            else:
+                expanded.append(entry)
+        return expanded
+
+    # --- Análise -----------------------------------------------------------
+
+    def _parse(self, source):
+        """Converte o texto em árvore de nós: ('line'|'rule'|'code'|'if'|'for', ...)"""
+        root = []
+        stack = [('root', root, None)]
+        for line_no, raw in enumerate(source.splitlines(), 1):
+            line = raw.strip()
+            if not line or line.startswith('#'):
+                continue
+            kind, nodes, data = stack[-1]
+
+            if kind == 'static' and line != 'end' and (
+                    line.startswith(('if ', 'for ', 'static ', 'qr ', 'barcode ')) or line == 'else' or _TEMPLATE_FIELD.search(line)):
+                raise TemplateError(f"Linha {line_no}: bloco 'static' aceita apenas linhas fixas, 'rule' e 'logo'")
+
+            if line == 'end':
+                if kind == 'root':
+                    raise TemplateError(f"Linha {line_no}: 'end' sem bloco aberto")
+                stack.pop()
+                if kind == 'static':
+                    self.static_blocks[data[1]] = [self._static_entry(node) for node in data[2]]
+            elif line == 'else':
+                if kind != 'if' or data[3] is not None:
+                    raise TemplateError(f"Linha {line_no}: 'else' fora de 'if'")
+                data[3] = []
+                stack[-1] = (kind, data[3], data)
+            elif line.startswith('if '):
+                match = _TEMPLATE_COND.match(line[3:].strip())
+                if not match:
+                    raise TemplateError(f"Linha {line_no}: condição inválida '{line[3:].strip()}'")
+                node = ['if', match.groups(), [], None]
+                nodes.append(node)
+                stack.append(('if', node[2], node))
+            elif line.startswith('for '):
+                match = _TEMPLATE_FOR.match(line)
+                if not match:
+                    raise TemplateError(f"Linha {line_no}: 'for' inválido '{line}'")
+                node = ['for', match.group(1), match.group(2), []]
+                nodes.append(node)
+                stack.append(('for', node[3], node))
+            elif line.startswith('static '):
+                match = _TEMPLATE_STATIC.match(line)
+                if not match or match.group(1) in self.static_blocks:
+                    raise TemplateError(f"Linha {line_no}: 'static' inválido ou repetido '{line}'")
+                node = ['static', match.group(1), []]
+                nodes.append(node)
+                stack.append(('static', node[2], node))
+            elif line == 'rule':
+                nodes.append(['rule'])
+            elif line == 'logo':
+                nodes.append(['logo'])
+            elif _TEMPLATE_CODE.match(line):
+                kind, text = _TEMPLATE_CODE.match(line).groups()
+                for match in _TEMPLATE_FIELD.finditer(text):
+                    if match.group(2) and match.group(2) not in TEMPLATE_FILTERS:
+                        raise TemplateError(f"Linha {line_no}: filtro desconhecido '{match.group(2)}'")
+                nodes.append(['code', kind, text])
+            else:
+                match = _TEMPLATE_LINE.match(raw.lstrip())
+                if not match:
+                    raise TemplateError(f"Linha {line_no}: diretiva inválida '{line}'")
+                align, font_key, hang, text = match.groups()
+                if font_key not in FONT_SIZES['normal']:
+                    raise TemplateError(f"Linha {line_no}: fonte desconhecida '{font_key}'")
+                # Um espaço após '|' é separador; os demais fazem parte do texto
+                text = text[1:] if text.startswith(' ') else text
+                for match in _TEMPLATE_FIELD.finditer(text):
+                    if match.group(2) and match.group(2) not in TEMPLATE_FILTERS:
+                        raise TemplateError(f"Linha {line_no}: filtro desconhecido '{match.group(2)}'")
+                nodes.append(['line', align, font_key, hang or '', text])
+
+        if len(stack) > 1:
+            raise TemplateError(f"Bloco '{stack[-1][0]}' sem 'end'")
+        return root
+
+    @staticmethod
+    def _static_entry(node):
+        """Linha fixa de um bloco 'static' (sem campos, avaliada na compilação)"""
+        if node[0] == 'rule':
+            return ('rule', RULE_TEXT, 'normal', '')
+        if node[0] == 'logo':
+            return ('logo', '', 'normal', '')
+        _, align, font_key, hang, text = node
+        return (align, text, font_key, hang)
+
+    # --- Geração de código -------------------------------------------------
+
+    def _generate(self, tree):
+        code = ["def render(scope):", "    out = []", "    append = out.append"]
+        self._emit(tree, code, 1, set())
+        code.append("    return out")
+        return '\n'.join(code) + '\n'
+
+    @staticmethod
+    def _path_expr(path, loop_vars):
+        keys = path.split('.')
+        expr = f"v_{keys[0]}" if keys[0] in loop_vars else f"scope.get({keys[0]!r})"
+        for key in keys[1:]:
+            expr = f"_get({expr}, {key!r})"
+        return expr
+
+    def _text_expr(self, text, loop_vars):
+        parts = []
+        pos = 0
+        for match in _TEMPLATE_FIELD.finditer(text):
+            if match.start() > pos:
+                parts.append(repr(text[pos:match.start()]))
+            value = self._path_expr(match.group(1), loop_vars)
+            if match.group(2):
+                parts.append(f"('' if ({value}) is None else _filter_{match.group(2)}({value}))")
+            else:
+                parts.append(f"_str({value})")
+            pos = match.end()
+        if pos < len(text):
+            parts.append(repr(text[pos:]))
+        return ' + '.join(parts) if parts else "''"
+
+    def _emit(self, nodes, code, depth, loop_vars):
+        indent = '    ' * depth
+        if not nodes:
+            code.append(f"{indent}pass")
+        for node in nodes:
+            kind = node[0]
+            if kind == 'rule':
+                code.append(f"{indent}append(('rule', {RULE_TEXT!r}, 'normal', ''))")
+            elif kind == 'logo':
+                code.append(f"{indent}append(('logo', '', 'normal', ''))")
+            elif kind == 'static':
+                code.append(f"{indent}append(('static', {node[1]!r}, '', ''))")
+            elif kind == 'code':
+                code.append(f"{indent}append(({node[1]!r}, {self._text_expr(node[2], loop_vars)}, '', ''))")
+            elif kind == 'line':
+                _, align, font_key, hang, text = node
+                code.append(f"{indent}append(({align!r}, {self._text_expr(text, loop_vars)}, {font_key!r}, {hang!r}))")
+            elif kind == 'if':
+                negate, path, op, literal = node[1]
+                value = self._path_expr(path, loop_vars)
+                if op:
+                    cond = f"_str({value}) {op} {literal!r}"
+                else:
+                    cond = value
+                code.append(f"{indent}if {'not ' if negate else ''}({cond}):")
+                self._emit(node[2], code, depth + 1, loop_vars)
+                if node[3] is not None:
+                    code.append(f"{indent}else:")
+                    self._emit(node[3], code, depth + 1, loop_vars)
+            elif kind == 'for':
+                _, var, path, body = node
+                code.append(f"{indent}for v_{var} in ({self._path_expr(path, loop_vars)} or ()):")
+                self._emit(body, code, depth + 1, loop_vars | {var})
+
+
+# Templates compilados, por versão (hash do conteúdo)
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+# Caminho do template -> (mtime, versão), para evitar reler o arquivo a cada ticket
+_template_files = {}
+
+def compile_template(source):
+    """Compila (uma única vez por versão) o template"""
+    version = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    with _template_cache_lock:
+        template = _template_cache.get(version)
+    if template is None:
+        template = CompiledTemplate(source, version)
+        with _template_cache_lock:
+            template = _template_cache.setdefault(version, template)
+    return template
+
+def load_receipt_template(path=None):
+    """Template do recibo: arquivo configurado (recompilado só se mudar) ou o embutido"""
+    if not path:
+        return compile_template(DEFAULT_RECEIPT_TEMPLATE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        cached = _template_files.get(path)
+        if cached and cached[0] == mtime:
+            return _template_cache[cached[1]]
+        with open(path, 'r', encoding='utf-8') as f:
+            template = compile_template(f.read())
+        _template_files[path] = (mtime, template.version)
+        print(f"[TEMPLATE] Template {path} compilado (versão {template.version})")
+        return template
+    except (OSError, TemplateError) as e:
+        print(f"[TEMPLATE] ⚠️ Erro no template {path}: {e} - usando template embutido")
+        return compile_template(DEFAULT_RECEIPT_TEMPLATE)
+
+def build_order_view(order_data, print_type, config=None):
+    """Normaliza orderData nos campos usados pelos templates"""
+    config = config or {}
+    delivery_option = order_data.get('deliveryOption') or {}
+    sent_at = order_data.get('sentAt')
+    if sent_at:
+        if isinstance(sent_at, str):
+            sent_at = datetime.fromisoformat(sent_at.replace('Z', '+00:00'))
+        else:
+            sent_at = datetime.now()
+
+    items = []
+    for item in order_data.get('items', []):
+        notes = item.get('notes') or item.get('observations')
+        items.append({
+            'id': item.get('id'),
+            # Garante que todos os textos sejam strings UTF-8
+            'name': str(item.get('name', 'Item')),
+            'quantity': item.get('quantity', 1),
+            'price': item.get('totalItemPrice', 0),
+            'complements': [{'name': str(comp.get('name', 'Comp'))} for comp in item.get('complements', [])],
+            'notes': str(notes) if notes else None,
+        })
+
+    order_id = order_data.get('orderId', order_data.get('id', 'N/A'))
+    total = order_data.get('total', 0)
+    troco_para = order_data.get('trocoPara')
+    payment_method = order_data.get('paymentMethod', 'N/A')
+
+    # QR de pagamento: payload enviado pelo backend ou PIX estático da loja
+    pix = order_data.get('pixPayload')
+    if not pix and config.get('pix_key') and 'pix' in str(payment_method).lower():
+        pix = pix_payload(config['pix_key'], config.get('pix_merchant_name', ''),
+                          config.get('pix_merchant_city', ''), total, str(order_id))
+    tracking_url = config.get('tracking_url')
+
+    return {
+        # Adicional (itens acrescentados/alterados) é um ticket de cozinha
+        'kitchen': print_type in ('kitchen', 'addendum'),
+        'addendum': print_type == 'addendum',
+        'print_type': print_type,
+        'order_id': order_id,
+        'customer_name': str(order_data.get('customerName', 'N/A')),
+        'delivery_type': delivery_option.get('type', 'N/A'),
+        'table': delivery_option.get('tableNumber', 'N/A'),
+        'address': delivery_option.get('address', 'N/A'),
+        'sent_at': sent_at,
+        'items': items,
+        'changes': order_data.get('addendum') or [],
+        'total': total,
+        'payment_method': payment_method,
+        'troco_para': troco_para,
+        'troco': max(0, float(troco_para) - float(total)) if troco_para else 0,
+        'pix_payload': pix,
+        'tracking_url': tracking_url.replace('{order_id}', str(order_id)) if tracking_url else None,
+    }
+
+# ============================================================================
+# CONEXÕES
+# ============================================================================
+
+DNS_CACHE_TTL = 300           # Segundos que um endereço resolvido é reutilizado
+# O cache de DNS sobrescreve HTTPConnection._new_conn e troca as classes de pool
+# do PoolManager, que não são API pública do urllib3: só são instalados nas
+# versões validadas (tests/test_streams.py falha se a sobrescrita deixar de ser chamada)
+URLLIB3_SUPPORTED = ('2.',)
+STREAM_CONNECT_TIMEOUT = 5    # Segundos para abrir a conexão de um stream
+STREAM_READ_TIMEOUT = 60      # Segundos sem nenhum byte até desistir do stream
+STREAM_STALE_AFTER = 45       # Segundos sem dados (heartbeat a cada 15 s) para abrir um stream reserva
+STREAM_CHECK_INTERVAL = 1     # Intervalo da verificação dos streams (s)
+STREAM_MIN_RETRY = 0.5        # Espera mínima (s, com jitter até o dobro) antes de reconectar
+STREAM_HEALTHY_AFTER = 30     # Segundos no ar até uma conexão zerar o backoff
+SSE_HEADERS = {
+    'Accept': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+}
+
+
+class DnsCache:
+    """Resoluções DNS reaproveitadas por DNS_CACHE_TTL (reconexões não consultam o DNS)"""
+
+    def __init__(self, ttl=DNS_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}   # (host, porta) -> (expira em, [endereços])
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port):
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+        addresses = []
+        for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host, port):
+        """Esquece o host (todos os endereços falharam)"""
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+
+dns_cache = DnsCache()
+
+
+class _DnsCachedConnectionMixin:
+    """Conexão urllib3 que resolve o host pelo DnsCache em vez de consultar o DNS sempre"""
+
+    stream_socket = None
+
+    def connect(self):
+        super().connect()
+        # Socket final (com TLS, se houver): com 'Connection: close' o http.client
+        # solta self.sock assim que a resposta chega, e EventStream ainda precisa
+        # dele para interromper uma leitura bloqueada
+        self.stream_socket = self.sock
+
+    def _new_conn(self):
+        try:
+            addresses = dns_cache.resolve(self.host, self.port)
+        except socket.gaierror as e:
+            raise urllib3.exceptions.NameResolutionError(self.host, self, e) from e
+        last_error = None
+        for address in addresses:
+            try:
+                return urllib3.util.connection.create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except OSError as e:
+                last_error = e
+        dns_cache.invalidate(self.host, self.port)
+        if isinstance(last_error, TimeoutError):
+            raise urllib3.exceptions.ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from last_error
+        raise urllib3.exceptions.NewConnectionError(
+            self, f"Failed to establish a new connection: {last_error}") from last_error
+
+
+class _CachedHTTPConnection(_DnsCachedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class _CachedHTTPSConnection(_DnsCachedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _CachedHTTPPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _CachedHTTPConnection
+
+
+class _CachedHTTPSPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _CachedHTTPSConnection
+
+
+class _ResumableSSLSocket(ssl.SSLSocket):
+    """Guarda a sessão TLS ao fechar: no TLS 1.3 o ticket chega depois do handshake
+
+    close() é chamado de novo quando o último makefile() da resposta é
+    fechado, então o ticket recebido durante a leitura também é guardado.
+    """
+
+    def close(self):
+        self.context.remember_session(self)
+        super().close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext que retoma a sessão TLS anterior de cada host (handshake abreviado)"""
+
+    sslsocket_class = _ResumableSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.load_default_certs()
+        self.sessions = {}   # host -> ssl.SSLSession
+        self.sessions_lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and server_hostname:
+            with self.sessions_lock:
+                session = self.sessions.get(server_hostname)
+        ssl_sock = super().wrap_socket(sock, server_side, do_handshake_on_connect,
+                                       suppress_ragged_eofs, server_hostname, session)
+        self.handshakes += 1
+        if ssl_sock.session_reused:
+            self.resumed += 1
+        self.remember_session(ssl_sock)
+        return ssl_sock
+
+    def remember_session(self, ssl_sock):
+        try:
+            session = ssl_sock.session   # None depois que o TLS foi encerrado
+        except (OSError, ValueError):
+            session = None
+        if session is not None and ssl_sock.server_hostname:
+            with self.sessions_lock:
+                self.sessions[ssl_sock.server_hostname] = session
+
+
+class _WarmAdapter(HTTPAdapter):
+    """Adapter com pool de conexões mantidas abertas, DNS em cache e retomada de TLS"""
+
+    dns_warning_shown = False
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        if urllib3.__version__.startswith(URLLIB3_SUPPORTED):
+            self.poolmanager.pool_classes_by_scheme = {'http': _CachedHTTPPool, 'https': _CachedHTTPSPool}
+        elif not _WarmAdapter.dns_warning_shown:
+            _WarmAdapter.dns_warning_shown = True
+            print(f"[NET] ⚠️ urllib3 {urllib3.__version__} não validado - cache de DNS desativado")
+
+
+class JitterBackoff:
+    """Espera entre tentativas com 'decorrelated jitter'
+
+    Cada espera é sorteada entre a base e 3x a anterior (limitada pelo teto),
+    de modo que clientes que caíram juntos não reconectam em sincronia.
+    """
+
+    def __init__(self, base=0.5, cap=30):
+        self.base = base
+        self.cap = cap
+        self.current = base
+
+    def next(self):
+        self.current = min(self.cap, random.uniform(self.base, self.current * 3))
+        return self.current
+
+    def reset(self):
+        self.current = self.base
+
+
+class ConnectionManager:
+    """Núcleo de rede compartilhado por streams, polling e confirmações
+
+    Uma única sessão HTTP com pool de conexões quentes, DNS em cache e
+    retomada de sessões TLS; também registra a latência entre a perda de um
+    stream e o primeiro evento recebido depois da reconexão.
+    """
+
+    POOL_SIZE = 8                 # Conexões mantidas por host (mínimo)
+    CONNECTIONS_PER_TENANT = 4    # Dois streams sempre abertos + polling e confirmações
+    METRIC_WINDOW = 100   # Reconexões mantidas por stream para as estatísticas
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, tenants=1):
+        # Com várias lojas no mesmo worker, um pool pequeno ficaria ocupado pelos
+        # streams e cada confirmação abriria (e descartaria) uma conexão nova
+        self.pool_size = max(self.POOL_SIZE, tenants * self.CONNECTIONS_PER_TENANT)
+        self.ssl_context = ResumingSSLContext()
+        self.session = requests.Session()
+        adapter = _WarmAdapter(self.ssl_context, pool_connections=max(4, tenants), pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.metrics_lock = threading.Lock()
+        self.reconnects = {}   # stream -> deque de latências (ms) até o primeiro evento
+
+    @classmethod
+    def shared(cls):
+        """Instância usada por todo o processo"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def record_reconnect(self, stream, latency_ms):
+        with self.metrics_lock:
+            self.reconnects.setdefault(stream, deque(maxlen=self.METRIC_WINDOW)).append(latency_ms)
+
+    def stats(self):
+        """Resumo das métricas de rede"""
+        with self.metrics_lock:
+            reconnects = {}
+            for stream, values in self.reconnects.items():
+                ordered = sorted(values)
+                reconnects[stream] = {
+                    'count': len(ordered),
+                    'p50_ms': round(ordered[len(ordered) // 2], 1),
+                    'max_ms': round(ordered[-1], 1),
+                }
+        return {
+            'dns_hits': dns_cache.hits,
+            'dns_misses': dns_cache.misses,
+            'tls_handshakes': self.ssl_context.handshakes,
+            'tls_resumed': self.ssl_context.resumed,
+            'reconnects': reconnects,
+        }
+
+
+class _StreamConnection:
+    """Uma conexão SSE aberta: resposta HTTP e iterador de linhas"""
+
+    def __init__(self, response, lines):
+        self.response = response
+        self.lines = lines
+        self.events = 0
+        self.opened = time.monotonic()
+
+    def close(self):
+        # A thread de leitura fica bloqueada no socket até o próximo dado;
+        # shutdown() a libera na hora (response.close() sozinho espera o heartbeat).
+        # Conexões de outra origem (sem stream_socket) só são fechadas.
+        connection = getattr(self.response.raw, 'connection', None)
+        sock = getattr(connection, 'stream_socket', None)
+        try:
+            if sock is not None:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.response.close()
+        except Exception:
+            pass
+
+
+class EventStream:
+    """Stream SSE com reconexão rápida e troca sem lacunas para um stream reserva
+
+    Cada conexão tem sua thread de leitura; uma thread supervisora reconecta
+    (com JitterBackoff) quando a conexão cai - sempre após ao menos
+    STREAM_MIN_RETRY, e o backoff só volta ao início depois de uma conexão
+    ficar STREAM_HEALTHY_AFTER segundos no ar - e, se ela ficar sem dados por
+    STREAM_STALE_AFTER segundos, abre um stream reserva e só fecha o antigo
+    depois que o reserva recebeu a primeira linha. Eventos repetidos na
+    sobreposição (snapshots) são descartados pelo canal de ingestão.
+    """
+
+    def __init__(self, name, url, connections, on_payload, on_status, connected_message):
+        self.name = name
+        self.url = url
+        self.connections = connections
+        self.on_payload = on_payload
+        self.on_status = on_status
+        self.connected_message = connected_message
+        self.active = False
+        self.lock = threading.Lock()
+        self.current = None
+        self.last_data = time.time()
+        self.backoff = JitterBackoff(base=STREAM_MIN_RETRY)
+        self.retry_at = 0
+        self.lost_at = None   # início da reconexão (perf_counter), para a métrica
+        self.wake = threading.Event()   # acorda o supervisor quando a conexão cai
+        self.thread = None
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self.thread = threading.Thread(target=self._supervise, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.active = False
+        self.wake.set()
+        with self.lock:
+            current, self.current = self.current, None
+        if current:
+            current.close()
+
+    def _supervise(self):
+        prefix = f"[{self.name}]"
+        print(f"{prefix} Conectando a: {self.url}")
+        while self.active:
+            self.wake.clear()
+            now = time.time()
+            if self.current is None and now >= self.retry_at:
+                print(f"{prefix} Tentando conectar... (próxima espera até {self.backoff.current:.1f}s)")
+                connection = self._open(prime=False)
+                if connection is not None:
+                    self._promote(connection)
+            elif self.current is not None and now - self.last_data > STREAM_STALE_AFTER:
+                print(f"{prefix} ⚠️ Sem dados há {int(now - self.last_data)}s - abrindo stream reserva")
+                if self.lost_at is None:
+                    self.lost_at = time.perf_counter()
+                connection = self._open(prime=True)
+                if connection is not None:
+                    self._promote(connection)
+                else:
+                    # Mantém o stream atual; tenta o reserva de novo após a espera
+                    self.last_data = time.time() - STREAM_STALE_AFTER + self.backoff.current
+            self.wake.wait(STREAM_CHECK_INTERVAL)
+
+    def _retry_later(self, message):
+        delay = self.backoff.next()
+        self.retry_at = time.time() + delay
+        self.on_status(f"{message} - reconectando em {delay:.1f}s")
+        print(f"[{self.name}] {message} - reconectando em {delay:.1f}s")
+
+    def _open(self, prime):
+        """Abre uma conexão; com prime=True só a considera pronta após a primeira linha"""
+        try:
+            response = self.connections.session.get(
+                self.url, headers=SSE_HEADERS, stream=True,
+                timeout=(STREAM_CONNECT_TIMEOUT, STREAM_READ_TIMEOUT))
+            print(f"[{self.name}] Resposta HTTP: {response.status_code}")
+            if response.status_code != 200:
+                response.close()
+                self._retry_later(f"⚠️ Erro HTTP {response.status_code}")
+                return None
+            lines = response.iter_lines(decode_unicode=True)
+            if prime:
+                lines = chain([next(lines)], lines)
+            return _StreamConnection(response, lines)
+        except requests.exceptions.Timeout:
+            self._retry_later("⏰ Timeout")
+        except Exception as e:
+            self._retry_later(f"❌ Erro: {str(e)[:50]}")
+        return None
+
+    def _promote(self, connection):
+        """Torna a conexão a atual e fecha a anterior (se houver)"""
+        with self.lock:
+            previous, self.current = self.current, connection
+        self.last_data = time.time()
+        threading.Thread(target=self._pump, args=(connection,), daemon=True).start()
+        if previous is not None:
+            previous.close()
+            print(f"[{self.name}] 🔁 Stream reserva assumiu")
+        self.on_status(self.connected_message)
+        print(f"[{self.name}] Conexão estabelecida")
+
+    def _pump(self, connection):
+        """Lê uma conexão enquanto ela for a atual"""
+        buffer = ""
+        try:
+            for line in connection.lines:
+                if not self.active or self.current is not connection:
+                    break
+                self.last_data = time.time()
+
+                if not line:
+                    # Fim do evento
+                    if buffer:
+                        try:
+                            print(f"[{self.name}] Evento recebido: {buffer[:100]}...")
+                            payload = json.loads(buffer)
+                            self._first_event(connection)
+                            self.on_payload(payload)
+                        except Exception as e:
+                            print(f"[{self.name}] Erro ao processar evento: {e}")
+                        finally:
+                            buffer = ""
+                    continue
+
+                if line.startswith(":"):
+                    # Heartbeat/comentário
+                    continue
+
+                if line.startswith("data:"):
+                    buffer = line[5:].strip()
+        except Exception as e:
+            if self.active and self.current is connection:
+                print(f"[{self.name}] Erro na leitura: {e}")
+        finally:
+            connection.close()
+            with self.lock:
+                lost = self.current is connection
+                if lost:
+                    self.current = None
+            if lost and self.active:
+                if self.lost_at is None:
+                    self.lost_at = time.perf_counter()
+                if time.monotonic() - connection.opened >= STREAM_HEALTHY_AFTER:
+                    # Caiu depois de um bom tempo no ar: volta rápido, mas com jitter
+                    # para os clientes derrubados juntos não reconectarem em sincronia
+                    self.backoff.reset()
+                    self.retry_at = time.time() + random.uniform(STREAM_MIN_RETRY, 2 * STREAM_MIN_RETRY)
+                elif connection.events:
+                    # Servidor que aceita, manda um evento e fecha: o backoff continua crescendo
+                    self._retry_later("⚠️ Stream encerrado logo após conectar")
+                else:
+                    self._retry_later("⚠️ Stream encerrado sem eventos")
+                self.wake.set()
+
+    def _first_event(self, connection):
+        connection.events += 1
+        if connection.events == 1:
+            if self.lost_at is not None:
+                latency_ms = (time.perf_counter() - self.lost_at) * 1000
+                self.lost_at = None
+                self.connections.record_reconnect(self.name, latency_ms)
+                print(f"[{self.name}] Reconectado: primeiro evento em {latency_ms:.0f}ms")
+
+
+# ============================================================================
+# INGESTÃO DE EVENTOS
+# ============================================================================
+
+class RecentIds:
+    """Janela dos últimos IDs vistos: conjunto para busca + fila FIFO para descarte"""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.ids = set()
+        self.order = deque()
+
+    def add(self, key):
+        """Registra o ID; retorna False se ele já estava na janela"""
+        if key in self.ids:
+            return False
+        self.ids.add(key)
+        self.order.append(key)
+        if len(self.order) > self.maxlen:
+            self.ids.discard(self.order.popleft())
+        return True
+
+    def __contains__(self, key):
+        return key in self.ids
+
+
+class IngestionChannel:
+    """Canal único por onde entram todos os eventos (streams SSE, polling, manuais)
+
+    Os produtores apenas colocam eventos brutos na fila, de qualquer thread.
+    Uma única thread consome a fila na ordem de chegada, descarta duplicados
+    e despacha para o processador; como só ela toca no estado de deduplicação
+    e nos resumos de pedidos, nada disso precisa de lock.
+    """
+
+    COMMAND_WINDOW = 1000   # IDs de comandos lembrados para deduplicação
+    ORDER_WINDOW = 500      # IDs de pedidos lembrados para deduplicação
+
+    def __init__(self, on_command_callback, on_new_order_callback, on_order_update_callback=None):
+        self.on_command = on_command_callback
+        self.on_new_order = on_new_order_callback
+        self.on_order_update = on_order_update_callback
+        self.queue = queue.Queue()
+        self.thread = None
+        self.commands = RecentIds(self.COMMAND_WINDOW)
+        self.orders = RecentIds(self.ORDER_WINDOW)
+        # Itens de cada pedido em aberto, para detectar acréscimos (comandas de mesa)
+        self.snapshots = OrderSnapshots()
+        # Contadores por origem: recebidos, despachados e duplicados
+        self.stats = {}
+
+    def start(self):
+        """Inicia a thread de despacho"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print("[INGEST] Canal de eventos iniciado")
+
+    def stop(self):
+        """Encerra a thread de despacho após os eventos já recebidos"""
+        self.queue.put(None)
+
+    def submit(self, source, kind, data):
+        """Entrega um evento bruto ao canal (seguro para qualquer thread)
+
+        kind: 'command' (comando de impressão), 'order' (pedido novo),
+        'order_seed' (pedido já existente: memoriza ou, se já acompanhado,
+        imprime o que mudou), 'order_resync' (snapshot de uma reconexão:
+        como order_seed, mas pedido nunca visto é impresso como novo) ou
+        'order_update'.
+        """
+        self.queue.put((source, kind, data))
+
+    def join(self):
+        """Aguarda o despacho de todos os eventos já entregues"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is None:
+                    return
+                self._dispatch(*event)
+            except Exception as e:
+                print(f"[INGEST] Erro ao despachar evento: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _count(self, source, field):
+        counters = self.stats.setdefault(source, {'received': 0, 'dispatched': 0, 'duplicates': 0})
+        counters[field] += 1
+
+    def _dispatch(self, source, kind, data):
+        self._count(source, 'received')
+        if kind == 'order_resync':
+            # Pedido que não conhecemos no snapshot de uma reconexão foi criado com
+            # o stream fora do ar (o servidor não reenvia o insert perdido)
+            order_id = data.get('id') or data.get('orderId')
+            known = order_id in self.snapshots.orders or order_id in self.orders
+            kind = 'order_seed' if known or not order_id else 'order'
+
+        if kind == 'command':
+            cmd_id = data.get('commandId')
+            if cmd_id and self.commands.add(cmd_id):
+                self._count(source, 'dispatched')
+                self.on_command(data)
+                print(f"[INGEST] ✅ Comando {cmd_id} ({source}) enfileirado")
+            else:
+                self._count(source, 'duplicates')
+                print(f"[INGEST] ⚠️ Comando {cmd_id} ({source}) já foi processado ou ID inválido")
+
+        elif kind == 'order':
+            order_id = data.get('id') or data.get('orderId')
+            if order_id and self.orders.add(order_id):
+                # Só um pedido realmente novo é memorizado: um insert repetido não
+                # pode sobrescrever o resumo (o próximo update reimprimiria itens)
+                self.snapshots.seed(data)
+                self._count(source, 'dispatched')
+                self.on_new_order(data)
+                print(f"[INGEST] ✅ Pedido {order_id} ({source}) enfileirado para impressão")
+            else:
+                self._count(source, 'duplicates')
+                print(f"[INGEST] ⚠️ Pedido {order_id} ({source}) já foi processado ou ID inválido")
+
+        elif kind in ('order_seed', 'order_update'):
+            # order_seed: pedido já existente ao conectar (snapshot). Desconhecido,
+            # só é memorizado; já acompanhado (reconexão), o que mudou com o stream
+            # fora do ar vira adicional, como numa atualização
+            changes = self.snapshots.diff(data)
+            if changes and self.on_order_update:
+                self._count(source, 'dispatched')
+                print(f"[INGEST] ✏️ Pedido {data.get('id') or data.get('orderId')} alterado: {len(changes)} item(ns)")
+                self.on_order_update(data, changes)
+
+        else:
+            print(f"[INGEST] Tipo de evento desconhecido: {kind}")
+
+
 # ============================================================================
 # CLIENTE SSE EM TEMPO REAL
 # ============================================================================
@@ -92,23 +1523,30 @@ def save_config(config):
 class PrinterSSEClient:
     """Cliente SSE para receber comandos de impressão em tempo real"""
     
-    def __init__(self, on_command_callback, on_status_callback):
+    def __init__(self, ingestion, on_status_callback, connections=None, tenant=None):
         self.active = False
-        self.on_command = on_command_callback
+        self.ingestion = ingestion
         self.on_status = on_status_callback
-        self.session = requests.Session()
-        self.processed_commands = set()
-        self.thread = None
-        self.last_heartbeat = time.time()
+        self.connections = connections or ConnectionManager.shared()
+        self.session = self.connections.session
+        self.tenant = tenant or Tenant.default()
+        self.stream = None
         self.polling_thread = None
         
+    @property
+    def last_heartbeat(self):
+        """Último dado recebido pelo stream (eventos ou heartbeats)"""
+        return self.stream.last_data if self.stream else time.time()
+        
     def start(self):
         """Inicia o cliente SSE"""
         if self.active:
             return
         self.active = True
-        self.thread = threading.Thread(target=self._listen, daemon=True)
-        self.thread.start()
+        url = self.tenant.url('/api/print/stream')
+        self.stream = EventStream(self.tenant.tag('SSE'), url, self.connections, self._handle_event, self.on_status,
+                                  "🟢 Conectado - aguardando comandos")
+        self.stream.start()
         # Inicia polling de backup
         self.polling_thread = threading.Thread(target=self._polling_backup, daemon=True)
         self.polling_thread.start()
@@ -117,74 +1555,10 @@ class PrinterSSEClient:
     def stop(self):
         """Para o cliente SSE"""
         self.active = False
+        if self.stream:
+            self.stream.stop()
         self.on_status("🔴 Desconectado")
         
-    def _listen(self):
-        """Loop principal de escuta SSE"""
-        url = f"{WORKERS_BASE_URL}/api/print/stream?role={AUTH_ROLE}&pin={AUTH_PIN}"
-        headers = {
-            'Accept': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-        }
-        
-        print(f"[SSE] Conectando a: {url}")
-        
-        backoff = 1
-        max_backoff = 30
-        
-        while self.active:
-            try:
-                print(f"[SSE] Tentando conectar... (backoff: {backoff}s)")
-                with self.session.get(url, headers=headers, stream=True, timeout=60) as resp:
-                    print(f"[SSE] Resposta HTTP: {resp.status_code}")
-                    if resp.status_code != 200:
-                        self.on_status(f"⚠️ Erro HTTP {resp.status_code} - reconectando em {backoff}s")
-                        time.sleep(backoff)
-                        backoff = min(max_backoff, backoff * 2)
-                        continue
-                    
-                    self.on_status("🟢 Conectado - aguardando comandos")
-                    print("[SSE] Conexão estabelecida com sucesso!")
-                    self.last_heartbeat = time.time()  # Reset heartbeat timer
-                    backoff = 1
-                    
-                    buffer = ""
-                    for line in resp.iter_lines(decode_unicode=True):
-                        if not self.active:
-                            break
-                            
-                        if not line:
-                            # Fim do evento
-                            if buffer:
-                                try:
-                                    print(f"[SSE] Evento recebido: {buffer[:100]}...")
-                                    payload = json.loads(buffer)
-                                    self._handle_event(payload)
-                                except Exception as e:
-                                    print(f"[SSE] Erro ao processar evento: {e}")
-                                finally:
-                                    buffer = ""
-                            continue
-                            
-                        if line.startswith(":"):
-                            # Heartbeat/comentário
-                            self.last_heartbeat = time.time()
-                            print("[SSE] Heartbeat recebido")
-                            continue
-                            
-                        if line.startswith("data:"):
-                            buffer = line[5:].strip()
-                            print(f"[SSE] Dados recebidos: {buffer[:80]}...")
-                            
-            except requests.exceptions.Timeout:
-                self.on_status("⏰ Timeout - reconectando...")
-                time.sleep(2)
-            except Exception as e:
-                self.on_status(f"❌ Erro: {str(e)[:50]} - reconectando em {backoff}s")
-                time.sleep(backoff)
-                backoff = min(max_backoff, backoff * 2)
-                
     def _handle_event(self, payload):
         """Processa eventos SSE recebidos"""
         event = payload.get('event')
@@ -195,14 +1569,14 @@ class PrinterSSEClient:
             commands = payload.get('commands', [])
             print(f"[SSE] Snapshot recebido com {len(commands)} comandos")
             for cmd in commands:
-                self._enqueue_command(cmd)
+                self.ingestion.submit('print-sse', 'command', cmd)
                 
         elif event == 'print:enqueue':
             # Novo comando adicionado
             cmd = payload.get('command')
             print(f"[SSE] Novo comando recebido: {cmd.get('commandId') if cmd else 'None'}")
             if cmd:
-                self._enqueue_command(cmd)
+                self.ingestion.submit('print-sse', 'command', cmd)
                 
         elif event == 'print:noop':
             # Keep-alive
@@ -211,29 +1585,13 @@ class PrinterSSEClient:
         else:
             print(f"[SSE] Evento desconhecido: {event}")
             
-    def _enqueue_command(self, command):
-        """Enfileira comando se ainda não foi processado"""
-        cmd_id = command.get('commandId')
-        print(f"[SSE] Tentando enfileirar comando: {cmd_id}")
-        
-        if cmd_id and cmd_id not in self.processed_commands:
-            self.processed_commands.add(cmd_id)
-            self.on_command(command)
-            print(f"[SSE] ✅ Comando {cmd_id} enfileirado com sucesso")
-            
-            # Limita tamanho do set para evitar memory leak
-            if len(self.processed_commands) > 1000:
-                old_commands = list(self.processed_commands)[:200]
-                for old_cmd in old_commands:
-                    self.processed_commands.discard(old_cmd)
-        else:
-            print(f"[SSE] ⚠️ Comando {cmd_id} já foi processado ou ID inválido")
-    
     def _polling_backup(self):
         """Polling de backup a cada 10 segundos para garantir que não perca comandos"""
-        url = f"{WORKERS_BASE_URL}/api/print/queue?role={AUTH_ROLE}&pin={AUTH_PIN}"
+        url = self.tenant.url('/api/print/queue')
+        backoff = JitterBackoff(base=10, cap=120)
         
         while self.active:
+            delay = 10
             try:
                 # Verifica se SSE está vivo (heartbeat nos últimos 90 segundos)
                 time_since_heartbeat = time.time() - self.last_heartbeat
@@ -253,128 +1611,180 @@ class PrinterSSEClient:
                     if commands:
                         print(f"[POLLING] 📥 {len(commands)} comandos pendentes encontrados")
                         for cmd in commands:
-                            self._enqueue_command(cmd)
+                            self.ingestion.submit('polling', 'command', cmd)
                     else:
                         print("[POLLING] ✅ Nenhum comando pendente")
+                    backoff.reset()
+                else:
+                    delay = backoff.next()
                         
             except Exception as e:
                 print(f"[POLLING] Erro: {e}")
+                # Servidor fora: espaça as tentativas com jitter para não sincronizar clientes
+                delay = backoff.next()
             
-            # Aguarda 10 segundos antes do próximo polling
-            time.sleep(10)
+            # Aguarda antes do próximo polling
+            time.sleep(delay)
 
 # ============================================================================
 # CLIENTE SSE PARA PEDIDOS (REALTIME ORDERS)
 # ============================================================================
 
+class OrderSnapshots:
+    """Resumo compacto dos itens de cada pedido, para imprimir só o que mudou
+
+    Por pedido guarda apenas {chave do item: (quantidade, hash dos complementos
+    e observação, nome)}; a comparação com uma atualização é O(itens).
+    """
+
+    def __init__(self, max_orders=500):
+        self.max_orders = max_orders
+        self.orders = OrderedDict()   # id do pedido -> resumo dos itens
+
+    @staticmethod
+    def _summarize(order, details=None):
+        """Resumo dos itens; 'details' (opcional) recebe chave -> item completo"""
+        summary = {}
+        for item in order.get('items') or []:
+            name = str(item.get('name', 'Item'))
+            complements = tuple(str(comp.get('name', 'Comp')) for comp in item.get('complements') or [])
+            notes = item.get('notes') or item.get('observations') or None
+            if notes is not None and not isinstance(notes, str):
+                # Observação estruturada (lista/objeto) não é hashable
+                notes = json.dumps(notes, sort_keys=True, ensure_ascii=False, default=str)
+            signature = hash((complements, notes))
+            key = item.get('id')
+            if key is None:
+                # Sem id: itens iguais são distinguidos pela ordem de aparição
+                base = f"{name}|{signature}"
+                key = base
+                n = 1
+                while key in summary:
+                    n += 1
+                    key = f"{base}#{n}"
+            summary[key] = (item.get('quantity', 1), signature, name)
+            if details is not None:
+                details[key] = item
+        return summary
+
+    def seed(self, order):
+        """Memoriza o estado atual do pedido (snapshot inicial ou novo pedido)"""
+        order_id = order.get('id') or order.get('orderId')
+        if order_id:
+            self._store(order_id, self._summarize(order))
+
+    def _store(self, order_id, summary):
+        self.orders[order_id] = summary
+        self.orders.move_to_end(order_id)
+        if len(self.orders) > self.max_orders:
+            self.orders.popitem(last=False)
+
+    def diff(self, order):
+        """Compara a atualização com o estado memorizado e o substitui
+
+        Retorna a lista de alterações (vazia se os itens não mudaram) ou None
+        para pedidos desconhecidos, que passam a ser acompanhados a partir daqui.
+        """
+        order_id = order.get('id') or order.get('orderId')
+        if not order_id:
+            return None
+        previous = self.orders.get(order_id)
+        details = {}
+        current = self._summarize(order, details)
+        self._store(order_id, current)
+        if previous is None:
+            return None
+
+        changes = []
+        for key, (quantity, signature, name) in current.items():
+            before = previous.get(key)
+            if before is None:
+                action, count = 'ADICIONAR', quantity
+            elif before[1] != signature:
+                action, count = 'ALTERAR', quantity
+            elif quantity > before[0]:
+                action, count = 'ADICIONAR', quantity - before[0]
+            elif quantity < before[0]:
+                changes.append({'action': 'CANCELAR', 'quantity': before[0] - quantity, 'name': name, 'complements': [], 'notes': None})
+                continue
+            else:
+                continue
+            item = details[key]
+            changes.append({
+                'action': action,
+                'quantity': count,
+                'name': name,
+                'complements': [{'name': str(comp.get('name', 'Comp'))} for comp in item.get('complements') or []],
+                'notes': item.get('notes') or item.get('observations') or None,
+            })
+        for key, (quantity, _, name) in previous.items():
+            if key not in current:
+                changes.append({'action': 'CANCELAR', 'quantity': quantity, 'name': name, 'complements': [], 'notes': None})
+        return changes
+
+
 class OrdersSSEClient:
     """Cliente SSE para receber pedidos em tempo real e imprimir automaticamente"""
     
-    def __init__(self, on_new_order_callback, on_status_callback):
+    def __init__(self, ingestion, on_status_callback, connections=None, tenant=None):
         self.active = False
-        self.on_new_order = on_new_order_callback
+        self.ingestion = ingestion
         self.on_status = on_status_callback
-        self.session = requests.Session()
-        self.processed_orders = set()
-        self.thread = None
-        self.last_heartbeat = time.time()
+        self.connections = connections or ConnectionManager.shared()
+        self.tenant = tenant or Tenant.default()
+        self.stream = None
+        self.seeded = False   # Primeiro snapshot já recebido (os seguintes são de reconexões)
         
     def start(self):
         """Inicia o cliente SSE de pedidos"""
         if self.active:
             return
         self.active = True
-        self.thread = threading.Thread(target=self._listen, daemon=True)
-        self.thread.start()
+        self.seeded = False
+        url = self.tenant.url('/realtime/orders/stream')
+        self.stream = EventStream(self.tenant.tag('ORDERS SSE'), url, self.connections, self._handle_event, self.on_status,
+                                  "🟢 Conectado - escutando novos pedidos")
+        self.stream.start()
         print("[ORDERS SSE] Serviço de escuta de pedidos iniciado")
         
     def stop(self):
         """Para o cliente SSE de pedidos"""
         self.active = False
+        if self.stream:
+            self.stream.stop()
         print("[ORDERS SSE] Serviço de escuta de pedidos parado")
         
-    def _listen(self):
-        """Loop principal de escuta SSE para pedidos"""
-        url = f"{WORKERS_BASE_URL}/realtime/orders/stream?role={AUTH_ROLE}&pin={AUTH_PIN}"
-        headers = {
-            'Accept': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-        }
-        
-        print(f"[ORDERS SSE] Conectando a: {url}")
-        
-        backoff = 1
-        max_backoff = 30
-        
-        while self.active:
-            try:
-                print(f"[ORDERS SSE] Tentando conectar... (backoff: {backoff}s)")
-                with self.session.get(url, headers=headers, stream=True, timeout=60) as resp:
-                    print(f"[ORDERS SSE] Resposta HTTP: {resp.status_code}")
-                    if resp.status_code != 200:
-                        time.sleep(backoff)
-                        backoff = min(max_backoff, backoff * 2)
-                        continue
-                    
-                    print("[ORDERS SSE] Conexão estabelecida - escutando novos pedidos")
-                    self.last_heartbeat = time.time()
-                    backoff = 1
-                    
-                    buffer = ""
-                    for line in resp.iter_lines(decode_unicode=True):
-                        if not self.active:
-                            break
-                            
-                        if not line:
-                            # Fim do evento
-                            if buffer:
-                                try:
-                                    print(f"[ORDERS SSE] Evento recebido: {buffer[:100]}...")
-                                    payload = json.loads(buffer)
-                                    self._handle_event(payload)
-                                except Exception as e:
-                                    print(f"[ORDERS SSE] Erro ao processar evento: {e}")
-                                finally:
-                                    buffer = ""
-                            continue
-                            
-                        if line.startswith(":"):
-                            # Heartbeat
-                            self.last_heartbeat = time.time()
-                            continue
-                            
-                        if line.startswith("data:"):
-                            buffer = line[5:].strip()
-                            
-            except requests.exceptions.Timeout:
-                print("[ORDERS SSE] Timeout - reconectando...")
-                time.sleep(2)
-            except Exception as e:
-                print(f"[ORDERS SSE] Erro: {e} - reconectando em {backoff}s")
-                time.sleep(backoff)
-                backoff = min(max_backoff, backoff * 2)
-                
     def _handle_event(self, payload):
         """Processa eventos SSE de pedidos recebidos"""
         event = payload.get('event')
         print(f"[ORDERS SSE] Processando evento: {event}")
         
         if event == 'orders:snapshot':
-            # Snapshot inicial - ignora (não queremos imprimir pedidos antigos)
+            # Snapshot inicial - não imprime pedidos antigos, só memoriza os itens.
+            # Depois de uma reconexão, pedidos criados enquanto o stream estava
+            # fora do ar só aparecem aqui e são impressos pelo canal.
             orders = payload.get('orders', [])
-            print(f"[ORDERS SSE] Snapshot inicial com {len(orders)} pedidos (ignorado)")
+            kind = 'order_resync' if self.seeded else 'order_seed'
+            self.seeded = True
+            for order in orders:
+                self.ingestion.submit('orders-sse', kind, order)
+            if kind == 'order_seed':
+                print(f"[ORDERS SSE] Snapshot inicial com {len(orders)} pedidos (não impressos)")
+            else:
+                print(f"[ORDERS SSE] Snapshot de reconexão com {len(orders)} pedidos")
             
         elif event == 'orders:insert':
             # NOVO PEDIDO - ESTE É O QUE IMPORTA!
             order = payload.get('order')
             print(f"[ORDERS SSE] 🆕 NOVO PEDIDO RECEBIDO: {order.get('id') if order else 'None'}")
             if order:
-                self._handle_new_order(order)
+                self.ingestion.submit('orders-sse', 'order', order)
                 
         elif event == 'orders:update':
-            # Atualização de pedido - ignora
-            print(f"[ORDERS SSE] Atualização de pedido (ignorado)")
+            # Atualização de pedido - o canal imprime só os itens acrescentados/alterados
+            order = payload.get('order')
+            if order:
+                self.ingestion.submit('orders-sse', 'order_update', order)
             
         elif event == 'orders:noop':
             # Keep-alive
@@ -382,59 +1792,1299 @@ class OrdersSSEClient:
             pass
         else:
             print(f"[ORDERS SSE] Evento desconhecido: {event}")
-            
-    def _handle_new_order(self, order):
-        """Processa novo pedido"""
-        order_id = order.get('id') or order.get('orderId')
-        
-        print(f"[ORDERS SSE] Processando novo pedido: {order_id}")
-        
-        # Verifica se já foi processado
-        if order_id and order_id not in self.processed_orders:
-            self.processed_orders.add(order_id)
-            self.on_new_order(order)
-            print(f"[ORDERS SSE] ✅ Pedido {order_id} enfileirado para impressão")
-            
-            # Limita tamanho do set para evitar memory leak
-            if len(self.processed_orders) > 500:
-                old_orders = list(self.processed_orders)[:100]
-                for old_order in old_orders:
-                    self.processed_orders.discard(old_order)
+
+# ============================================================================
+# ESC/POS
+# ============================================================================
+
+ESC_INIT = b'\x1b@'                   # ESC @ - reinicia a impressora
+ESC_ALIGN_LEFT = b'\x1ba\x00'         # ESC a 0
+ESC_ALIGN_CENTER = b'\x1ba\x01'       # ESC a 1
+ESC_FEED_BEFORE_CUT = b'\x1bd\x04'    # ESC d 4 - avança 4 linhas
+ESCPOS_CUT = b'\x1dVB\x00'            # GS V 66 0 - avança e corta (parcial)
+ESCPOS_RASTER_BAND = 256               # Linhas por comando GS v 0
+
+# Memórias de gráficos (GS ( L): função de definição e de impressão
+ESCPOS_GRAPHICS_FUNCTIONS = {
+    'nv': (67, 69),          # NV (flash): sobrevive a desligamentos, gravações limitadas
+    'download': (83, 85),    # Download (RAM): apagada ao reiniciar a impressora
+}
+
+GRAPHICS_FILE = os.path.join(APPDATA_DIR, 'graphics.json')
+
+_RASTER_LUT = [255 if value < 128 else 0 for value in range(256)]
+
+def escpos_bits(img):
+    """Converte a imagem em bits 1 = ponto preto (linhas alinhadas a byte, MSB primeiro)"""
+    bits = img.convert('L').point(_RASTER_LUT, '1')
+    return (img.width + 7) // 8, img.height, bits.tobytes()
+
+def escpos_raster(img):
+    """Imagem como comandos GS v 0 (em faixas)"""
+    width_bytes, height, data = escpos_bits(img)
+    out = bytearray()
+    for top in range(0, height, ESCPOS_RASTER_BAND):
+        rows = min(ESCPOS_RASTER_BAND, height - top)
+        out += b'\x1dv0\x00' + struct.pack('<HH', width_bytes, rows)
+        out += data[top * width_bytes:(top + rows) * width_bytes]
+    return bytes(out)
+
+def _escpos_graphics_command(params):
+    """GS ( L (até 64 KB de parâmetros) ou GS 8 L (formato estendido)"""
+    if len(params) <= 0xFFFF:
+        return b'\x1d(L' + struct.pack('<H', len(params)) + params
+    return b'\x1d8L' + struct.pack('<I', len(params)) + params
+
+def escpos_define_graphic(code, img, memory):
+    """Grava a imagem na memória de gráficos da impressora sob o código (2 caracteres)"""
+    define_fn, _ = ESCPOS_GRAPHICS_FUNCTIONS[memory]
+    _, height, data = escpos_bits(img)
+    params = (bytes([48, define_fn, 48]) + code.encode('ascii') + bytes([1])
+              + struct.pack('<HH', img.width, height) + bytes([49]) + data)
+    return _escpos_graphics_command(params)
+
+def escpos_print_graphic(code, memory):
+    """Imprime um gráfico residente pelo código"""
+    _, print_fn = ESCPOS_GRAPHICS_FUNCTIONS[memory]
+    return _escpos_graphics_command(bytes([48, print_fn]) + code.encode('ascii') + bytes([1, 1]))
+
+
+class GraphicsRegistry:
+    """Rastreia quais gráficos estáticos estão residentes em cada impressora
+
+    Cada gráfico é identificado por impressora, memória e código; a impressão
+    digital (hash do raster) detecta mudanças de config/template que exigem
+    novo envio. O estado da memória NV é persistido; o da memória de download
+    (RAM) vale só durante a execução, pois a impressora o perde ao reiniciar.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        # impressora -> {'codes': {chave: código}, 'nv': {código: hash}, 'download': {código: hash}}
+        self.printers = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for printer, state in json.load(f).items():
+                        self.printers[printer] = {'codes': state.get('codes', {}), 'nv': state.get('nv', {}), 'download': {}}
+            except Exception as e:
+                print(f"[GRAPHICS] Erro ao carregar registro: {e}")
+
+    def _printer(self, printer):
+        return self.printers.setdefault(printer, {'codes': {}, 'nv': {}, 'download': {}})
+
+    def key_code(self, printer, key):
+        """Código de 2 caracteres (GS ( L kc1 kc2) associado à chave do gráfico"""
+        with self.lock:
+            codes = self._printer(printer)['codes']
+            code = codes.get(key)
+            if code is None:
+                used = set(codes.values())
+                code = next(f"E{chr(c)}" for c in range(48, 123) if f"E{chr(c)}" not in used)
+                codes[key] = code
+            return code
+
+    def is_resident(self, printer, memory, code, fingerprint):
+        with self.lock:
+            return self._printer(printer)[memory].get(code) == fingerprint
+
+    def mark_resident(self, printer, uploads):
+        """Registra gráficos enviados com sucesso: uploads = [(memória, código, hash)]"""
+        if not uploads:
+            return
+        with self.lock:
+            state = self._printer(printer)
+            changed = [(memory, code) for memory, code, fingerprint in uploads if state[memory].get(code) != fingerprint]
+            for memory, code, fingerprint in uploads:
+                state[memory][code] = fingerprint
+        if changed:
+            print(f"[GRAPHICS] {len(changed)} gráfico(s) residente(s) em {printer}")
+            self._save()
+
+    def invalidate(self, printer=None, memories=tuple(ESCPOS_GRAPHICS_FUNCTIONS)):
+        """Esquece os gráficos residentes nas memórias indicadas
+
+        Reset/troca da impressora (comando graphics_reset) limpa todas; uma
+        falha de impressão limpa só a de download, pois a impressora pode ter
+        reiniciado - a NV sobrevive e regravá-la a cada erro desgasta a flash.
+        """
+        with self.lock:
+            targets = [printer] if printer else list(self.printers)
+            changed = False
+            for name in targets:
+                state = self._printer(name)
+                for memory in memories:
+                    changed = changed or (memory == 'nv' and bool(state[memory]))
+                    state[memory].clear()
+        if changed:
+            self._save()
+
+    def _save(self):
+        """Grava os códigos e a memória NV; False (com log) se o arquivo não pôde ser gravado"""
+        if not self.path:
+            return True
+        with self.lock:
+            data = {name: {'codes': dict(state['codes']), 'nv': dict(state['nv'])} for name, state in self.printers.items()}
+        try:
+            write_json_atomic(self.path, data)
+            return True
+        except Exception as e:
+            # O arquivo antigo pode dar como residente um gráfico que a impressora
+            # já não tem: depois de reiniciar, o cabeçalho sairia em branco
+            print(f"[GRAPHICS] ❌ Erro ao salvar registro de gráficos em {self.path}: {e} - "
+                  "se o cabeçalho sair em branco após reiniciar, envie 'graphics_reset'")
+            return False
+
+# ============================================================================
+# QR CODES E CÓDIGOS DE BARRAS
+# ============================================================================
+#
+# No modo ESC/POS os códigos são gerados pela própria impressora (GS ( k para
+# QR, GS k para CODE128): o job carrega só o conteúdo, qualquer que seja o
+# tamanho do símbolo. No modo bitmap (ou quando o símbolo não cabe nos limites
+# do comando) são desenhados uma vez e reaproveitados do cache do contexto.
+
+QR_MODULE_DOTS = 6         # Tamanho máximo do módulo do QR (pontos)
+QR_QUIET_ZONE = 4          # Margem obrigatória do QR (módulos)
+BARCODE_HEIGHT = 80        # Altura das barras (pontos)
+BARCODE_MAX_MODULE = 3     # Largura máxima da barra fina (pontos)
+BARCODE_QUIET_ZONE = 10    # Margem obrigatória do CODE128 (módulos)
+
+# Capacidade em bytes do QR com correção 'M', por versão (1 a 20)
+_QR_BYTE_CAPACITY_M = [14, 26, 42, 62, 84, 106, 122, 152, 180, 213,
+                       251, 287, 331, 362, 412, 450, 504, 560, 624, 666]
+
+# Larguras barra/espaço dos símbolos CODE128 (valor 0 a 105) e do 'stop'
+_CODE128_PATTERNS = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232"
+).split()
+_CODE128_STOP = "2331112"
+_CODE128_START_B = 104
+_CODE128_START_C = 105
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+
+def qr_module_count(data):
+    """Módulos por lado do QR (correção 'M', modo byte), ou None se não couber"""
+    size = len(data.encode('utf-8'))
+    version = bisect_right(_QR_BYTE_CAPACITY_M, size - 1) + 1
+    if version > len(_QR_BYTE_CAPACITY_M):
+        return None
+    return 17 + 4 * version
+
+
+def code128_symbols(data):
+    """Valores CODE128 (início, dados, verificador): conjunto C para dígitos em pares, senão B"""
+    if len(data) >= 4 and len(data) % 2 == 0 and data.isdigit():
+        start = _CODE128_START_C
+        values = [int(data[i:i + 2]) for i in range(0, len(data), 2)]
+    else:
+        if any(not 32 <= ord(c) < 127 for c in data):
+            raise ValueError(f"CODE128 B aceita só ASCII imprimível: {data!r}")
+        start = _CODE128_START_B
+        values = [ord(c) - 32 for c in data]
+    checksum = (start + sum(i * value for i, value in enumerate(values, 1))) % 103
+    return [start] + values + [checksum]
+
+
+def code128_widths(data):
+    """Sequência de larguras (em módulos) alternando barra e espaço"""
+    symbols = code128_symbols(data)
+    return [int(w) for w in ''.join(_CODE128_PATTERNS[v] for v in symbols) + _CODE128_STOP]
+
+
+def render_barcode(data, module, height=BARCODE_HEIGHT):
+    """Desenha o CODE128 (tons de cinza, sem margens)"""
+    widths = code128_widths(data)
+    img = Image.new('L', (sum(widths) * module, height), 255)
+    draw = ImageDraw.Draw(img)
+    x = 0
+    for index, width in enumerate(widths):
+        if index % 2 == 0:
+            draw.rectangle((x, 0, x + width * module - 1, height - 1), fill=0)
+        x += width * module
+    return img
+
+
+def qr_falls_back_to_text(config):
+    """True se os QRs (PIX/rastreio) seriam desenhados em bitmap sem a biblioteca 'qrcode'
+
+    Nesse caso render_qr retorna None e o conteúdo sai impresso como texto.
+    """
+    if qrcode is not None or not (config.get('pix_key') or config.get('tracking_url')):
+        return False
+    return config.get('force_bitmap', True) or not config.get('native_codes', True)
+
+
+def render_qr(data, max_width):
+    """Desenha o QR (com margem) no maior módulo que caiba; None sem a biblioteca 'qrcode'"""
+    if qrcode is None:
+        return None
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=QR_QUIET_ZONE)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    module = min(QR_MODULE_DOTS, max_width // size)
+    if module < 1:
+        return None
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    return Image.frombytes('L', (size, size), pixels).resize((size * module, size * module), Image.NEAREST)
+
+
+def escpos_qr(data, module):
+    """QR modelo 2, correção 'M', gerado pela impressora (GS ( k)"""
+    payload = data.encode('utf-8')
+    return (b'\x1d(k\x04\x001A2\x00'                                  # modelo 2
+            + b'\x1d(k\x03\x001C' + bytes([module])                    # tamanho do módulo
+            + b'\x1d(k\x03\x001E1'                                      # correção 'M'
+            + b'\x1d(k' + struct.pack('<H', len(payload) + 3) + b'1P0' + payload
+            + b'\x1d(k\x03\x001Q0')                                     # imprime
+
+
+def escpos_barcode(data, module, height=BARCODE_HEIGHT):
+    """CODE128 gerado pela impressora (GS k), com o texto legível abaixo"""
+    symbols = code128_symbols(data)
+    if symbols[0] == _CODE128_START_C:
+        content = b'{C' + bytes(symbols[1:-1])
+    else:
+        content = b'{B' + data.encode('ascii').replace(b'{', b'{{')
+    return (b'\x1dh' + bytes([height]) + b'\x1dw' + bytes([module]) + b'\x1dH\x02'
+            + b'\x1dkI' + bytes([len(content)]) + content)
+
+
+def _crc16_ccitt(data):
+    """CRC-16/CCITT-FALSE (polinômio 0x1021, inicial 0xFFFF) usado pelo BR Code"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+            crc &= 0xFFFF
+    return crc
+
+
+def _emv_field(field_id, value):
+    return f"{field_id}{len(value):02d}{value}"
+
+
+def _pix_text(value, limit):
+    """Nome/cidade do recebedor: sem acentos, no tamanho máximo do campo"""
+    ascii_text = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    return ascii_text.strip()[:limit]
+
+
+def pix_payload(key, merchant_name, merchant_city, amount=None, txid=None):
+    """Payload PIX estático (BR Code, 'copia e cola') para o QR de pagamento"""
+    txid = re.sub(r'[^A-Za-z0-9]', '', txid or '')[:25] or '***'
+    payload = (
+        _emv_field('00', '01')
+        + _emv_field('26', _emv_field('00', 'br.gov.bcb.pix') + _emv_field('01', key))
+        + _emv_field('52', '0000')
+        + _emv_field('53', '986')
+        + (_emv_field('54', f"{float(amount):.2f}") if amount else '')
+        + _emv_field('58', 'BR')
+        + _emv_field('59', _pix_text(merchant_name, 25))
+        + _emv_field('60', _pix_text(merchant_city, 15))
+        + _emv_field('62', _emv_field('05', txid))
+        + '6304'
+    )
+    return payload + f"{_crc16_ccitt(payload.encode('utf-8')):04X}"
+
+# ============================================================================
+# BACKENDS DE IMPRESSÃO
+# ============================================================================
+
+def _batch_job_name(job_names):
+    """Nome do documento de um lote: o primeiro ticket e a contagem dos demais"""
+    if len(job_names) == 1:
+        return job_names[0]
+    return f"{job_names[0]} (+{len(job_names) - 1} tickets)"
+
+
+class Win32PrinterBackend:
+    """Imprime o recibo como bitmap via spooler do Windows (GDI)
+
+    No modo bitmap quem corta o papel é o driver. Drivers térmicos costumam
+    vir configurados para cortar ao fim do documento, então por padrão cada
+    ticket de um lote é um documento próprio; com page_cut (driver ajustado
+    para cortar a cada página) o lote inteiro vira um único documento.
+    """
+
+    name = 'win32'
+
+    def __init__(self, page_cut=False):
+        if win32print is None:
+            raise RuntimeError("Backend 'win32' requer pywin32 (somente Windows)")
+        self.page_cut = page_cut
+
+    def print_image(self, img, printer_name, job_name):
+        """Envia a imagem para a impressora"""
+        self.print_image_batch([img], printer_name, [job_name])
+
+    def print_image_batch(self, images, printer_name, job_names):
+        """Envia várias imagens abrindo a impressora uma única vez (um corte por ticket)"""
+        if self.page_cut:
+            documents = [(_batch_job_name(job_names), images)]
+        else:
+            documents = [(job_name, [img]) for job_name, img in zip(job_names, images)]
+        hPrinter = win32print.OpenPrinter(printer_name)
+        try:
+            hDC = win32ui.CreateDC()
+            hDC.CreatePrinterDC(printer_name)
+            try:
+                for document, pages in documents:
+                    hDC.StartDoc(document)
+                    for img in pages:
+                        hDC.StartPage()
+
+                        # Converte PIL Image para bitmap do Windows
+                        dib = ImageWin.Dib(img)
+                        dib.draw(hDC.GetHandleOutput(), (0, 0, img.width, img.height))
+
+                        hDC.EndPage()
+                    hDC.EndDoc()
+            finally:
+                hDC.DeleteDC()
+        finally:
+            win32print.ClosePrinter(hPrinter)
+
+    def print_raw(self, data, printer_name, job_name):
+        """Envia bytes ESC/POS diretamente (datatype RAW)"""
+        self.print_raw_batch([data], printer_name, [job_name])
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        """Envia vários tickets ESC/POS (cada um termina com corte) em um único job RAW"""
+        hPrinter = win32print.OpenPrinter(printer_name)
+        try:
+            win32print.StartDocPrinter(hPrinter, 1, (_batch_job_name(job_names), None, "RAW"))
+            try:
+                win32print.StartPagePrinter(hPrinter)
+                win32print.WritePrinter(hPrinter, b''.join(chunks))
+                win32print.EndPagePrinter(hPrinter)
+            finally:
+                win32print.EndDocPrinter(hPrinter)
+        finally:
+            win32print.ClosePrinter(hPrinter)
+
+
+class FilePrinterBackend:
+    """Salva cada recibo como PNG em uma pasta (testes e depuração)"""
+
+    name = 'file'
+
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir or os.path.join(APPDATA_DIR, 'tickets')
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.count = 0
+
+    def _path(self, job_name, extension):
+        self.count += 1
+        safe_name = re.sub(r'[^\w-]+', '_', job_name).strip('_')
+        return os.path.join(self.output_dir, f"{int(time.time() * 1000)}_{self.count:05d}_{safe_name}.{extension}")
+
+    def print_image(self, img, printer_name, job_name):
+        """Grava a imagem em disco"""
+        img.save(self._path(job_name, 'png'), optimize=False)
+
+    def print_raw(self, data, printer_name, job_name):
+        """Grava o stream ESC/POS em disco"""
+        with open(self._path(job_name, 'bin'), 'wb') as f:
+            f.write(data)
+
+    def print_image_batch(self, images, printer_name, job_names):
+        """Grava cada ticket do lote em seu próprio arquivo"""
+        for img, job_name in zip(images, job_names):
+            self.print_image(img, printer_name, job_name)
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        """Grava cada ticket do lote em seu próprio arquivo"""
+        for data, job_name in zip(chunks, job_names):
+            self.print_raw(data, printer_name, job_name)
+
+
+class NetworkPrinterBackend:
+    """ESC/POS direto para impressoras de rede (porta RAW 9100) - sem spooler, roda no Linux
+
+    O nome da impressora é 'host' ou 'host:porta'; imagens (modo bitmap) vão
+    como raster GS v 0 com corte.
+    """
+
+    name = 'network'
+
+    DEFAULT_PORT = 9100
+    TIMEOUT = 10
+
+    def _send(self, printer_name, chunks):
+        host, _, port = printer_name.rpartition(':') if ':' in printer_name else (printer_name, '', '')
+        address = (host, int(port) if port else self.DEFAULT_PORT)
+        with socket.create_connection(address, timeout=self.TIMEOUT) as sock:
+            for chunk in chunks:
+                sock.sendall(chunk)
+
+    @staticmethod
+    def _image_job(img):
+        return ESC_INIT + escpos_raster(img) + ESC_FEED_BEFORE_CUT + ESCPOS_CUT
+
+    def print_image(self, img, printer_name, job_name):
+        """Envia a imagem como raster ESC/POS"""
+        self._send(printer_name, [self._image_job(img)])
+
+    def print_raw(self, data, printer_name, job_name):
+        """Envia os bytes ESC/POS"""
+        self._send(printer_name, [data])
+
+    def print_image_batch(self, images, printer_name, job_names):
+        """Todos os tickets do lote em uma única conexão"""
+        self._send(printer_name, [self._image_job(img) for img in images])
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        """Todos os tickets do lote em uma única conexão"""
+        self._send(printer_name, chunks)
+
+
+class NullPrinterBackend:
+    """Descarta os recibos (testes de carga sem impressora)"""
+
+    name = 'null'
+
+    def __init__(self):
+        self.count = 0
+
+    def print_image(self, img, printer_name, job_name):
+        """Apenas contabiliza o recibo"""
+        self.count += 1
+
+    def print_raw(self, data, printer_name, job_name):
+        """Apenas contabiliza o recibo"""
+        self.count += 1
+
+    def print_image_batch(self, images, printer_name, job_names):
+        """Apenas contabiliza os recibos"""
+        self.count += len(images)
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        """Apenas contabiliza os recibos"""
+        self.count += len(chunks)
+
+
+PRINTER_BACKENDS = {
+    'win32': Win32PrinterBackend,
+    'file': FilePrinterBackend,
+    'network': NetworkPrinterBackend,
+    'null': NullPrinterBackend,
+}
+
+def create_printer_backend(config):
+    """Cria o backend de impressão definido na configuração"""
+    backend_name = config.get('printer_backend', 'win32')
+    if backend_name not in PRINTER_BACKENDS:
+        raise ValueError(f"Backend de impressão desconhecido: {backend_name}")
+    if backend_name == 'file':
+        return FilePrinterBackend(config.get('output_dir') or None)
+    if backend_name == 'win32':
+        return Win32PrinterBackend(page_cut=config.get('gdi_page_cut', False))
+    return PRINTER_BACKENDS[backend_name]()
+
+# ============================================================================
+# ARQUIVO DE TICKETS
+# ============================================================================
+
+# Cada ticket impresso é guardado já pronto (raster de 1 bit ou stream ESC/POS,
+# comprimido com zlib) em segmentos diários de registros anexados. Reimpressões
+# leem o registro e vão direto ao backend, sem renderizar de novo.
+#
+# Registro: cabeçalho '<4sIII' (ARCHIVE_MAGIC, tamanho dos metadados, tamanho
+# do conteúdo comprimido, CRC32 do conteúdo), metadados em JSON e o conteúdo.
+
+ARCHIVE_DIR = os.path.join(APPDATA_DIR, 'archive')
+ARCHIVE_MAGIC = b'TKT1'
+ARCHIVE_HEADER = struct.Struct('<4sIII')
+ARCHIVE_SEGMENT_BYTES = 16 * 1024 * 1024   # Tamanho a partir do qual o dia ganha um novo segmento
+ARCHIVE_READ_CHUNK = 64 * 1024             # Bytes lidos do disco por vez nas leituras em stream
+ARCHIVE_COMPRESSION = 6
+
+_SEGMENT_NAME = re.compile(r'^(\d{8})-(\d{3})\.seg$')
+_ARCHIVE_LUT = [0 if value < 128 else 255 for value in range(256)]
+
+
+class TicketArchive:
+    """Arquivo segmentado e indexado dos tickets impressos (reimpressão e auditoria)
+
+    O índice fica em memória e é reconstruído na abertura lendo só os
+    cabeçalhos dos segmentos: uma lista por horário (a ordem de gravação) e
+    outra ordenada por (loja, pedido, tipo, horário), ambas consultadas com
+    bisect.
+    Os gráficos estáticos referenciados por tickets ESC/POS são guardados uma
+    vez (comando de definição GS ( L) para que a reimpressão possa reenviá-los.
+    """
+
+    def __init__(self, path=ARCHIVE_DIR, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.by_time = []    # (horário, loja, pedido, tipo, segmento, offset) em ordem de gravação
+        self.times = []      # horários de by_time (chaves do bisect)
+        self.by_order = []   # (loja, pedido, tipo, horário, segmento, offset) ordenado
+        self.segment = None
+        self.segment_day = None
+        self.segment_size = 0
+        self.graphics = set()   # (memória, código, hash) com definição guardada
+        self.defines = {}       # cache dos comandos de definição lidos/gravados
+        os.makedirs(os.path.join(path, 'graphics'), exist_ok=True)
+        self._load_index()
+        self.prune()
+
+    # ------------------------------------------------------------------ índice
+
+    def _segments(self):
+        """Segmentos existentes, do mais antigo ao mais novo"""
+        return sorted(name for name in os.listdir(self.path) if _SEGMENT_NAME.match(name))
+
+    def _load_index(self):
+        for name in self._segments():
+            for offset, meta in self._scan(name):
+                self._index(meta, name, offset, bulk=True)
+        # Na varredura as entradas só são acrescentadas: uma ordenação no fim
+        # (estável, mantém a ordem de gravação entre horários iguais)
+        self.by_time.sort(key=lambda entry: entry[0])
+        self.times = [entry[0] for entry in self.by_time]
+        self.by_order.sort()
+        for name in os.listdir(os.path.join(self.path, 'graphics')):
+            memory, _, rest = name.partition('-')
+            code, _, fingerprint = rest.partition('-')
+            self.graphics.add((memory, code, fingerprint.rsplit('.', 1)[0]))
+        print(f"[ARCHIVE] {len(self.by_time)} tickets indexados em {self.path}")
+
+    def _scan(self, name):
+        """Percorre os cabeçalhos de um segmento: (offset, metadados)
+
+        Só um registro cortado no fim do arquivo (gravação interrompida) é
+        descartado. Um registro corrompido no meio é pulado até a próxima
+        assinatura válida; os bytes continuam no segmento.
+        """
+        path = os.path.join(self.path, name)
+        size = os.path.getsize(path)
+        torn_at = None
+        with open(path, 'rb') as f:
+            offset = 0
+            while offset < size:
+                try:
+                    record = self._read_record(f, offset, size)
+                except ValueError as e:
+                    record = e
+                if isinstance(record, tuple):
+                    meta, end = record
+                    yield offset, meta
+                    offset = end
+                    continue
+                following = self._resync(f, offset + 1, size)
+                if following is not None:
+                    print(f"[ARCHIVE] {name}: registro corrompido no offset {offset} ({record or 'tamanho inválido'}), "
+                          f"{following - offset} bytes ignorados")
+                    offset = following
+                elif record is None:
+                    torn_at = offset
+                    break
+                else:
+                    print(f"[ARCHIVE] {name}: registro corrompido no offset {offset} ({record}), "
+                          f"{size - offset} bytes ignorados até o fim")
+                    break
+        if torn_at is not None:
+            # Gravação interrompida (queda de energia): descarta o registro incompleto
+            print(f"[ARCHIVE] {name} truncado no offset {torn_at}: registro incompleto")
+            os.truncate(path, torn_at)
+
+    @staticmethod
+    def _read_record(f, offset, size):
+        """(metadados, fim) do registro em 'offset'
+
+        Retorna None se o registro termina além do fim do arquivo e levanta
+        ValueError se ele está corrompido.
+        """
+        f.seek(offset)
+        header = f.read(ARCHIVE_HEADER.size)
+        if len(header) < ARCHIVE_HEADER.size:
+            return None
+        magic, meta_len, blob_len, _ = ARCHIVE_HEADER.unpack(header)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("assinatura inválida")
+        end = offset + ARCHIVE_HEADER.size + meta_len + blob_len
+        if end > size:
+            return None
+        meta = json.loads(f.read(meta_len))
+        if not isinstance(meta, dict) or not {'ts', 'order_id', 'print_type'} <= meta.keys():
+            raise ValueError("metadados inválidos")
+        return meta, end
+
+    def _resync(self, f, start, size):
+        """Offset do próximo registro válido a partir de 'start' (ou None)"""
+        position = start
+        while position < size:
+            f.seek(position)
+            # Lê alguns bytes a mais para achar uma assinatura dividida entre blocos
+            chunk = f.read(ARCHIVE_READ_CHUNK + len(ARCHIVE_MAGIC) - 1)
+            found = chunk.find(ARCHIVE_MAGIC)
+            if found < 0:
+                position += ARCHIVE_READ_CHUNK
+                continue
+            candidate = position + found
+            try:
+                if self._read_record(f, candidate, size) is not None:
+                    return candidate
+            except ValueError:
+                pass
+            position = candidate + 1
+        return None
+
+    def _index(self, meta, segment, offset, bulk=False):
+        """Indexa um registro; com 'bulk' só acrescenta (quem chama ordena no fim)"""
+        ts, tenant = meta['ts'], meta.get('tenant', '')
+        order_id, print_type = str(meta['order_id']), meta['print_type']
+        if bulk:
+            self.by_time.append((ts, tenant, order_id, print_type, segment, offset))
+            self.by_order.append((tenant, order_id, print_type, ts, segment, offset))
+            return
+        if self.times and ts < self.times[-1]:
+            # Relógio voltou: mantém a lista por horário ordenada
+            position = bisect_right(self.times, ts)
+            self.times.insert(position, ts)
+            self.by_time.insert(position, (ts, tenant, order_id, print_type, segment, offset))
+        else:
+            self.times.append(ts)
+            self.by_time.append((ts, tenant, order_id, print_type, segment, offset))
+        insort(self.by_order, (tenant, order_id, print_type, ts, segment, offset))
+
+    # ---------------------------------------------------------------- gravação
+
+    def has_graphic(self, memory, code, fingerprint):
+        return (memory, code, fingerprint) in self.graphics
+
+    def add_graphic(self, memory, code, fingerprint, define_command):
+        """Guarda o comando de definição de um gráfico estático (uma vez por hash)"""
+        key = (memory, code, fingerprint)
+        with self.lock:
+            if key in self.graphics:
+                return
+            path = os.path.join(self.path, 'graphics', f"{memory}-{code}-{fingerprint}.bin")
+            with open(path, 'wb') as f:
+                f.write(zlib.compress(define_command, ARCHIVE_COMPRESSION))
+            self.graphics.add(key)
+            self.defines[key] = define_command
+
+    def graphic(self, memory, code, fingerprint):
+        """Comando de definição guardado (ou None)"""
+        key = (memory, code, fingerprint)
+        define = self.defines.get(key)
+        if define is None:
+            path = os.path.join(self.path, 'graphics', f"{memory}-{code}-{fingerprint}.bin")
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                define = self.defines[key] = zlib.decompress(f.read())
+        return define
+
+    def store(self, order_id, print_type, printer_name, ticket, graphics=(), tenant=''):
+        """Grava um ticket impresso: imagem PIL (bitmap) ou bytes ESC/POS
+
+        Gráficos enviados junto com o job ESC/POS são retirados do registro
+        (ficam guardados à parte) para a reimpressão só reenviá-los se preciso.
+        """
+        meta = {
+            'tenant': tenant,
+            'order_id': str(order_id),
+            'print_type': print_type,
+            'ts': time.time(),
+            'printer': printer_name,
+        }
+        if isinstance(ticket, Image.Image):
+            packed = ticket.convert('L').point(_ARCHIVE_LUT, '1')
+            meta.update(format='bitmap', width=packed.width, height=packed.height)
+            raw = packed.tobytes()
         else:
-            print(f"[ORDERS SSE] ⚠️ Pedido {order_id} já foi processado ou ID inválido")
+            meta.update(format='escpos', graphics=[list(ref) for ref in graphics])
+            raw = bytes(ticket)
+            for ref in graphics:
+                define = self.graphic(*ref)
+                if define:
+                    raw = raw.replace(define, b'', 1)
+        blob = zlib.compress(raw, ARCHIVE_COMPRESSION)
+        meta['size'] = len(raw)
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+
+        with self.lock:
+            day = datetime.fromtimestamp(meta['ts']).strftime('%Y%m%d')
+            if day != self.segment_day or self.segment_size >= ARCHIVE_SEGMENT_BYTES:
+                self._roll_segment(day)
+            offset = self.segment_size
+            with open(os.path.join(self.path, self.segment), 'ab') as f:
+                f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(meta_bytes), len(blob), zlib.crc32(blob)))
+                f.write(meta_bytes)
+                f.write(blob)
+            self.segment_size += ARCHIVE_HEADER.size + len(meta_bytes) + len(blob)
+            self._index(meta, self.segment, offset)
+        return meta
+
+    def _roll_segment(self, day):
+        """Passa a gravar no próximo segmento do dia (chamado com o lock)"""
+        numbers = [int(m.group(2)) for m in map(_SEGMENT_NAME.match, self._segments()) if m and m.group(1) == day]
+        current = max(numbers) if numbers else 0
+        name = f"{day}-{current:03d}.seg"
+        size = os.path.getsize(os.path.join(self.path, name)) if numbers else 0
+        if size >= ARCHIVE_SEGMENT_BYTES:
+            name, size = f"{day}-{current + 1:03d}.seg", 0
+        new_day = day != self.segment_day
+        self.segment, self.segment_day, self.segment_size = name, day, size
+        if new_day and self.by_time:
+            # Virada do dia: aplica a retenção fora do caminho crítico
+            threading.Thread(target=self.prune, daemon=True).start()
+
+    def prune(self, retention_days=None):
+        """Apaga os segmentos mais antigos que a retenção; retorna quantos foram apagados"""
+        retention_days = self.retention_days if retention_days is None else retention_days
+        if not retention_days or retention_days <= 0:
+            return 0
+        cutoff = datetime.fromtimestamp(time.time() - retention_days * 86400).strftime('%Y%m%d')
+        with self.lock:
+            expired = {name for name in self._segments() if name[:8] < cutoff and name != self.segment}
+            if not expired:
+                return 0
+            for name in expired:
+                os.remove(os.path.join(self.path, name))
+            kept = [entry for entry in self.by_time if entry[-2] not in expired]
+            self.by_time = kept
+            self.times = [entry[0] for entry in kept]
+            self.by_order = [entry for entry in self.by_order if entry[-2] not in expired]
+        print(f"[ARCHIVE] {len(expired)} segmento(s) além da retenção de {retention_days} dias apagados")
+        return len(expired)
+
+    # ---------------------------------------------------------------- consulta
+
+    def find(self, order_id, print_type=None, tenant=''):
+        """Registros de um pedido (opcionalmente de um tipo), do mais antigo ao mais novo"""
+        key = (tenant, str(order_id))
+        with self.lock:
+            start = bisect_left(self.by_order, key)
+            entries = []
+            for entry in islice(self.by_order, start, None):
+                if entry[:2] != key:
+                    break
+                if print_type is None or entry[2] == print_type:
+                    entries.append(entry)
+        return sorted(entries, key=lambda entry: entry[3])
+
+    def latest(self, order_id, print_type=None, tenant=''):
+        """Último registro gravado do pedido (ou None)"""
+        entries = self.find(order_id, print_type, tenant)
+        return entries[-1] if entries else None
+
+    def between(self, start_ts, end_ts):
+        """Registros gravados em [start_ts, end_ts) - auditoria por data"""
+        with self.lock:
+            low = bisect_left(self.times, start_ts)
+            high = bisect_left(self.times, end_ts, lo=low)
+            return self.by_time[low:high]
+
+    def on_date(self, date):
+        """Registros de um dia ('AAAA-MM-DD' ou date/datetime)"""
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d')
+        start = datetime(date.year, date.month, date.day).timestamp()
+        return self.between(start, start + 86400)
+
+    def read_meta(self, entry):
+        segment, offset = entry[-2], entry[-1]
+        with open(os.path.join(self.path, segment), 'rb') as f:
+            f.seek(offset)
+            _, meta_len, _, _ = ARCHIVE_HEADER.unpack(f.read(ARCHIVE_HEADER.size))
+            return json.loads(f.read(meta_len))
+
+    def iter_chunks(self, entry):
+        """Conteúdo descomprimido de um registro, em pedaços (sem carregá-lo inteiro)
+
+        O primeiro item gerado são os metadados do registro.
+        """
+        segment, offset = entry[-2], entry[-1]
+        with open(os.path.join(self.path, segment), 'rb') as f:
+            f.seek(offset)
+            magic, meta_len, blob_len, crc = ARCHIVE_HEADER.unpack(f.read(ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"Registro inválido em {segment}:{offset}")
+            yield json.loads(f.read(meta_len))
+            decompressor = zlib.decompressobj()
+            remaining, checksum = blob_len, 0
+            while remaining:
+                chunk = f.read(min(ARCHIVE_READ_CHUNK, remaining))
+                if not chunk:
+                    raise ValueError(f"Registro truncado em {segment}:{offset}")
+                remaining -= len(chunk)
+                checksum = zlib.crc32(chunk, checksum)
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield data
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+            if checksum != crc:
+                raise ValueError(f"CRC inválido em {segment}:{offset}")
+
+    def load(self, entry):
+        """Metadados e ticket pronto para o backend: imagem (bitmap) ou bytes (ESC/POS)"""
+        chunks = self.iter_chunks(entry)
+        meta = next(chunks)
+        raw = b''.join(chunks)
+        if meta['format'] == 'bitmap':
+            return meta, Image.frombytes('1', (meta['width'], meta['height']), raw).convert('L')
+        return meta, raw
+
+# ============================================================================
+# COORDENAÇÃO ENTRE CLIENTES DA MESMA LOJA
+# ============================================================================
+
+# Dois (ou mais) PCs rodando o cliente para a mesma loja recebem os mesmos
+# eventos; só o líder imprime. Os clientes trocam heartbeats UDP multicast
+# (somente rede local, TTL 1) assinados com HMAC. A chave é derivada (PBKDF2)
+# das credenciais e do segredo da loja ('coordination_secret'); cada
+# heartbeat leva o horário e um número de sequência por nó, e pacotes
+# antigos ou repetidos (capturados e reenviados na rede) são descartados. O
+# reserva processa os eventos normalmente (deduplicação e snapshots quentes)
+# mas guarda os comandos de impressão até o líder informar, no heartbeat,
+# que já os tratou; se o líder sumir, o reserva assume e imprime o que
+# ficou pendente.
+
+COORD_GROUP = '239.255.42.99'
+COORD_PORT = 47999
+COORD_HEARTBEAT_INTERVAL = 1.0   # Segundos entre heartbeats
+COORD_PEER_TIMEOUT = 3.5         # Segundos sem heartbeat até considerar o outro cliente fora
+COORD_PENDING_TTL = 300          # Segundos que o reserva guarda um comando não tratado pelo líder
+COORD_HANDLED_WINDOW = 64        # IDs tratados repetidos em cada heartbeat (perda de pacotes)
+COORD_MAX_PACKET = 1200          # Bytes por heartbeat (abaixo do MTU)
+COORD_GATED_TYPES = ('print', 'reprint')
+COORD_MAX_AGE = 30               # Segundos de diferença aceitos no horário de um heartbeat
+COORD_KDF_ITERATIONS = 100_000   # PBKDF2 da chave dos heartbeats (o PIN tem poucos dígitos)
+
+
+class StationCoordinator:
+    """Eleição de líder por heartbeat entre os clientes de uma loja
+
+    Um líder vivo é mantido enquanto responder (sem trocas quando um cliente
+    volta); havendo dois líderes, fica o de menor (prioridade, id). Sem
+    líder, o cliente de menor (prioridade, id) assume depois do período de
+    descoberta. Ao encerrar, o líder avisa e o reserva assume na hora.
+    """
+
+    def __init__(self, station, secret, priority=100, port=COORD_PORT, node_id=None):
+        self.station = station
+        self.key = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), f"edienai-coord|{station}".encode('utf-8'),
+                                       COORD_KDF_ITERATIONS)
+        self.priority = priority
+        self.port = port
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}-{random.getrandbits(16):04x}"
+        self.lock = threading.Lock()
+        self.peers = {}                        # nó -> (prioridade, é líder, visto em)
+        self.boot = int.from_bytes(os.urandom(8), 'big')   # Distingue as execuções de um mesmo nó
+        self.seq = 0                           # Sequência dos heartbeats enviados
+        self.last_seen = {}                    # nó -> (boot, seq, horário) do último pacote aceito
+        self.leader = False
+        self.leader_node = None
+        self.pending = OrderedDict()           # commandId -> (comando, recebido em)
+        self.handled = deque(maxlen=COORD_HANDLED_WINDOW)
+        self.leader_handled = RecentIds(IngestionChannel.COMMAND_WINDOW)
+        self.on_promote = None                 # callback(comandos pendentes) ao assumir a liderança
+        self.on_change = None                  # callback(é líder, nó líder)
+        self.active = False
+        self.sock = None
+        self.started = 0
+        self.thread = None
+
+    # ------------------------------------------------------------------ rede
+
+    def start(self):
+        if self.active:
+            return
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', self.port))
+        membership = struct.pack('4s4s', socket.inet_aton(COORD_GROUP), socket.inet_aton('0.0.0.0'))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.active = True
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"[COORD] Nó {self.node_id} (prioridade {self.priority}) na estação {self.station}")
+
+    def stop(self):
+        """Sai da coordenação; se for o líder, o reserva assume sem esperar o timeout"""
+        if not self.active:
+            return
+        self.active = False
+        self._send(leaving=True)
+        self.sock.close()
+
+    def _sign(self, body):
+        return hmac.new(self.key, body, hashlib.sha256).hexdigest()[:32].encode('ascii')
+
+    def _send(self, leaving=False):
+        with self.lock:
+            handled = list(self.handled) if self.leader else []
+            self.seq += 1
+            seq = self.seq
+        message = {
+            'station': self.station,
+            'node': self.node_id,
+            'boot': self.boot,
+            'seq': seq,
+            'ts': time.time(),
+            'priority': self.priority,
+            'leader': self.leader and not leaving,
+            'leaving': leaving,
+            'handled': handled,
+        }
+        body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        while len(body) > COORD_MAX_PACKET and message['handled']:
+            message['handled'] = message['handled'][len(message['handled']) // 2 + 1:]
+            body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        try:
+            self.sock.sendto(self._sign(body) + b'.' + body, (COORD_GROUP, self.port))
+        except OSError as e:
+            print(f"[COORD] Erro ao enviar heartbeat: {e}")
+
+    def _run(self):
+        next_beat = 0
+        while self.active:
+            now = time.monotonic()
+            if now >= next_beat:
+                self._send()
+                self._elect()
+                self._expire_pending()
+                next_beat = now + COORD_HEARTBEAT_INTERVAL
+            try:
+                self.sock.settimeout(max(0.01, next_beat - time.monotonic()))
+                data, _ = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._receive(data)
+
+    def _receive(self, data):
+        signature, _, body = data.partition(b'.')
+        if not hmac.compare_digest(signature, self._sign(body)):
+            return
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        node = message.get('node')
+        if message.get('station') != self.station or node == self.node_id:
+            return
+        with self.lock:
+            if not self._fresh(node, message):
+                return
+            if message.get('leaving'):
+                self.peers.pop(node, None)
+            else:
+                self.peers[node] = (message.get('priority', 100), bool(message.get('leader')), time.monotonic())
+            if message.get('leader'):
+                for command_id in message.get('handled', []):
+                    self.leader_handled.add(command_id)
+                    self.pending.pop(command_id, None)
+        self._elect()
+
+    def _fresh(self, node, message):
+        """True se o pacote é mais novo que o último aceito do nó (chamado com o lock)
+
+        Na mesma execução do nó vale a sequência; de uma execução para outra,
+        o horário. Pacotes fora da janela de COORD_MAX_AGE são sempre recusados.
+        """
+        boot, seq, ts = message.get('boot'), message.get('seq'), message.get('ts')
+        if not isinstance(seq, int) or not isinstance(ts, (int, float)) or abs(time.time() - ts) > COORD_MAX_AGE:
+            return False
+        last = self.last_seen.get(node)
+        if last is not None and (seq <= last[1] if boot == last[0] else ts <= last[2]):
+            return False
+        self.last_seen[node] = (boot, seq, ts)
+        return True
+
+    # --------------------------------------------------------------- eleição
+
+    def _elect(self):
+        now = time.monotonic()
+        promoted = None
+        with self.lock:
+            alive = {node: peer for node, peer in self.peers.items() if now - peer[2] < COORD_PEER_TIMEOUT}
+            self.peers = alive
+            me = (self.priority, self.node_id)
+            claimants = [(priority, node) for node, (priority, leader, _) in alive.items() if leader]
+            if self.leader:
+                claimants.append(me)
+            if claimants:
+                winner = min(claimants)
+            elif now - self.started >= COORD_PEER_TIMEOUT:
+                winner = min([me] + [(priority, node) for node, (priority, _, _) in alive.items()])
+            else:
+                winner = None   # ainda descobrindo se já existe um líder
+            was_leader, previous = self.leader, self.leader_node
+            self.leader = winner == me
+            self.leader_node = winner[1] if winner else None
+            if self.leader and not was_leader:
+                promoted = [command for command, _ in self.pending.values()]
+                self.pending.clear()
+        if self.leader_node != previous or self.leader != was_leader:
+            if self.on_change:
+                self.on_change(self.leader, self.leader_node)
+        if promoted is not None:
+            self._send()
+            if promoted and self.on_promote:
+                self.on_promote(promoted)
+
+    def _expire_pending(self):
+        cutoff = time.monotonic() - COORD_PENDING_TTL
+        with self.lock:
+            while self.pending:
+                command_id, (_, received) = next(iter(self.pending.items()))
+                if received >= cutoff:
+                    break
+                self.pending.popitem(last=False)
+                print(f"[COORD] Comando {command_id} descartado: o líder não o tratou em {COORD_PENDING_TTL}s")
+
+    # ------------------------------------------------------------- comandos
+
+    def admit(self, command):
+        """True se este cliente deve imprimir o comando agora; senão ele fica pendente"""
+        command_id = command.get('commandId')
+        with self.lock:
+            if self.leader:
+                return True
+            if command_id not in self.leader_handled.ids:
+                self.pending[command_id] = (command, time.monotonic())
+        return False
+
+    def mark_handled(self, command_id):
+        """Líder: comando tratado (impresso ou recusado) - avisa os reservas imediatamente"""
+        with self.lock:
+            self.handled.append(command_id)
+        if self.leader and self.active:
+            self._send()
+
+
+def create_coordinator(config, tenant):
+    """Coordenador da loja quando 'coordination' está ativo (senão None)"""
+    if not config.get('coordination'):
+        return None
+    identity = f"{tenant.base_url}|{tenant.role}|{tenant.pin}|{config.get('coordination_station', '')}"
+    if not config.get('coordination_secret'):
+        print("[COORD] ⚠️ 'coordination_secret' vazio: heartbeats assinados só com o PIN da loja")
+    return StationCoordinator(
+        hashlib.sha1(identity.encode('utf-8')).hexdigest()[:12],
+        f"{tenant.role}:{tenant.pin}|{config.get('coordination_secret', '')}",
+        config.get('coordination_priority', 100),
+        config.get('coordination_port', COORD_PORT),
+    )
 
 # ============================================================================
 # PROCESSADOR DE COMANDOS DE IMPRESSÃO
 # ============================================================================
 
+class RenderContextCache:
+    """Contextos de renderização (fontes, logo, blocos estáticos, códigos) por conteúdo da config
+
+    Ignora as chaves que só decidem para onde e se o ticket é impresso, de
+    modo que lojas (ou versões da config) com o mesmo papel, fonte e template
+    compartilham o mesmo contexto.
+    """
+
+    ROUTING_KEYS = frozenset({
+        'printer_name', 'printer_backend', 'output_dir', 'auto_print_client', 'auto_print_kitchen',
+        'auto_print_addendum', 'batch_max_tickets', 'batch_max_wait_ms', 'gdi_page_cut', 'archive_enabled',
+        'archive_retention_days', 'header_graphics',
+    })
+
+    def __init__(self, size=16):
+        self.size = size
+        self.lock = threading.Lock()
+        self.contexts = OrderedDict()
+
+    @classmethod
+    def key(cls, config):
+        return json.dumps({k: v for k, v in config.items() if k not in cls.ROUTING_KEYS}, sort_keys=True, default=str)
+
+    def get(self, key, build):
+        with self.lock:
+            context = self.contexts.get(key)
+            if context is not None:
+                self.contexts.move_to_end(key)
+                return context
+        context = build()
+        with self.lock:
+            context = self.contexts.setdefault(key, context)
+            if len(self.contexts) > self.size:
+                self.contexts.popitem(last=False)
+        return context
+
+
 class PrintCommandProcessor:
     """Processa comandos de impressão"""
     
-    def __init__(self, config, on_log_callback):
-        self.config = config
+    # Contextos de renderização mantidos (versão base + sobrescritas por comando)
+    RENDER_CONTEXT_CACHE_SIZE = 16
+    
+    # QR codes/códigos de barras desenhados mantidos por contexto (reimpressões)
+    CODE_GRAPHIC_CACHE_SIZE = 64
+    
+    # Margens do recibo (px) e espaço em branco final para o corte (modo bitmap)
+    RECEIPT_MARGIN = 16
+    RECEIPT_CUT_SPACE = 100
+    
+    def __init__(self, config, on_log_callback, backend=None, graphics=None, connections=None, archive=None,
+                 tenant=None, pool=None, render_cache=None, coordinator=None):
+        # Aceita um ConfigStore compartilhado ou um dict (harness/benchmarks)
+        self.config_store = config if isinstance(config, ConfigStore) else ConfigStore.in_memory(config)
         self.on_log = on_log_callback
         self.queue = queue.Queue()
         self.active = False
         self.thread = None
-        self.session = requests.Session()
+        # Confirmações de status usam o mesmo pool de conexões dos streams
+        self.connections = connections or ConnectionManager.shared()
+        self.session = self.connections.session
+        # Loja cujos comandos são processados (endpoint das confirmações)
+        self.tenant = tenant or Tenant.default()
+        # Threads de impressão compartilhadas entre lojas (None = thread própria)
+        self.pool = pool
+        self.schedule_lock = threading.Lock()
+        self.scheduled = False
+        # Vários PCs na mesma loja: só o líder imprime (None = sem coordenação)
+        self.coordinator = coordinator
+        if coordinator is not None:
+            coordinator.on_promote = self._release_held
+            coordinator.on_change = self._on_leader_change
+        # Backend fixo (harness) ou criado a partir da config a cada impressão
+        self.backend = backend
+        # Gráficos estáticos residentes na memória das impressoras (modo ESC/POS)
+        if graphics is None:
+            graphics = GraphicsRegistry(GRAPHICS_FILE if self.config_store.path else None)
+        self.graphics = graphics
+        # Tickets impressos guardados prontos para reimpressão e auditoria
+        if archive is None and self.config_store.path:
+            try:
+                archive = TicketArchive(ARCHIVE_DIR, self.config.get('archive_retention_days', 30))
+            except Exception as e:
+                print(f"[ARCHIVE] Arquivo de tickets indisponível: {e}")
+        self.archive = archive
+        # Comando que encerrou um lote de impressão, processado a seguir
+        self.held_command = None
+        # Fontes e medidas por conteúdo da config (compartilháveis entre lojas);
+        # a chave de cada versão é calculada uma vez e esquecida quando a versão muda
+        self.render_cache = render_cache or RenderContextCache(self.RENDER_CONTEXT_CACHE_SIZE)
+        self.render_keys = {}
+        self.render_context_base = None
+        if qr_falls_back_to_text(self.config):
+            print("[PRINT] ⚠️ Biblioteca 'qrcode' não instalada: QRs de PIX/rastreio no modo bitmap sairão "
+                  "como texto (pip install qrcode, ou use o modo ESC/POS com 'native_codes')")
+        
+    @property
+    def config(self):
+        """Snapshot atual da configuração"""
+        return self.config_store.current
+        
+    def _get_backend(self, config):
+        """Retorna o backend de impressão em uso"""
+        if self.backend is not None:
+            return self.backend
+        return create_printer_backend(config)
         
     def start(self):
-        """Inicia o processador"""
+        """Inicia o processador (thread própria ou threads do pool)"""
         if self.active:
             return
         self.active = True
+        if self.coordinator is not None:
+            self.coordinator.start()
+        if self.pool is not None:
+            self._put(None)
+            return
         self.thread = threading.Thread(target=self._process_loop, daemon=True)
         self.thread.start()
         
     def stop(self):
         """Para o processador"""
         self.active = False
+        if self.coordinator is not None:
+            self.coordinator.stop()
         
     def enqueue(self, command):
         """Adiciona comando à fila"""
         cmd_id = command.get('commandId', 'unknown')
         print(f"[PROCESSOR] Comando {cmd_id} adicionado à fila (tamanho: {self.queue.qsize() + 1})")
-        self.queue.put(command)
+        self._put(command)
+        
+    def _put(self, command):
+        """Enfileira o comando e, com pool, agenda o processador se ainda não estiver agendado"""
+        if command is not None:
+            if self.coordinator is not None and command.get('type') in COORD_GATED_TYPES \
+                    and not command.get('local') and not self.coordinator.admit(command):
+                print(f"[COORD] Em espera: {command.get('commandId')} fica com o líder")
+                return
+            self.queue.put(command)
+        if self.pool is None or not self.active:
+            return
+        with self.schedule_lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.pool.schedule(self)
+        
+    def _release_held(self, commands):
+        """Assumiu a liderança: imprime o que o líder anterior não chegou a tratar"""
+        self.on_log(f"👑 Assumindo a impressão ({len(commands)} comando(s) pendente(s))", "warning")
+        for command in commands:
+            self._put(command)
+            
+    def _on_leader_change(self, is_leader, leader_node):
+        if is_leader:
+            self.on_log("👑 Este cliente é o líder: imprimindo os pedidos", "success")
+        else:
+            self.on_log(f"🕒 Em espera - impressão com o cliente {leader_node or '(eleição em andamento)'}", "info")
+        
+    def has_pending(self):
+        return self.held_command is not None or not self.queue.empty()
+        
+    def run_pending(self):
+        """Chamado por uma thread do pool: processa um comando (ou lote) e reagenda se sobrar
+
+        Cada processador fica com no máximo uma thread por vez, preservando a
+        ordem dos comandos da loja; lojas diferentes imprimem em paralelo.
+        """
+        try:
+            self._process_next()
+        except Exception as e:
+            self.on_log(f"❌ Erro no processamento: {e}", "error")
+            print(f"[PROCESSOR] Erro: {e}")
+        with self.schedule_lock:
+            more = self.active and self.has_pending()
+            self.scheduled = more
+        if more:
+            # Volta ao fim da fila do pool: lojas com rajadas não monopolizam as threads
+            self.pool.schedule(self)
     
     def enqueue_order_auto_print(self, order):
         """Adiciona pedido à fila para impressão automática"""
@@ -442,8 +3092,9 @@ class PrintCommandProcessor:
         print(f"[PROCESSOR] 📥 Novo pedido para impressão automática: {order_id}")
         
         # Verifica se as impressões automáticas estão habilitadas
-        auto_client = self.config.get('auto_print_client', True)
-        auto_kitchen = self.config.get('auto_print_kitchen', True)
+        config = self.config
+        auto_client = config.get('auto_print_client', True)
+        auto_kitchen = config.get('auto_print_kitchen', True)
         
         if not auto_client and not auto_kitchen:
             print(f"[PROCESSOR] ⚠️ Impressão automática desabilitada - Pedido {order_id} ignorado")
@@ -459,7 +3110,7 @@ class PrintCommandProcessor:
                 'orderData': order,
                 'timestamp': time.time()
             }
-            self.queue.put(cmd_client)
+            self._put(cmd_client)
             print(f"[PROCESSOR] ✅ Impressão de CLIENTE enfileirada: {order_id}")
         
         if auto_kitchen:
@@ -470,28 +3121,139 @@ class PrintCommandProcessor:
                 'orderData': order,
                 'timestamp': time.time()
             }
-            self.queue.put(cmd_kitchen)
+            self._put(cmd_kitchen)
             print(f"[PROCESSOR] ✅ Impressão de COZINHA enfileirada: {order_id}")
         
         self.on_log(f"📥 Pedido {order_id} recebido - imprimindo automaticamente", "info")
         
+    def enqueue_order_addendum(self, order, changes):
+        """Enfileira para a cozinha só os itens acrescentados/alterados de um pedido"""
+        order_id = order.get('id') or order.get('orderId')
+        if not self.config.get('auto_print_addendum', True):
+            print(f"[PROCESSOR] ⚠️ Impressão de adicionais desabilitada - Pedido {order_id} ignorado")
+            return
+            
+        # ID igual em todos os clientes da loja (coordenação), mas novo a cada
+        # edição: duas edições com as mesmas alterações diferem na revisão do
+        # pedido (updated_at) e nos itens resultantes
+        revision = order.get('updatedAt') or order.get('updated_at') or order.get('revision') or ''
+        state = json.dumps([changes, order.get('items')], sort_keys=True, default=str)
+        digest = hashlib.sha1(state.encode('utf-8')).hexdigest()[:12]
+        self._put({
+            'commandId': f"{order_id}_addendum_{revision}_{digest}" if revision else f"{order_id}_addendum_{digest}",
+            'type': 'print',
+            'printType': 'addendum',
+            'orderData': {**order, 'addendum': changes},
+            'timestamp': time.time()
+        })
+        print(f"[PROCESSOR] ✅ Adicional de COZINHA enfileirado: {order_id} ({len(changes)} item(ns))")
+        self.on_log(f"✏️ Pedido {order_id} alterado - imprimindo adicional para a cozinha", "info")
+        
     def _process_loop(self):
         """Loop de processamento de comandos"""
         print("[PROCESSOR] Thread de processamento iniciada")
         while self.active:
             try:
-                if not self.queue.empty():
-                    command = self.queue.get()
-                    print(f"[PROCESSOR] Comando retirado da fila: {command.get('commandId')}")
-                    self._handle_command(command)
-                    self.queue.task_done()
-                else:
+                if not self._process_next():
                     time.sleep(0.1)
             except Exception as e:
                 self.on_log(f"❌ Erro no processamento: {e}", "error")
                 print(f"[PROCESSOR] Erro: {e}")
                 time.sleep(1)
                 
+    def _process_next(self):
+        """Processa o próximo comando (ou lote); retorna False se a fila estava vazia"""
+        if not self.has_pending():
+            return False
+        command = self.held_command or self.queue.get()
+        self.held_command = None
+        print(f"[PROCESSOR] Comando retirado da fila: {command.get('commandId')}")
+        batch = self._collect_batch(command)
+        try:
+            if len(batch) > 1:
+                self._handle_print_batch(batch)
+            else:
+                self._handle_command(command)
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+        return True
+                
+    def _collect_batch(self, command):
+        """Junta ao comando de impressão os demais que já aguardam na fila
+        
+        Respeita 'batch_max_tickets' e 'batch_max_wait_ms'; um comando que não
+        seja de impressão encerra o lote e é processado em seguida, na ordem.
+        """
+        config = self.config
+        max_tickets = config.get('batch_max_tickets', 1)
+        if command.get('type') != 'print' or max_tickets <= 1:
+            return [command]
+            
+        batch = [command]
+        deadline = time.monotonic() + config.get('batch_max_wait_ms', 0) / 1000
+        while len(batch) < max_tickets:
+            try:
+                remaining = deadline - time.monotonic()
+                following = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if following.get('type') != 'print':
+                self.held_command = following
+                break
+            batch.append(following)
+        return batch
+        
+    def _handle_print_batch(self, commands):
+        """Imprime um lote de comandos: um único job por impressora e modo"""
+        print(f"[PROCESSOR] Lote de {len(commands)} comandos de impressão")
+        base_config = self.config
+        groups = OrderedDict()
+        job_graphics = {}   # grupo -> gráficos já definidos por um ticket anterior do job
+        for command in commands:
+            cmd_id = command.get('commandId', 'unknown')
+            self.on_log(f"🖨️ Processando comando {cmd_id} (tipo: print, em lote)", "info")
+            try:
+                prepared = self._prepare_print(command, base_config)
+                if prepared is None:
+                    continue
+                order_data, print_type, config = prepared
+                key = (config['printer_name'], config.get('force_bitmap', True),
+                       config.get('printer_backend'), config.get('output_dir'))
+                # Gráficos estáticos definidos por um ticket valem para os seguintes
+                # do mesmo job; só viram residentes depois que o job for impresso
+                in_job = set(job_graphics.get(key, ()))
+                ticket, graphics = self._render(order_data, print_type, config, in_job=in_job)
+                job_graphics[key] = in_job
+            except Exception as e:
+                print(f"[PROCESSOR] ❌ Exceção: {e}")
+                self.on_log(f"❌ Erro ao processar comando: {e}", "error")
+                self._confirm_error(cmd_id, str(e))
+                continue
+            groups.setdefault(key, []).append((cmd_id, order_data, print_type, config, ticket, graphics))
+            
+        for (printer_name, bitmap, _, _), tickets in groups.items():
+            job_names = [self._job_name(order_data, print_type) for _, order_data, print_type, *_ in tickets]
+            try:
+                backend = self._get_backend(tickets[0][3])
+                if bitmap:
+                    backend.print_image_batch([ticket for *_, ticket, _ in tickets], printer_name, job_names)
+                else:
+                    backend.print_raw_batch([ticket for *_, ticket, _ in tickets], printer_name, job_names)
+                    self.graphics.mark_resident(printer_name, [ref for *_, graphics in tickets for ref in graphics])
+                print(f"[PRINT] ✅ Job com {len(tickets)} tickets concluído em {printer_name}")
+                success = True
+            except Exception as e:
+                if not bitmap:
+                    self.graphics.invalidate(printer_name, ('download',))
+                print(f"[PRINT] ❌ Erro na impressão do lote: {e}")
+                self.on_log(f"❌ Erro na impressão: {e}", "error")
+                success = False
+            for cmd_id, order_data, print_type, config, ticket, graphics in tickets:
+                if success:
+                    self._archive_ticket(order_data, print_type, config, ticket, graphics)
+                self._finish_print(cmd_id, order_data, print_type, success)
+        
     def _handle_command(self, command):
         """Processa um comando específico"""
         cmd_id = command.get('commandId', 'unknown')
@@ -501,53 +3263,38 @@ class PrintCommandProcessor:
         print(f"[PROCESSOR] Comando completo: {json.dumps(command, indent=2)}")
         self.on_log(f"🖨️ Processando comando {cmd_id} (tipo: {cmd_type})", "info")
         
+        # Snapshot consistente da configuração durante todo o comando
+        config = self.config
+        
         try:
             if cmd_type == 'print':
-                order_data = command.get('orderData')
-                print_type = command.get('printType', 'client')
-                
-                print(f"[PROCESSOR] Print Type: {print_type}")
-                print(f"[PROCESSOR] Order Data: {order_data is not None}")
-                
-                if not order_data:
-                    self._confirm_error(cmd_id, "Dados do pedido ausentes")
-                    return
-                
-                # Verifica se a impressão automática está habilitada para este tipo
-                if print_type == 'client' and not self.config.get('auto_print_client', True):
-                    self.on_log(f"⚠️ Impressão automática de cliente desabilitada - Pedido {order_data.get('id', 'N/A')} ignorado", "warning")
-                    self._confirm_success(cmd_id)  # Confirma como sucesso mas não imprime
-                    return
-                    
-                if print_type == 'kitchen' and not self.config.get('auto_print_kitchen', True):
-                    self.on_log(f"⚠️ Impressão automática de cozinha desabilitada - Pedido {order_data.get('id', 'N/A')} ignorado", "warning")
-                    self._confirm_success(cmd_id)  # Confirma como sucesso mas não imprime
+                prepared = self._prepare_print(command, config)
+                if prepared is None:
                     return
-                    
-                # Aplica configuração se fornecida
-                printer_config = command.get('printerConfig')
-                if printer_config:
-                    print(f"[PROCESSOR] Atualizando config da impressora: {printer_config}")
-                    self.config.update(printer_config)
+                order_data, print_type, config = prepared
                     
                 # Executa impressão
                 print(f"[PROCESSOR] Iniciando impressão - Tipo: {print_type}")
-                success = self._print_order(order_data, print_type)
-                
-                if success:
-                    self.on_log(f"✅ Pedido {order_data.get('id', 'N/A')} ({print_type}) impresso com sucesso", "success")
-                    self._confirm_success(cmd_id)
-                else:
-                    self.on_log(f"❌ Falha ao imprimir pedido {order_data.get('id', 'N/A')} ({print_type})", "error")
-                    self._confirm_error(cmd_id, "Falha na impressão")
+                success = self._print_order(order_data, print_type, config)
+                self._finish_print(cmd_id, order_data, print_type, success)
+                    
+            elif cmd_type == 'reprint':
+                self._reprint(command, config)
+                    
+            elif cmd_type == 'graphics_reset':
+                # Impressora reiniciada/trocada: reenvia os gráficos estáticos no próximo ticket
+                self.graphics.invalidate(command.get('printerName') or config['printer_name'])
+                self.on_log("🖼️ Gráficos da impressora serão reenviados", "info")
+                self._confirm_success(cmd_id)
                     
             elif cmd_type == 'config':
                 config_data = command.get('config', {})
                 if config_data:
-                    self.config.update(config_data)
-                    save_config(self.config)
-                    self.on_log(f"⚙️ Configuração atualizada", "success")
-                    self._confirm_success(cmd_id)
+                    if self.config_store.update(config_data):
+                        self.on_log(f"⚙️ Configuração atualizada (versão {self.config.version})", "success")
+                        self._confirm_success(cmd_id)
+                    else:
+                        self._confirm_error(cmd_id, "Falha ao salvar configuração")
                 else:
                     self._confirm_error(cmd_id, "Configuração ausente")
             else:
@@ -561,228 +3308,477 @@ class PrintCommandProcessor:
             self.on_log(f"❌ Erro ao processar comando: {e}", "error")
             self._confirm_error(cmd_id, str(e))
             
-    def _print_order(self, order_data, print_type):
+    def _prepare_print(self, command, config):
+        """Valida um comando de impressão e aplica a config do comando
+        
+        Retorna (pedido, tipo, config) ou None quando o comando já foi
+        respondido (dados ausentes ou impressão automática desabilitada).
+        """
+        cmd_id = command.get('commandId', 'unknown')
+        order_data = command.get('orderData')
+        print_type = command.get('printType', 'client')
+        
+        print(f"[PROCESSOR] Print Type: {print_type}")
+        print(f"[PROCESSOR] Order Data: {order_data is not None}")
+        
+        if not order_data:
+            self._confirm_error(cmd_id, "Dados do pedido ausentes")
+            return None
+        
+        # Verifica se a impressão automática está habilitada para este tipo
+        if print_type == 'client' and not config.get('auto_print_client', True):
+            self.on_log(f"⚠️ Impressão automática de cliente desabilitada - Pedido {order_data.get('id', 'N/A')} ignorado", "warning")
+            self._confirm_success(cmd_id)  # Confirma como sucesso mas não imprime
+            return None
+            
+        if print_type == 'kitchen' and not config.get('auto_print_kitchen', True):
+            self.on_log(f"⚠️ Impressão automática de cozinha desabilitada - Pedido {order_data.get('id', 'N/A')} ignorado", "warning")
+            self._confirm_success(cmd_id)  # Confirma como sucesso mas não imprime
+            return None
+            
+        if print_type == 'addendum' and not config.get('auto_print_addendum', True):
+            self.on_log(f"⚠️ Impressão de adicionais desabilitada - Pedido {order_data.get('id', 'N/A')} ignorado", "warning")
+            self._confirm_success(cmd_id)  # Confirma como sucesso mas não imprime
+            return None
+            
+        # Aplica configuração apenas a este comando (não altera a config global)
+        printer_config = command.get('printerConfig')
+        if printer_config:
+            print(f"[PROCESSOR] Config da impressora para este comando: {printer_config}")
+            config = config.with_overrides(printer_config)
+            
+        return order_data, print_type, config
+        
+    def _finish_print(self, cmd_id, order_data, print_type, success):
+        """Registra o resultado da impressão e confirma ao backend"""
+        if success:
+            self.on_log(f"✅ Pedido {order_data.get('id', 'N/A')} ({print_type}) impresso com sucesso", "success")
+            self._confirm_success(cmd_id)
+        else:
+            self.on_log(f"❌ Falha ao imprimir pedido {order_data.get('id', 'N/A')} ({print_type})", "error")
+            self._confirm_error(cmd_id, "Falha na impressão")
+            
+    def _archive_ticket(self, order_data, print_type, config, ticket, graphics):
+        """Guarda o ticket impresso no arquivo (falhas não afetam a impressão)"""
+        if self.archive is None or not config.get('archive_enabled', True):
+            return
+        try:
+            self.archive.retention_days = config.get('archive_retention_days', 30)
+            order_id = order_data.get('orderId', order_data.get('id', 'N/A'))
+            self.archive.store(order_id, print_type, config['printer_name'], ticket, graphics, self.tenant.name)
+        except Exception as e:
+            print(f"[ARCHIVE] Erro ao arquivar ticket: {e}")
+            
+    def _reprint(self, command, config):
+        """Reimprime o último ticket arquivado do pedido, sem renderizar de novo"""
+        cmd_id = command.get('commandId', 'unknown')
+        order_id = command.get('orderId') or (command.get('orderData') or {}).get('id')
+        print_type = command.get('printType')
+        if self.archive is None:
+            self._confirm_error(cmd_id, "Arquivo de tickets desabilitado")
+            return
+        entry = self.archive.latest(order_id, print_type, self.tenant.name) if order_id else None
+        if entry is None:
+            self.on_log(f"⚠️ Pedido {order_id} não encontrado no arquivo de tickets", "warning")
+            self._confirm_error(cmd_id, "Ticket não encontrado no arquivo")
+            return
+            
+        meta, ticket = self.archive.load(entry)
+        printer_name = command.get('printerName') or meta.get('printer') or config['printer_name']
+        job_name = f"{self._job_name({'id': order_id}, meta['print_type'])} (reimpressão)"
+        backend = self._get_backend(config)
+        if meta['format'] == 'bitmap':
+            backend.print_image(ticket, printer_name, job_name)
+        else:
+            # Gráficos estáticos que não estão mais na impressora vão antes do ticket
+            missing = [tuple(ref) for ref in meta.get('graphics', [])
+                       if not self.graphics.is_resident(printer_name, *ref)]
+            defines = []
+            for ref in missing:
+                define = self.archive.graphic(*ref)
+                if define is None:
+                    raise ValueError(f"Gráfico {ref[1]} ausente do arquivo de tickets")
+                defines.append(define)
+            if defines:
+                ticket = ticket[:len(ESC_INIT)] + b''.join(defines) + ticket[len(ESC_INIT):]
+            try:
+                backend.print_raw(ticket, printer_name, job_name)
+            except Exception:
+                self.graphics.invalidate(printer_name, ('download',))
+                raise
+            self.graphics.mark_resident(printer_name, missing)
+        self.on_log(f"🔁 Pedido {order_id} ({meta['print_type']}) reimpresso do arquivo", "success")
+        self._confirm_success(cmd_id)
+            
+    @staticmethod
+    def _job_name(order_data, print_type):
+        """Nome do documento no spooler"""
+        return f"Pedido #{order_data.get('orderId', order_data.get('id', 'N/A'))} - {print_type}"
+        
+    def _print_order(self, order_data, print_type, config):
         """Imprime um pedido"""
         try:
-            printer_name = self.config['printer_name']
+            printer_name = config['printer_name']
             order_id = order_data.get('orderId', order_data.get('id', 'N/A'))
             
             print(f"[PRINT] Imprimindo pedido {order_id} - tipo: {print_type}")
             
-            # Gera imagem do recibo
-            img = self._generate_receipt_image(order_data, print_type)
+            backend = self._get_backend(config)
+            job_name = self._job_name(order_data, print_type)
+            ticket, graphics = self._render(order_data, print_type, config)
+            if config.get('force_bitmap', True):
+                # Bitmap via driver (imagem já rotacionada)
+                backend.print_image(ticket, printer_name, job_name)
+            else:
+                # ESC/POS direto, com gráficos estáticos residentes na impressora
+                try:
+                    backend.print_raw(ticket, printer_name, job_name)
+                except Exception:
+                    # A impressora pode ter reiniciado: reenvia os gráficos da RAM na
+                    # próxima vez (os da NV continuam gravados)
+                    self.graphics.invalidate(printer_name, ('download',))
+                    raise
+                self.graphics.mark_resident(printer_name, graphics)
+            self._archive_ticket(order_data, print_type, config, ticket, graphics)
             
-            # Aplica rotação se configurada
-            rotation = self.config.get('rotation_degrees', 0)
-            if rotation and rotation != 0:
-                print(f"[PRINT] Aplicando rotação de {rotation} graus (sentido horário)")
-                # PIL rotate é anti-horário, então invertemos o valor
-                # Para 90° horário (retrato correto), usamos -90 no PIL
-                img = img.rotate(-rotation, expand=True)
+            print(f"[PRINT] ✅ Impressão concluída: {order_id} - {print_type}")
+            return True
             
-            # Imprime via Windows
-            hPrinter = win32print.OpenPrinter(printer_name)
-            try:
-                hDC = win32ui.CreateDC()
-                hDC.CreatePrinterDC(printer_name)
-                
-                hDC.StartDoc(f"Pedido #{order_id} - {print_type}")
-                hDC.StartPage()
-                
-                # Converte PIL Image para bitmap do Windows
-                dib = ImageWin.Dib(img)
-                dib.draw(hDC.GetHandleOutput(), (0, 0, img.width, img.height))
-                
-                hDC.EndPage()
-                hDC.EndDoc()
-                hDC.DeleteDC()
-                
-                print(f"[PRINT] ✅ Impressão concluída: {order_id} - {print_type}")
-                return True
-            finally:
-                win32print.ClosePrinter(hPrinter)
-                
         except Exception as e:
             print(f"[PRINT] ❌ Erro na impressão: {e}")
             self.on_log(f"❌ Erro na impressão: {e}", "error")
             return False
             
-    def _generate_receipt_image(self, order_data, print_type):
-        """Gera imagem do recibo"""
-        # Configurações
-        paper_width = PAPER_WIDTHS[self.config['paper_width']]
-        font_sizes = FONT_SIZES[self.config['text_size']]
-        margin = 16
-        line_spacing = self.config['line_spacing_px']
-        
-        # Carrega fontes com suporte a caracteres acentuados
-        # Tenta usar fontes com melhor suporte a Unicode
-        font_paths = [
-            "C:\\Windows\\Fonts\\seguisb.ttf",  # Segoe UI Bold (melhor para acentos)
-            "C:\\Windows\\Fonts\\segoeui.ttf",  # Segoe UI
-            "C:\\Windows\\Fonts\\arialuni.ttf", # Arial Unicode MS
-            "C:\\Windows\\Fonts\\arial.ttf"     # Arial (fallback)
-        ]
-        
-        font_path = None
-        for path in font_paths:
-            if os.path.exists(path):
-                font_path = path
-                break
+    def render_ticket(self, order_data, print_type, config=None, commit_graphics=False):
+        """Gera o ticket final: imagem rotacionada (bitmap) ou bytes ESC/POS
+
+        No modo ESC/POS, commit_graphics=True marca os gráficos estáticos como
+        residentes sem imprimir (benchmarks do estado estável).
+        """
+        config = config if config is not None else self.config
+        return self._render(order_data, print_type, config, commit_graphics)[0]
+        
+    def _render(self, order_data, print_type, config, commit_graphics=False, in_job=None):
+        """Como render_ticket, mas retorna (ticket, gráficos estáticos usados no modo ESC/POS)
+
+        in_job: gráficos já definidos por tickets anteriores do mesmo job (lotes);
+        recebe os definidos por este ticket.
+        """
+        if not config.get('force_bitmap', True):
+            data, graphics = self._generate_escpos(order_data, print_type, config, in_job)
+            if commit_graphics:
+                self.graphics.mark_resident(config['printer_name'], graphics)
+            return data, graphics
+            
+        img = self._generate_receipt_image(order_data, print_type, config)
         
-        if not font_path:
-            font_path = "C:\\Windows\\Fonts\\arial.ttf"  # Fallback final
+        # Aplica rotação se configurada
+        rotation = config.get('rotation_degrees', 0)
+        if rotation and rotation != 0:
+            print(f"[PRINT] Aplicando rotação de {rotation} graus (sentido horário)")
+            # PIL rotate é anti-horário, então invertemos o valor
+            # Para 90° horário (retrato correto), usamos -90 no PIL
+            img = img.rotate(-rotation, expand=True)
+        return img, []
+            
+    def _render_context(self, config):
+        """Fontes e medidas do ticket, calculadas uma vez por conteúdo da configuração"""
+        if config.base_version != self.render_context_base:
+            # Nova versão da config: chaves das versões anteriores deixam de valer
+            self.render_keys.clear()
+            self.render_context_base = config.base_version
+            
+        key = self.render_keys.get(config.version)
+        if key is None:
+            key = self.render_keys[config.version] = RenderContextCache.key(config)
+            if len(self.render_keys) > self.RENDER_CONTEXT_CACHE_SIZE:
+                self.render_keys.clear()
+        return self.render_cache.get(key, lambda: self._build_render_context(config))
         
-        fonts = {
-            'normal': ImageFont.truetype(font_path, font_sizes['normal'], encoding='unic'),
-            'bold': ImageFont.truetype(font_path, font_sizes['bold'], encoding='unic'),
-            'title': ImageFont.truetype(font_path, font_sizes['title'], encoding='unic'),
-            'header': ImageFont.truetype(font_path, font_sizes['header'], encoding='unic'),
-            'total': ImageFont.truetype(font_path, font_sizes['total'], encoding='unic'),
+    def _build_render_context(self, config):
+        return {
+            'paper_width': PAPER_WIDTHS[config['paper_width']],
+            'line_spacing': config['line_spacing_px'],
+            # Fontes com suporte a caracteres acentuados
+            'fonts': load_receipt_fonts(resolve_font_path(config), config['text_size']),
+            'logo': self._load_logo(config.get('logo_path'), PAPER_WIDTHS[config['paper_width']] - 2 * self.RECEIPT_MARGIN),
+            # Gráficos estáticos renderizados: (versão do template, chave) -> dados
+            'static': {},
+            # QR/códigos de barras desenhados: (tipo, conteúdo) -> imagem
+            'codes': OrderedDict(),
+            # O contexto pode ser usado por várias threads do pool ao mesmo tempo
+            'lock': threading.Lock(),
         }
+            
+    @staticmethod
+    def _load_logo(path, max_width):
+        """Carrega o logo em tons de cinza, reduzido para caber na largura útil"""
+        if not path:
+            return None
+        try:
+            logo = Image.open(path).convert('L')
+            if logo.width > max_width:
+                logo = logo.resize((max_width, max(1, logo.height * max_width // logo.width)))
+            return logo
+        except Exception as e:
+            print(f"[PRINT] ⚠️ Erro ao carregar logo {path}: {e}")
+            return None
+            
+    def _layout_lines(self, lines, context):
+        """Quebra as linhas na largura útil do papel e calcula as posições
         
-        # Cria imagem temporária para calcular altura
-        temp_img = Image.new('RGB', (paper_width, 1), 'white')
-        temp_draw = ImageDraw.Draw(temp_img)
-        
-        # Monta conteúdo
-        lines = []
+        Entradas: (alinhamento, texto, fonte, prefixo do recuo pendente).
+        Retorna ([(x, deslocamento y, texto ou imagem, fonte, avanço vertical)], altura total).
+        """
+        paper_width = context['paper_width']
+        margin = self.RECEIPT_MARGIN
+        line_spacing = context['line_spacing']
+        fonts = context['fonts']
+        available = paper_width - 2 * margin
+        layout = []
+        height = 0
+        for align, text, font_key, hang_prefix in lines:
+            if align == 'logo':
+                logo = context['logo']
+                if logo is not None:
+                    layout.append(((paper_width - logo.width) // 2, 0, logo, None, logo.height + line_spacing))
+                    height += logo.height + line_spacing
+                continue
+                
+            font = fonts[font_key]
+            if align == 'rule':
+                # Separador ocupa só a altura do traço: desenha compensando o topo
+                line, width = text_layout.fit(text, font, available)
+                top, ink_height = text_layout.ink_box(font, line)
+                advance = ink_height + line_spacing
+                layout.append(((paper_width - int(width)) // 2, -top, line, font, advance))
+                height += advance
+                continue
+                
+            hang = text_layout.text_width(font, hang_prefix) if hang_prefix else 0
+            advance = text_layout.line_height(font) + line_spacing
+            for offset, line, width in text_layout.wrap(text, font, available, hang):
+                if align == 'center':
+                    x = (paper_width - int(width)) // 2
+                elif align == 'right':
+                    x = paper_width - int(width) - margin
+                else:  # left
+                    x = margin + int(offset)
+                layout.append((x, 0, line, font, advance))
+                height += advance
+        return layout, height
         
-        # Cabeçalho
-        lines.append(('center', 'Edienai Lanches', fonts['title']))
-        lines.append(('center', '-' * 32, fonts['normal']))
+    def _draw_block(self, lines, context):
+        """Desenha um bloco de linhas em uma imagem da largura do papel"""
+        layout, height = self._layout_lines(lines, context)
+        img = Image.new('L', (context['paper_width'], max(height, 1)), 255)
+        draw = ImageDraw.Draw(img)
+        y = 0
+        for x, dy, content, font, advance in layout:
+            if font is None:
+                img.paste(content, (x, y + dy))
+            else:
+                draw.text((x, y + dy), content, font=font, fill=0)
+            y += advance
+        return img
         
-        if print_type == 'kitchen':
-            lines.append(('center', '--- PEDIDO PARA COZINHA ---', fonts['bold']))
-        else:
-            lines.append(('center', '--- COMPROVANTE DE PEDIDO ---', fonts['bold']))
-            
-        lines.append(('center', '-' * 32, fonts['normal']))
-        
-        # Informações do pedido
-        order_id = order_data.get('orderId', order_data.get('id', 'N/A'))
-        lines.append(('left', f"Pedido #: {order_id}", fonts['normal']))
-        # Garante que o nome do cliente seja string UTF-8
-        customer_name = str(order_data.get('customerName', 'N/A'))
-        lines.append(('left', f"Cliente: {customer_name}", fonts['normal']))
-        
-        delivery_option = order_data.get('deliveryOption', {})
-        delivery_type = delivery_option.get('type', 'N/A')
-        lines.append(('left', f"Tipo: {delivery_type}", fonts['normal']))
-        
-        if delivery_type == 'No Local':
-            table = delivery_option.get('tableNumber', 'N/A')
-            lines.append(('left', f"Mesa: {table}", fonts['normal']))
-        elif delivery_type == 'Entrega':
-            address = delivery_option.get('address', 'N/A')
-            lines.append(('left', f"Endereço: {address}", fonts['normal']))
-            
-        # Data
-        sent_at = order_data.get('sentAt')
-        if sent_at:
-            if isinstance(sent_at, str):
-                dt = datetime.fromisoformat(sent_at.replace('Z', '+00:00'))
+    @staticmethod
+    def _split_segments(lines):
+        """Separa as linhas em blocos dinâmicos, blocos 'static' e QR/códigos de barras"""
+        segments = []
+        current = []
+        for entry in lines:
+            if entry[0] in ('static', 'qr', 'barcode'):
+                if current:
+                    segments.append(('lines', current))
+                    current = []
+                if entry[1]:
+                    segments.append((entry[0], entry[1]))
             else:
-                dt = datetime.now()
-            lines.append(('left', f"Data: {dt.strftime('%d/%m/%Y %H:%M')}", fonts['normal']))
-            
-        lines.append(('center', '-' * 32, fonts['normal']))
-        lines.append(('left', 'ITENS:', fonts['header']))
+                current.append(entry)
+        if current:
+            segments.append(('lines', current))
+        return segments
         
-        # Itens
-        for item in order_data.get('items', []):
-            # Garante que todos os textos sejam strings UTF-8
-            name = str(item.get('name', 'Item'))
-            qty = item.get('quantity', 1)
-            price = item.get('totalItemPrice', 0)
+    def _static_graphic(self, template, key, context):
+        """Bloco 'static' renderizado uma vez por versão de config e de template"""
+        cache_key = (template.version, key)
+        graphic = context['static'].get(cache_key)
+        if graphic is None:
+            img = self._draw_block(template.static_blocks[key], context)
+            graphic = {
+                'image': img,
+                'raster': escpos_raster(img),
+                # Impressão digital do conteúdo: muda com fonte, papel, logo ou template
+                'fingerprint': hashlib.sha1(escpos_bits(img)[2] + struct.pack('<HH', img.width, img.height)).hexdigest()[:16],
+            }
+            context['static'][cache_key] = graphic
+        return graphic
+        
+    def _code_graphic(self, kind, payload, context):
+        """QR ou código de barras desenhado na largura do papel (centralizado)
+        
+        Sem a biblioteca 'qrcode', ou se o símbolo não couber no papel, o
+        conteúdo é impresso como texto.
+        """
+        codes = context['codes']
+        with context['lock']:
+            img = codes.get((kind, payload))
+            if img is not None:
+                codes.move_to_end((kind, payload))
+                return img
             
-            lines.append(('left', f"{qty}x {name}", fonts['bold']))
+        paper_width = context['paper_width']
+        available = paper_width - 2 * self.RECEIPT_MARGIN
+        symbol = None
+        try:
+            if kind == 'qr':
+                symbol = render_qr(payload, available)
+            else:
+                module = min(BARCODE_MAX_MODULE, available // (sum(code128_widths(payload)) + 2 * BARCODE_QUIET_ZONE))
+                if module >= 1:
+                    symbol = render_barcode(payload, module)
+        except ValueError as e:
+            print(f"[PRINT] ⚠️ {e}")
             
-            # Complementos
-            for comp in item.get('complements', []):
-                comp_name = str(comp.get('name', 'Comp'))
-                lines.append(('left', f"  - {comp_name}", fonts['normal']))
-                
-            # Observações
-            notes = item.get('notes') or item.get('observations')
-            if notes:
-                notes = str(notes)
-                lines.append(('left', f"  OBS: {notes}", fonts['normal']))
-                
-            if print_type != 'kitchen':
-                lines.append(('right', f"Subtotal: R$ {price:.2f}".replace('.', ','), fonts['normal']))
-                
-        # Total
-        lines.append(('center', '-' * 32, fonts['normal']))
-        
-        if print_type != 'kitchen':
-            total = order_data.get('total', 0)
-            lines.append(('right', f"TOTAL: R$ {total:.2f}".replace('.', ','), fonts['total']))
-            lines.append(('left', f"Pagamento: {order_data.get('paymentMethod', 'N/A')}", fonts['normal']))
-            
-            troco_para = order_data.get('trocoPara')
-            if troco_para:
-                troco = float(troco_para) - float(total)
-                lines.append(('left', f"Troco para: R$ {troco_para:.2f}".replace('.', ','), fonts['normal']))
-                lines.append(('left', f"Troco: R$ {max(0, troco):.2f}".replace('.', ','), fonts['normal']))
+        if symbol is None:
+            img = self._draw_block([('center', payload, 'normal', '')], context)
+        else:
+            caption = [('center', payload, 'normal', '')] if kind == 'barcode' else []
+            text = self._draw_block(caption, context) if caption else None
+            spacing = context['line_spacing']
+            height = spacing + symbol.height + spacing + (text.height if text else 0)
+            img = Image.new('L', (paper_width, height), 255)
+            img.paste(symbol, ((paper_width - symbol.width) // 2, spacing))
+            if text:
+                img.paste(text, (0, spacing + symbol.height + spacing))
                 
-        lines.append(('center', '-' * 32, fonts['normal']))
+        with context['lock']:
+            codes[(kind, payload)] = img
+            if len(codes) > self.CODE_GRAPHIC_CACHE_SIZE:
+                codes.popitem(last=False)
+        return img
         
-        if print_type == 'kitchen':
-            lines.append(('center', 'Bom trabalho!', fonts['normal']))
-        else:
-            lines.append(('center', 'Obrigado pelo seu pedido!', fonts['normal']))
+    def _escpos_code(self, kind, payload, context):
+        """Comando nativo do QR/código de barras, ou None se não couber nos limites do comando"""
+        available = context['paper_width'] - 2 * self.RECEIPT_MARGIN
+        try:
+            if kind == 'qr':
+                modules = qr_module_count(payload)
+                module = min(QR_MODULE_DOTS, available // (modules + 2 * QR_QUIET_ZONE)) if modules else 0
+                return escpos_qr(payload, module) if module >= 1 else None
+            if len(payload) > 250:
+                return None
+            # GS w aceita barras de 2 a 6 pontos
+            module = min(BARCODE_MAX_MODULE, available // (sum(code128_widths(payload)) + 2 * BARCODE_QUIET_ZONE))
+            return escpos_barcode(payload, module) if module >= 2 else None
+        except ValueError:
+            return None
             
-        # Calcula altura total
-        y = margin
-        for align, text, font in lines:
-            bbox = temp_draw.textbbox((0, 0), text, font=font)
-            line_height = bbox[3] - bbox[1]
-            y += line_height + line_spacing
+    def _render_segments(self, order_data, print_type, config):
+        """Executa o template e separa o resultado em blocos dinâmicos e estáticos"""
+        context = self._render_context(config)
+        template = load_receipt_template(config.get('template_path'))
+        lines = template.render(build_order_view(order_data, print_type, config))
+        return context, template, self._split_segments(lines)
             
-        y += margin + 100  # Margem inferior + espaço para corte
-        
-        # Cria imagem final
-        img = Image.new('RGB', (paper_width, y), 'white')
-        draw = ImageDraw.Draw(img)
+    def _generate_receipt_image(self, order_data, print_type, config):
+        """Gera imagem do recibo"""
+        context, template, segments = self._render_segments(order_data, print_type, config)
+        blocks = []
+        for kind, value in segments:
+            if kind == 'static':
+                blocks.append(self._static_graphic(template, value, context)['image'])
+            elif kind == 'lines':
+                blocks.append(self._draw_block(value, context))
+            else:
+                blocks.append(self._code_graphic(kind, value, context))
         
-        # Desenha conteúdo
+        # Margens superior e inferior + espaço para corte
+        margin = self.RECEIPT_MARGIN
+        height = margin + sum(block.height for block in blocks) + margin + self.RECEIPT_CUT_SPACE
+        img = Image.new('RGB', (context['paper_width'], height), 'white')
         y = margin
-        for align, text, font in lines:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-            
-            if align == 'center':
-                x = (paper_width - text_width) // 2
-            elif align == 'right':
-                x = paper_width - text_width - margin
-            else:  # left
-                x = margin
+        for block in blocks:
+            img.paste(block, (0, y))
+            y += block.height
+        return img
+        
+    def _generate_escpos(self, order_data, print_type, config, in_job=None):
+        """Gera o ticket em ESC/POS; blocos 'static' vão para a memória de gráficos
+        
+        Retorna (bytes, graphics) - graphics lista os gráficos usados pelo job
+        (memória, código, hash), que só devem ser marcados como residentes após
+        a impressão ter sucesso; também é guardada no arquivo de tickets.
+        Gráficos em in_job (definidos antes no mesmo job) não são reenviados.
+        """
+        context, template, segments = self._render_segments(order_data, print_type, config)
+        printer_name = config['printer_name']
+        memory = config.get('header_graphics', 'nv')
+        
+        native_codes = config.get('native_codes', True)
+        
+        out = bytearray(ESC_INIT)
+        uploads = in_job if in_job is not None else set()
+        graphics = []
+        for kind, value in segments:
+            if kind == 'lines':
+                out += escpos_raster(self._draw_block(value, context))
+                continue
+            if kind in ('qr', 'barcode'):
+                command = self._escpos_code(kind, value, context) if native_codes else None
+                if command is None:
+                    out += escpos_raster(self._code_graphic(kind, value, context))
+                else:
+                    # Espaço acima/abaixo do símbolo (ESC J n avança n pontos)
+                    feed = b'\x1bJ' + bytes([min(255, context['line_spacing'])])
+                    out += feed + ESC_ALIGN_CENTER + command + feed + ESC_ALIGN_LEFT
+                continue
+                
+            graphic = self._static_graphic(template, value, context)
+            if memory not in ESCPOS_GRAPHICS_FUNCTIONS:
+                out += graphic['raster']
+                continue
                 
-            # Garante que o texto seja string e desenha com encoding correto
-            text_str = str(text) if not isinstance(text, str) else text
-            draw.text((x, y), text_str, font=font, fill='black')
-            y += line_height + line_spacing
+            code = self.graphics.key_code(printer_name, value)
+            fingerprint = graphic['fingerprint']
+            ref = (memory, code, fingerprint)
+            define = None
+            if not self.graphics.is_resident(printer_name, memory, code, fingerprint) and ref not in uploads:
+                print(f"[GRAPHICS] Enviando gráfico '{value}' ({code}) para a memória {memory} de {printer_name}")
+                define = escpos_define_graphic(code, graphic['image'], memory)
+                out += define
+                uploads.add(ref)
+            if self.archive is not None and not self.archive.has_graphic(*ref):
+                # Reimpressões do arquivo reenviam o gráfico se ele não estiver mais residente
+                self.archive.add_graphic(*ref, define or escpos_define_graphic(code, graphic['image'], memory))
+            if ref not in graphics:
+                graphics.append(ref)
+            out += ESC_ALIGN_CENTER + escpos_print_graphic(code, memory) + ESC_ALIGN_LEFT
             
-        return img
+        out += ESC_FEED_BEFORE_CUT + ESCPOS_CUT
+        return bytes(out), graphics
         
     def _confirm_success(self, command_id):
         """Confirma sucesso da impressão"""
+        if self.coordinator is not None:
+            self.coordinator.mark_handled(command_id)
         threading.Thread(target=self._async_confirm, args=(command_id, 'completed', 'Impressão concluída'), daemon=True).start()
         
     def _confirm_error(self, command_id, error_msg):
         """Confirma erro na impressão"""
+        if self.coordinator is not None:
+            self.coordinator.mark_handled(command_id)
         threading.Thread(target=self._async_confirm, args=(command_id, 'failed', error_msg), daemon=True).start()
         
     def _async_confirm(self, command_id, status, message):
         """Envia confirmação de forma assíncrona"""
         try:
             self.session.post(
-                f"{WORKERS_BASE_URL}/api/print/confirm",
+                f"{self.tenant.base_url}/api/print/confirm",
                 headers={
-                    'X-User-Role': AUTH_ROLE,
-                    'X-User-Pin': AUTH_PIN,
+                    'X-User-Role': self.tenant.role,
+                    'X-User-Pin': self.tenant.pin,
                     'Content-Type': 'application/json'
                 },
                 json={
@@ -796,15 +3792,245 @@ class PrintCommandProcessor:
         except Exception as e:
             print(f"Erro ao confirmar: {e}")
 
+# ============================================================================
+# LOJAS (VÁRIAS LOJAS EM UM PROCESSO)
+# ============================================================================
+
+# Formato do tenants.json:
+#   {"tenants": [{"name": "centro", "workers_url": "https://...", "role": "owner",
+#                 "pin": "1234", "config": {"printer_backend": "network",
+#                                           "printer_name": "192.168.0.50:9100"}}]}
+# Cada loja tem streams, deduplicação, snapshots de pedidos e configuração
+# (config-<nome>.json; as chaves de "config" sempre prevalecem) próprios. A
+# sessão HTTP, os caches de fontes/templates, o registro de gráficos, o
+# arquivo de tickets e as threads de impressão são compartilhados.
+
+TENANTS_FILE = os.path.join(APPDATA_DIR, 'tenants.json')
+PRINT_WORKERS = 2   # Threads de impressão compartilhadas entre as lojas
+
+
+class Tenant:
+    """Loja atendida pelo processo: endpoint do worker, credenciais e config própria"""
+
+    def __init__(self, name, base_url, role, pin, config=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.role = role
+        self.pin = pin
+        self.config = dict(config or {})
+
+    @classmethod
+    def default(cls):
+        """Loja única do modo tradicional (constantes do módulo)"""
+        return cls('', WORKERS_BASE_URL, AUTH_ROLE, AUTH_PIN)
+
+    @property
+    def label(self):
+        return self.name or 'principal'
+
+    def url(self, path):
+        """URL autenticada de um endpoint do worker"""
+        return f"{self.base_url}{path}?role={self.role}&pin={self.pin}"
+
+    def tag(self, name):
+        """Nome de stream/log identificando a loja ('centro SSE')"""
+        return f"{self.name} {name}" if self.name else name
+
+    def config_path(self):
+        safe_name = re.sub(r'[^\w-]+', '_', self.name)
+        return os.path.join(APPDATA_DIR, f"config-{safe_name}.json") if self.name else CONFIG_FILE
+
+
+def load_tenants(path=TENANTS_FILE):
+    """Lê os perfis de loja; lista vazia se o arquivo não existir"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    tenants = []
+    for entry in data.get('tenants', []):
+        name = entry.get('name')
+        if not name or any(tenant.name == name for tenant in tenants):
+            raise ValueError(f"Nome de loja ausente ou repetido em {path}: {name!r}")
+        tenants.append(Tenant(
+            name,
+            entry.get('workers_url', WORKERS_BASE_URL),
+            entry.get('role', AUTH_ROLE),
+            entry['pin'],
+            entry.get('config'),
+        ))
+    return tenants
+
+
+class PrintWorkerPool:
+    """Threads de impressão compartilhadas pelos processadores de todas as lojas
+
+    Um processador com comandos pendentes entra na fila do pool e é atendido
+    por uma thread de cada vez (ordem preservada por loja); impressoras
+    lentas de uma loja ocupam uma thread sem travar as demais.
+    """
+
+    def __init__(self, workers=PRINT_WORKERS):
+        self.workers = workers
+        self.ready = queue.Queue()
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"print-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for _ in self.threads:
+            self.ready.put(None)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+    def schedule(self, processor):
+        self.ready.put(processor)
+
+    def _run(self):
+        while True:
+            processor = self.ready.get()
+            if processor is None:
+                return
+            processor.run_pending()
+
+
+class TenantRuntime:
+    """Componentes próprios de uma loja, ligados ao núcleo compartilhado do TenantHost"""
+
+    def __init__(self, tenant, host, backend=None, on_log=None):
+        self.tenant = tenant
+        if host.persist:
+            self.config_store = ConfigStore(path=tenant.config_path(), overrides=tenant.config)
+        else:
+            self.config_store = ConfigStore.in_memory({**DEFAULT_CONFIG, **tenant.config})
+        self.on_log = on_log or self._print_log
+        self.processor = PrintCommandProcessor(
+            self.config_store, self.on_log, backend=backend, graphics=host.graphics,
+            connections=host.connections, archive=host.archive, tenant=tenant, pool=host.pool,
+            render_cache=host.render_cache, coordinator=create_coordinator(self.config_store.current, tenant))
+        self.ingestion = IngestionChannel(
+            on_command_callback=self.processor.enqueue,
+            on_new_order_callback=self.processor.enqueue_order_auto_print,
+            on_order_update_callback=self.processor.enqueue_order_addendum,
+        )
+        self.sse_client = PrinterSSEClient(self.ingestion, self._status, host.connections, tenant)
+        self.orders_client = OrdersSSEClient(self.ingestion, self._status, host.connections, tenant)
+
+    def _print_log(self, message, level="info", order_id=None):
+        print(f"[{self.tenant.label}] {message}")
+
+    def _status(self, status):
+        self.on_log(status, "info")
+
+    def start(self):
+        self.config_store.start_watching()
+        self.processor.start()
+        self.ingestion.start()
+        self.sse_client.start()
+        self.orders_client.start()
+        self.on_log(f"🚀 Loja {self.tenant.label} escutando {self.tenant.base_url}", "success")
+
+    def stop(self):
+        self.sse_client.stop()
+        self.orders_client.stop()
+        self.ingestion.stop()
+        self.processor.stop()
+        self.config_store.stop_watching()
+
+
+class TenantHost:
+    """Núcleo compartilhado (rede, gráficos, arquivo, threads de impressão) e as lojas atendidas
+
+    persist=False mantém config, gráficos e arquivo só em memória (harness).
+    """
+
+    def __init__(self, workers=PRINT_WORKERS, persist=True, connections=None):
+        self.persist = persist
+        self.connections = connections or ConnectionManager.shared()
+        self.pool = PrintWorkerPool(workers)
+        self.render_cache = RenderContextCache(PrintCommandProcessor.RENDER_CONTEXT_CACHE_SIZE)
+        self.graphics = GraphicsRegistry(GRAPHICS_FILE if persist else None)
+        self.archive = None
+        if persist:
+            try:
+                self.archive = TicketArchive(ARCHIVE_DIR)
+            except Exception as e:
+                print(f"[ARCHIVE] Arquivo de tickets indisponível: {e}")
+        self.tenants = OrderedDict()   # nome -> TenantRuntime
+
+    def add(self, tenant, backend=None, on_log=None):
+        if tenant.name in self.tenants:
+            raise ValueError(f"Loja repetida: {tenant.label}")
+        runtime = TenantRuntime(tenant, self, backend, on_log)
+        self.tenants[tenant.name] = runtime
+        return runtime
+
+    def start(self):
+        self.pool.start()
+        for runtime in self.tenants.values():
+            runtime.start()
+
+    def stop(self):
+        for runtime in self.tenants.values():
+            runtime.stop()
+        self.pool.stop()
+
+
+def run_headless(tenants_path=TENANTS_FILE, workers=PRINT_WORKERS):
+    """Modo sem interface: atende todas as lojas do tenants.json até Ctrl+C/SIGTERM"""
+    tenants = load_tenants(tenants_path) or [Tenant.default()]
+    host = TenantHost(workers, connections=ConnectionManager(tenants=len(tenants)))
+    for tenant in tenants:
+        host.add(tenant)
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+    host.start()
+    print(f"[HOST] {len(tenants)} loja(s) em execução ({workers} threads de impressão)")
+    while not stopping.wait(1):
+        pass
+    print("[HOST] Encerrando...")
+    host.stop()
+    return 0
+
 # ============================================================================
 # INTERFACE GRÁFICA
 # ============================================================================
 
+# Log da interface: as threads de trabalho só enfileiram mensagens; o Tk
+# drena a fila em lotes via root.after e redesenha uma única vez por lote
+LOG_BUFFER_SIZE = 5000        # Entradas mantidas em memória (para filtros)
+LOG_VIEW_MAX_LINES = 500      # Linhas visíveis no widget
+LOG_DRAIN_INTERVAL_MS = 100   # Intervalo entre drenagens da fila
+LOG_DRAIN_BATCH = 1000        # Máximo de mensagens por drenagem
+LOG_LEVELS = ['todos', 'info', 'success', 'warning', 'error']
+LOG_LEVEL_COLORS = {
+    'info': '#000000',
+    'success': '#1b7f2a',
+    'warning': '#b26a00',
+    'error': '#c62828',
+}
+
+# Extrai o ID do pedido de mensagens como "Pedido 123 ..." ou "Pedido #: 123";
+# o ID precisa ter ao menos um dígito (UUID, número ou "sim-000001"), para que
+# "Pedido recebido" não seja tomado como pedido "recebido"
+ORDER_ID_PATTERN = re.compile(r'pedido\s*#?:?\s*((?=[\w-]*\d)[\w-]+)', re.IGNORECASE)
+
 class PrinterClientApp:
     """Aplicação principal"""
     
     def __init__(self):
-        self.config = load_config()
+        # Configuração versionada compartilhada pela interface e pelo processador
+        self.config_store = ConfigStore()
+        self.config_store.add_listener(self._on_config_changed)
+        self.config_store.start_watching()
         
         # Cria janela
         ctk.set_appearance_mode("dark")
@@ -814,27 +4040,40 @@ class PrinterClientApp:
         self.root.title("Edienai Printer Client - Tempo Real")
         self.root.geometry("800x600")
         
+        # Canal de log thread-safe (drenado pelo Tk em lotes)
+        self.log_queue = queue.Queue()
+        self.log_entries = deque(maxlen=LOG_BUFFER_SIZE)
+        self.log_view_lines = 0
+        self.log_after = None
+        self.pending_status = None
+        self.pending_info = None
+        
         # Layout principal
         self._create_ui()
+        self.log_after = self.root.after(LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
         
         # Componentes de backend
-        self.processor = PrintCommandProcessor(self.config, self.log)
+        self.processor = PrintCommandProcessor(self.config_store, self.log,
+                                               coordinator=create_coordinator(self.config, Tenant.default()))
         
-        # Cliente SSE para comandos manuais (API print)
-        self.sse_client = PrinterSSEClient(
+        # Canal único de eventos: deduplica e despacha para o processador
+        self.ingestion = IngestionChannel(
             on_command_callback=self.processor.enqueue,
-            on_status_callback=self.update_status
+            on_new_order_callback=self.processor.enqueue_order_auto_print,
+            on_order_update_callback=self.processor.enqueue_order_addendum
         )
         
+        # Cliente SSE para comandos manuais (API print)
+        self.sse_client = PrinterSSEClient(self.ingestion, on_status_callback=self.update_status)
+        
         # Cliente SSE para pedidos em tempo real (NOVO)
-        self.orders_client = OrdersSSEClient(
-            on_new_order_callback=self.processor.enqueue_order_auto_print,
-            on_status_callback=self.update_orders_status
-        )
+        self.orders_client = OrdersSSEClient(self.ingestion, on_status_callback=self.update_orders_status)
         
         # Inicia automaticamente
         self.processor.start()
         self.log("✅ Processador de comandos iniciado", "success")
+        
+        self.ingestion.start()
 
         self.sse_client.start()
         self.log("✅ Cliente SSE (comandos manuais) iniciado", "success")
@@ -865,45 +4104,155 @@ class PrinterClientApp:
 
         ctk.CTkLabel(log_frame, text="Log de Atividades", font=("Arial", 16, "bold")).pack(pady=5)
 
+        # Filtros do log (nível e ID do pedido)
+        filter_frame = ctk.CTkFrame(log_frame)
+        filter_frame.pack(fill="x", padx=5)
+
+        ctk.CTkLabel(filter_frame, text="Nível:", font=("Arial", 12)).pack(side="left", padx=5)
+        self.log_level_var = tk.StringVar(value='todos')
+        ctk.CTkOptionMenu(filter_frame, variable=self.log_level_var, values=LOG_LEVELS, width=120,
+                          command=lambda _: self._refresh_log_view()).pack(side="left", padx=5)
+
+        ctk.CTkLabel(filter_frame, text="Pedido:", font=("Arial", 12)).pack(side="left", padx=5)
+        self.log_order_var = tk.StringVar(value='')
+        self.log_order_var.trace_add('write', lambda *_: self._refresh_log_view())
+        ctk.CTkEntry(filter_frame, textvariable=self.log_order_var, width=160).pack(side="left", padx=5)
+        ctk.CTkButton(filter_frame, text="🔁 Reimprimir", command=self.reprint_order, width=120).pack(side="left", padx=5)
+
         self.log_text = scrolledtext.ScrolledText(log_frame, height=20, font=("Consolas", 10))
         self.log_text.pack(fill="both", expand=True, padx=5, pady=5)
+        for level, color in LOG_LEVEL_COLORS.items():
+            self.log_text.tag_config(level, foreground=color)
 
         # Frame inferior - Informações
         info_frame = ctk.CTkFrame(self.root)
         info_frame.pack(fill="x", padx=10, pady=10)
 
-        auto_status = f" | Cliente: {'✓' if self.config.get('auto_print_client', True) else '✗'} | Cozinha: {'✓' if self.config.get('auto_print_kitchen', True) else '✗'}"
-        info_text = f"Impressora: {self.config['printer_name']} | Papel: {self.config['paper_width']} | Texto: {self.config['text_size']}{auto_status}"
-        self.info_label = ctk.CTkLabel(info_frame, text=info_text, font=("Arial", 10))
+        self.info_label = ctk.CTkLabel(info_frame, text=self._info_text(self.config), font=("Arial", 10))
         self.info_label.pack(pady=5)
 
+    @property
+    def config(self):
+        """Snapshot atual da configuração"""
+        return self.config_store.current
+
+    def _info_text(self, config):
+        """Texto da barra de informações"""
+        auto_status = f" | Cliente: {'✓' if config.get('auto_print_client', True) else '✗'} | Cozinha: {'✓' if config.get('auto_print_kitchen', True) else '✗'}"
+        return f"Impressora: {config['printer_name']} | Papel: {config['paper_width']} | Texto: {config['text_size']}{auto_status}"
+
+    def _on_config_changed(self, snapshot):
+        """Nova versão da config (qualquer thread) - a barra é atualizada na drenagem do log"""
+        self.pending_info = snapshot
+
     def update_status(self, status):
-        """Atualiza status da conexão (API Print)"""
-        self.status_label.configure(text=status)
+        """Atualiza status da conexão (API Print) - seguro para chamar de qualquer thread"""
+        self.pending_status = status
         self.log(status, "info")
 
     def update_orders_status(self, status):
         """Atualiza status da conexão de pedidos"""
         self.log(f"📱 [Pedidos SSE] {status}", "info")
 
-    def log(self, message, level="info"):
-        """Adiciona mensagem ao log"""
+    def log(self, message, level="info", order_id=None):
+        """Adiciona mensagem ao log - seguro para chamar de qualquer thread"""
+        if order_id is None:
+            match = ORDER_ID_PATTERN.search(message)
+            order_id = match.group(1) if match else None
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_msg = f"[{timestamp}] {message}\n"
+        self.log_queue.put((timestamp, level, str(order_id) if order_id else '', message))
+
+    def _drain_log_queue(self):
+        """Drena a fila de log em lote e redesenha o widget uma única vez"""
+        batch = []
+        try:
+            while len(batch) < LOG_DRAIN_BATCH:
+                batch.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        status = self.pending_status
+        if status is not None:
+            self.pending_status = None
+            self.status_label.configure(text=status)
 
-        self.log_text.insert("end", log_msg)
+        info = self.pending_info
+        if info is not None:
+            self.pending_info = None
+            self.info_label.configure(text=self._info_text(info))
+
+        if batch:
+            self.log_entries.extend(batch)
+            visible = [entry for entry in batch if self._log_entry_matches(entry)]
+            if visible:
+                self._append_log_view(visible)
+
+        # Se ainda há mensagens pendentes (rajada), drena logo em seguida
+        delay = 1 if not self.log_queue.empty() else LOG_DRAIN_INTERVAL_MS
+        self.log_after = self.root.after(delay, self._drain_log_queue)
+
+    def _log_entry_matches(self, entry):
+        """Verifica se a entrada passa pelos filtros de nível e pedido"""
+        _, level, order_id, _ = entry
+        level_filter = self.log_level_var.get()
+        if level_filter != 'todos' and level != level_filter:
+            return False
+        order_filter = self.log_order_var.get().strip()
+        if order_filter and order_filter not in order_id:
+            return False
+        return True
+
+    def _append_log_view(self, entries):
+        """Acrescenta entradas ao widget mantendo no máximo LOG_VIEW_MAX_LINES linhas"""
+        entries = entries[-LOG_VIEW_MAX_LINES:]
+        at_bottom = self.log_text.yview()[1] >= 0.999
+
+        # Uma única chamada insert com pares (texto, tag) para todo o lote
+        args = []
+        for timestamp, level, _, message in entries:
+            args.extend((f"[{timestamp}] {message}\n", level))
+        self.log_text.insert("end", *args)
+        # Mensagens podem ter várias linhas: conta linhas do widget, não entradas
+        self.log_view_lines += sum(message.count('\n') + 1 for _, _, _, message in entries)
+
+        # Remove as linhas excedentes do topo (buffer circular)
+        excess = self.log_view_lines - LOG_VIEW_MAX_LINES
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_view_lines = LOG_VIEW_MAX_LINES
+
+        if at_bottom:
+            self.log_text.see("end")
+
+    def _refresh_log_view(self):
+        """Redesenha o log inteiro a partir do buffer aplicando os filtros atuais"""
+        self.log_text.delete('1.0', 'end')
+        self.log_view_lines = 0
+        visible = [entry for entry in self.log_entries if self._log_entry_matches(entry)]
+        if visible:
+            self._append_log_view(visible)
         self.log_text.see("end")
 
-        # Limita tamanho do log
-        lines = int(self.log_text.index('end-1c').split('.')[0])
-        if lines > 500:
-            self.log_text.delete('1.0', '100.0')
+    def reprint_order(self):
+        """Reimprime do arquivo o último ticket do pedido digitado no filtro"""
+        order_id = self.log_order_var.get().strip()
+        if not order_id:
+            messagebox.showinfo("Reimprimir", "Digite o ID do pedido no campo 'Pedido'")
+            return
+        self.processor.enqueue({
+            'commandId': f"{order_id}_reprint_{int(time.time() * 1000)}",
+            'type': 'reprint',
+            'orderId': order_id,
+            'local': True,   # Pedido deste PC: não passa pela coordenação entre clientes
+            'timestamp': time.time()
+        })
 
     def open_settings(self):
         """Abre diálogo de configurações"""
+        config = self.config
         settings_window = ctk.CTkToplevel(self.root)
         settings_window.title("Configurações")
-        settings_window.geometry("500x550")
+        settings_window.geometry("500x590")
         settings_window.transient(self.root)
         settings_window.grab_set()
 
@@ -914,30 +4263,30 @@ class PrinterClientApp:
         # Impressora
         ctk.CTkLabel(container, text="Nome da Impressora:", font=("Arial", 12, "bold")).grid(row=0, column=0, sticky="w", pady=10)
         printer_entry = ctk.CTkEntry(container, width=300)
-        printer_entry.insert(0, self.config['printer_name'])
+        printer_entry.insert(0, config['printer_name'])
         printer_entry.grid(row=0, column=1, pady=10)
 
         # Largura do papel
         ctk.CTkLabel(container, text="Largura do Papel:", font=("Arial", 12, "bold")).grid(row=1, column=0, sticky="w", pady=10)
-        paper_var = tk.StringVar(value=self.config['paper_width'])
+        paper_var = tk.StringVar(value=config['paper_width'])
         paper_menu = ctk.CTkOptionMenu(container, variable=paper_var, values=["58mm", "72mm", "80mm"], width=300)
         paper_menu.grid(row=1, column=1, pady=10)
 
         # Tamanho do texto
         ctk.CTkLabel(container, text="Tamanho do Texto:", font=("Arial", 12, "bold")).grid(row=2, column=0, sticky="w", pady=10)
-        text_var = tk.StringVar(value=self.config['text_size'])
+        text_var = tk.StringVar(value=config['text_size'])
         text_menu = ctk.CTkOptionMenu(container, variable=text_var, values=["pequeno", "normal", "grande", "extra"], width=300)
         text_menu.grid(row=2, column=1, pady=10)
 
         # Espaçamento
         ctk.CTkLabel(container, text="Espaçamento (px):", font=("Arial", 12, "bold")).grid(row=3, column=0, sticky="w", pady=10)
         spacing_entry = ctk.CTkEntry(container, width=300)
-        spacing_entry.insert(0, str(self.config['line_spacing_px']))
+        spacing_entry.insert(0, str(config['line_spacing_px']))
         spacing_entry.grid(row=3, column=1, pady=10)
 
         # Rotação
         ctk.CTkLabel(container, text="Rotação (graus):", font=("Arial", 12, "bold")).grid(row=4, column=0, sticky="w", pady=10)
-        rotation_var = tk.StringVar(value=str(self.config.get('rotation_degrees', 90)))
+        rotation_var = tk.StringVar(value=str(config.get('rotation_degrees', 90)))
         rotation_menu = ctk.CTkOptionMenu(container, variable=rotation_var, values=["0", "90", "180", "270"], width=300)
         rotation_menu.grid(row=4, column=1, pady=10)
 
@@ -947,31 +4296,37 @@ class PrinterClientApp:
         # Toggle de impressão automática - Cliente
         ctk.CTkLabel(container, text="Impressão Automática:", font=("Arial", 12, "bold")).grid(row=6, column=0, sticky="w", pady=5)
 
-        auto_client_var = tk.BooleanVar(value=self.config.get('auto_print_client', True))
+        auto_client_var = tk.BooleanVar(value=config.get('auto_print_client', True))
         auto_client_switch = ctk.CTkSwitch(container, text="Imprimir Cliente", variable=auto_client_var, font=("Arial", 11))
         auto_client_switch.grid(row=7, column=0, columnspan=2, sticky="w", pady=5, padx=10)
 
         # Toggle de impressão automática - Cozinha
-        auto_kitchen_var = tk.BooleanVar(value=self.config.get('auto_print_kitchen', True))
+        auto_kitchen_var = tk.BooleanVar(value=config.get('auto_print_kitchen', True))
         auto_kitchen_switch = ctk.CTkSwitch(container, text="Imprimir Cozinha", variable=auto_kitchen_var, font=("Arial", 11))
         auto_kitchen_switch.grid(row=8, column=0, columnspan=2, sticky="w", pady=5, padx=10)
 
+        # Toggle de impressão automática - Adicionais (itens acrescentados a pedidos já impressos)
+        auto_addendum_var = tk.BooleanVar(value=config.get('auto_print_addendum', True))
+        auto_addendum_switch = ctk.CTkSwitch(container, text="Imprimir Adicionais na Cozinha", variable=auto_addendum_var, font=("Arial", 11))
+        auto_addendum_switch.grid(row=9, column=0, columnspan=2, sticky="w", pady=5, padx=10)
+
         def save_settings():
-            self.config['printer_name'] = printer_entry.get()
-            self.config['paper_width'] = paper_var.get()
-            self.config['text_size'] = text_var.get()
-            self.config['auto_print_client'] = auto_client_var.get()
-            self.config['auto_print_kitchen'] = auto_kitchen_var.get()
+            changes = {
+                'printer_name': printer_entry.get(),
+                'paper_width': paper_var.get(),
+                'text_size': text_var.get(),
+                'auto_print_client': auto_client_var.get(),
+                'auto_print_kitchen': auto_kitchen_var.get(),
+                'auto_print_addendum': auto_addendum_var.get(),
+            }
             try:
-                self.config['line_spacing_px'] = int(spacing_entry.get())
-                self.config['rotation_degrees'] = int(rotation_var.get())
+                changes['line_spacing_px'] = int(spacing_entry.get())
+                changes['rotation_degrees'] = int(rotation_var.get())
             except:
                 pass
 
-            if save_config(self.config):
-                self.log("✅ Configurações salvas", "success")
-                auto_status = f" | Cliente: {'✓' if self.config['auto_print_client'] else '✗'} | Cozinha: {'✓' if self.config['auto_print_kitchen'] else '✗'}"
-                self.info_label.configure(text=f"Impressora: {self.config['printer_name']} | Papel: {self.config['paper_width']} | Texto: {self.config['text_size']}{auto_status}")
+            if self.config_store.update(changes):
+                self.log(f"✅ Configurações salvas (versão {self.config.version})", "success")
                 settings_window.destroy()
             else:
                 messagebox.showerror("Erro", "Falha ao salvar configurações")
@@ -990,9 +4345,14 @@ class PrinterClientApp:
 
     def on_close(self):
         """Fecha aplicação"""
+        if self.log_after is not None:
+            self.root.after_cancel(self.log_after)
+            self.log_after = None
         self.sse_client.stop()
         self.orders_client.stop()  # NOVO: Para escuta de pedidos
+        self.ingestion.stop()
         self.processor.stop()
+        self.config_store.stop_watching()
         self.root.destroy()
 
 # ============================================================================
@@ -1000,6 +4360,18 @@ class PrinterClientApp:
 # ============================================================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cliente de impressão Edienai Lanches")
+    parser.add_argument('--headless', action='store_true',
+                        help="Sem interface: atende as lojas do tenants.json (ou a loja padrão)")
+    parser.add_argument('--tenants', default=TENANTS_FILE, help="Arquivo de perfis das lojas")
+    parser.add_argument('--workers', type=int, default=PRINT_WORKERS, help="Threads de impressão compartilhadas")
+    args = parser.parse_args()
+    if args.headless:
+        sys.exit(run_headless(args.tenants, args.workers))
+        
+    if ctk is None:
+        print("Erro: interface gráfica requer customtkinter e tkinter instalados")
+        sys.exit(1)
     try:
         app = PrinterClientApp()
         app.run()
@@ -0,0 +1,40 @@
+"""
+Fixtures dos testes do cliente de impressão
+
+O cliente (test.py) é carregado como módulo, como no harness; APPDATA aponta
+para uma pasta temporária para que config, gráficos e arquivo de tickets de
+quem roda os testes não sejam tocados.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+CLIENT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test.py')
+
+
+@pytest.fixture(scope='session')
+def client():
+    os.environ['APPDATA'] = tempfile.mkdtemp(prefix='edienai-tests-')
+    module = sys.modules.get('edienai_client')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('edienai_client', CLIENT_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['edienai_client'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def make_order(order_id, *items, **fields):
+    """Pedido no formato do stream: items = (nome, quantidade[, observação])"""
+    return {
+        'id': order_id,
+        'items': [
+            {'name': item[0], 'quantity': item[1], 'notes': item[2] if len(item) > 2 else None}
+            for item in items
+        ],
+        **fields,
+    }
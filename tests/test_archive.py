@@ -0,0 +1,103 @@
+import os
+import time
+
+from PIL import Image
+
+
+def segment_path(archive):
+    return os.path.join(archive.path, archive._segments()[-1])
+
+
+def test_store_and_load_round_trip(client, tmp_path):
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    ticket = client.ESC_INIT + b'Pedido p1\n' + client.ESCPOS_CUT
+    archive.store('p1', 'client', 'CAIXA', ticket)
+    image = Image.new('L', (64, 32), 255)
+    image.paste(0, (0, 0, 32, 32))
+    archive.store('p1', 'kitchen', 'COZINHA', image)
+
+    meta, raw = archive.load(archive.latest('p1', 'client'))
+    assert meta['printer'] == 'CAIXA' and raw == ticket
+    meta, bitmap = archive.load(archive.latest('p1', 'kitchen'))
+    assert meta['format'] == 'bitmap'
+    assert bitmap.tobytes() == image.tobytes()
+    assert [entry[2] for entry in archive.find('p1')] == ['client', 'kitchen']
+
+
+def test_index_is_rebuilt_on_open(client, tmp_path):
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    for n in range(5):
+        archive.store(f"p{n}", 'client', 'CAIXA', f"ticket {n}".encode())
+    reopened = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert len(reopened.by_time) == 5
+    assert reopened.load(reopened.latest('p3'))[1] == b'ticket 3'
+
+
+def test_reopened_index_matches_live_index(client, tmp_path, monkeypatch):
+    base = time.time()
+    # Relógio voltando e horários repetidos: a ordenação única no fim da
+    # varredura tem de dar o mesmo índice que as inserções ordenadas ao vivo
+    clock = iter(base + delta for delta in (5, 3, 3, 9, 1, 3, 9, 2))
+    monkeypatch.setattr(client.time, 'time', lambda: next(clock))
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    for n, order_id in enumerate(['p3', 'p1', 'p2', 'p1', 'p3', 'p0', 'p2', 'p1']):
+        archive.store(order_id, 'client' if n % 3 else 'kitchen', 'CAIXA', f"ticket {n}".encode())
+    monkeypatch.undo()
+    reopened = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert reopened.by_time == archive.by_time
+    assert reopened.times == archive.times
+    assert reopened.by_order == archive.by_order
+    assert reopened.find('p1') == archive.find('p1')
+
+
+def test_torn_tail_record_is_truncated(client, tmp_path):
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    for n in range(3):
+        archive.store(f"p{n}", 'client', 'CAIXA', f"ticket {n}".encode())
+    path = segment_path(archive)
+    good_size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        # Queda de energia no meio da gravação: só parte do cabeçalho chegou ao disco
+        f.write(client.ARCHIVE_HEADER.pack(client.ARCHIVE_MAGIC, 40, 400, 0)[:10])
+
+    reopened = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert len(reopened.by_time) == 3
+    assert os.path.getsize(path) == good_size
+    reopened.store('p3', 'client', 'CAIXA', b'ticket 3')
+    assert client.TicketArchive(str(tmp_path), retention_days=0).load(reopened.latest('p3'))[1] == b'ticket 3'
+
+
+def test_corrupted_record_in_the_middle_is_skipped(client, tmp_path):
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    for n in range(5):
+        archive.store(f"p{n}", 'client', 'CAIXA', f"ticket {n}".encode())
+    path = segment_path(archive)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.seek(archive.latest('p1')[-1])
+        f.write(b'XXXX')   # assinatura do 2º registro danificada
+
+    reopened = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert [entry[2] for entry in reopened.by_time] == ['p0', 'p2', 'p3', 'p4']
+    assert os.path.getsize(path) == size
+    assert reopened.load(reopened.latest('p4'))[1] == b'ticket 4'
+
+    reopened.store('p5', 'client', 'CAIXA', b'ticket 5')
+    again = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert [entry[2] for entry in again.by_time] == ['p0', 'p2', 'p3', 'p4', 'p5']
+
+
+def test_corrupted_length_in_the_middle_does_not_truncate(client, tmp_path):
+    archive = client.TicketArchive(str(tmp_path), retention_days=0)
+    for n in range(5):
+        archive.store(f"p{n}", 'client', 'CAIXA', f"ticket {n}".encode())
+    path = segment_path(archive)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        # Tamanho do conteúdo do 2º registro apontando além do fim do arquivo
+        f.seek(archive.latest('p1')[-1] + 8)
+        f.write(b'\xff\xff\xff\x7f')
+
+    reopened = client.TicketArchive(str(tmp_path), retention_days=0)
+    assert [entry[2] for entry in reopened.by_time] == ['p0', 'p2', 'p3', 'p4']
+    assert os.path.getsize(path) == size
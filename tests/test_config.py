@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+
+import pytest
+
+
+def write_json(path, data, bump_ns=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    if bump_ns:
+        # Garante mtime diferente mesmo em sistemas de arquivos de baixa resolução
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump_ns))
+
+
+def test_update_saves_and_publishes_new_version(client, tmp_path):
+    path = str(tmp_path / 'config.json')
+    store = client.ConfigStore(path=path)
+    seen = []
+    store.add_listener(seen.append)
+
+    assert store.update({'printer_name': 'COZINHA'})
+    assert store.current.version == 2
+    assert store.current['printer_name'] == 'COZINHA'
+    assert seen == [store.current]
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['printer_name'] == 'COZINHA'
+
+
+def test_snapshot_overrides_do_not_touch_store(client):
+    store = client.ConfigStore.in_memory({'printer_name': 'CAIXA'})
+    derived = store.current.with_overrides({'printer_name': 'COZINHA'})
+    assert derived['printer_name'] == 'COZINHA'
+    assert derived.base_version == store.current.version
+    assert store.current['printer_name'] == 'CAIXA'
+
+
+def test_external_edit_is_reloaded(client, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_json(path, {'printer_name': 'CAIXA'})
+    store = client.ConfigStore(path=path)
+    assert store.current['printer_name'] == 'CAIXA'
+
+    write_json(path, {'printer_name': 'COZINHA'}, bump_ns=10_000_000)
+    assert store.reload_if_changed()
+    assert store.current['printer_name'] == 'COZINHA'
+    assert store.current.version == 2
+
+
+def test_current_does_not_touch_the_file(client, tmp_path, monkeypatch):
+    path = str(tmp_path / 'config.json')
+    write_json(path, {'printer_name': 'CAIXA'})
+    store = client.ConfigStore(path=path)
+    monkeypatch.setattr(store, '_file_mtime', lambda: pytest.fail("current consultou o arquivo"))
+    monkeypatch.setattr(client.time, 'time', lambda: 1e12)   # muito depois do intervalo
+    assert all(store.current['printer_name'] == 'CAIXA' for _ in range(1000))
+
+
+def test_watcher_thread_reloads_external_edit(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(client.ConfigStore, 'RELOAD_CHECK_INTERVAL', 0.02)
+    path = str(tmp_path / 'config.json')
+    write_json(path, {'printer_name': 'CAIXA'})
+    store = client.ConfigStore(path=path)
+    published = threading.Event()
+    store.add_listener(lambda snapshot: published.set())
+    store.start_watching()
+    try:
+        write_json(path, {'printer_name': 'COZINHA'}, bump_ns=10_000_000)
+        assert published.wait(5)
+        assert store.current['printer_name'] == 'COZINHA'
+    finally:
+        store.stop_watching()
+    assert store._watcher is None
+
+
+def test_reload_without_changes_keeps_version(client, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_json(path, {'printer_name': 'CAIXA'})
+    store = client.ConfigStore(path=path)
+
+    write_json(path, {'printer_name': 'CAIXA'}, bump_ns=10_000_000)
+    assert not store.reload_if_changed()
+    assert store.current.version == 1
+
+
+def test_malformed_external_edit_keeps_current_version(client, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_json(path, {'printer_name': '10.0.0.5:9100', 'paper_width': '58mm'})
+    store = client.ConfigStore(path=path)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"printer_name": "10.0.0.5:9100", "paper_')   # gravação pela metade
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+    assert not store.reload_if_changed()
+    assert store.current.version == 1
+    assert store.current['printer_name'] == '10.0.0.5:9100'
+    assert store.current['paper_width'] == '58mm'
+
+    write_json(path, {'printer_name': '10.0.0.6:9100', 'paper_width': '58mm'}, bump_ns=10_000_000)
+    assert store.reload_if_changed()
+    assert store.current['printer_name'] == '10.0.0.6:9100'
+
+
+def test_strict_load_raises_on_invalid_file(client, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_json(path, ['not', 'a', 'config'])
+    assert client.load_config(path) == client.DEFAULT_CONFIG
+    with pytest.raises(client.ConfigError):
+        client.load_config(path, strict=True)
+
+
+def test_tenant_overrides_survive_reload_and_update(client, tmp_path):
+    path = str(tmp_path / 'config-centro.json')
+    write_json(path, {'printer_name': 'CAIXA', 'paper_width': '58mm'})
+    store = client.ConfigStore(path=path, overrides={'printer_name': '192.168.0.50:9100'})
+    assert store.current['printer_name'] == '192.168.0.50:9100'
+
+    write_json(path, {'printer_name': 'CAIXA', 'paper_width': '80mm'}, bump_ns=10_000_000)
+    assert store.reload_if_changed()
+    assert store.current['printer_name'] == '192.168.0.50:9100'
+    assert store.current['paper_width'] == '80mm'
+
+    assert store.update({'printer_name': 'COZINHA', 'rotation_degrees': 0})
+    assert store.current['printer_name'] == '192.168.0.50:9100'
+    assert store.current['rotation_degrees'] == 0
+    with open(path, encoding='utf-8') as f:
+        saved = json.load(f)
+    # O arquivo da loja guarda só o que é dela; a sobrescrita continua no tenants.json
+    assert saved['printer_name'] == 'COZINHA' and saved['paper_width'] == '80mm'
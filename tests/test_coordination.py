@@ -0,0 +1,133 @@
+import json
+import time
+
+import pytest
+
+
+class FakeSocket:
+    """Guarda os pacotes enviados em vez de usar a rede"""
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append(data)
+
+
+@pytest.fixture
+def make_node(client):
+    """Coordenador sem rede nem thread: a eleição é chamada diretamente"""
+    def make(node_id, priority=100, discovered=True):
+        node = client.StationCoordinator('loja', 'segredo', priority, node_id=node_id)
+        node.sock = FakeSocket()
+        node.started = time.monotonic() - (client.COORD_PEER_TIMEOUT if discovered else 0)
+        return node
+    return make
+
+
+def see(node, peer, priority=100, leader=False, age=0.0):
+    node.peers[peer] = (priority, leader, time.monotonic() - age)
+
+
+def test_no_leader_during_discovery(make_node):
+    node = make_node('b', discovered=False)
+    node._elect()
+    assert not node.leader and node.leader_node is None
+
+
+def test_lowest_priority_then_id_wins_without_leader(make_node):
+    node = make_node('b', priority=100)
+    see(node, 'a', priority=100)
+    see(node, 'c', priority=50)
+    node._elect()
+    assert node.leader_node == 'c' and not node.leader
+
+    alone = make_node('b', priority=100)
+    see(alone, 'c', priority=100)
+    alone._elect()
+    assert alone.leader and len(alone.sock.sent) == 1   # anuncia a liderança na hora
+
+
+def test_incumbent_leader_is_kept(make_node):
+    node = make_node('a', priority=10)
+    see(node, 'z', priority=100, leader=True)
+    node._elect()
+    assert node.leader_node == 'z' and not node.leader
+
+
+def test_standby_takes_over_after_peer_timeout(client, make_node):
+    changes = []
+    node = make_node('b')
+    node.on_change = lambda leader, leader_node: changes.append((leader, leader_node))
+    node.on_promote = lambda commands: changes.append([c['commandId'] for c in commands])
+    see(node, 'a', leader=True)
+    node._elect()
+    assert node.admit({'commandId': 'c1', 'type': 'print'}) is False
+
+    see(node, 'a', leader=True, age=client.COORD_PEER_TIMEOUT + 0.1)
+    node._elect()
+    assert node.leader
+    assert changes == [(False, 'a'), (True, 'b'), ['c1']]
+
+
+def test_commands_handled_by_leader_are_not_reprinted(make_node):
+    leader, standby = make_node('a'), make_node('b')
+    leader._elect()
+    standby._receive(leader.sock.sent[-1])
+    assert standby.leader_node == 'a'
+
+    standby.admit({'commandId': 'c1', 'type': 'print'})
+    standby.admit({'commandId': 'c2', 'type': 'print'})
+    leader.active = True
+    leader.mark_handled('c1')
+    standby._receive(leader.sock.sent[-1])
+    assert list(standby.pending) == ['c2']
+    assert standby.admit({'commandId': 'c1', 'type': 'print'}) is False
+    assert list(standby.pending) == ['c2']
+
+
+def test_packets_with_wrong_key_are_ignored(client, make_node):
+    leader = make_node('a')
+    leader._elect()
+    stranger = client.StationCoordinator('loja', 'outra-senha', node_id='b')
+    stranger._receive(leader.sock.sent[-1])
+    assert stranger.peers == {}
+
+
+def test_replayed_packets_are_ignored(make_node):
+    leader, standby = make_node('a'), make_node('b')
+    leader._elect()
+    heartbeat = leader.sock.sent[-1]
+    standby._receive(heartbeat)
+    assert 'a' in standby.peers
+
+    leader.active = False
+    leader._send(leaving=True)
+    standby._receive(leader.sock.sent[-1])
+    assert 'a' not in standby.peers
+    # Heartbeat capturado antes da saída e reenviado: o líder não "volta"
+    standby._receive(heartbeat)
+    assert 'a' not in standby.peers
+
+
+def test_stale_packets_are_ignored(client, make_node):
+    leader, standby = make_node('a'), make_node('b')
+    message = {'station': 'loja', 'node': 'a', 'boot': 1, 'seq': 1, 'ts': time.time() - client.COORD_MAX_AGE - 5,
+               'priority': 1, 'leader': True, 'leaving': False, 'handled': []}
+    body = json.dumps(message).encode('utf-8')
+    standby._receive(leader._sign(body) + b'.' + body)
+    assert standby.peers == {}
+
+
+def test_store_secret_is_part_of_the_key(client):
+    tenant = client.Tenant('centro', 'https://workers.example.com', 'owner', '1234')
+    config = {**client.DEFAULT_CONFIG, 'coordination': True, 'coordination_secret': 'segredo-da-loja'}
+    leader = client.create_coordinator(config, tenant)
+    leader.sock = FakeSocket()
+    leader._send()
+    same = client.create_coordinator(config, tenant)
+    other = client.create_coordinator({**config, 'coordination_secret': 'outro'}, tenant)
+    same.sock = other.sock = FakeSocket()
+    same._receive(leader.sock.sent[-1])
+    other._receive(leader.sock.sent[-1])
+    assert leader.node_id in same.peers and other.peers == {}
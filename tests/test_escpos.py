@@ -0,0 +1,268 @@
+import re
+import struct
+
+from PIL import Image
+
+from conftest import make_order
+
+
+def test_raster_is_split_in_bands(client):
+    image = Image.new('L', (20, client.ESCPOS_RASTER_BAND + 10), 255)
+    image.putpixel((0, 0), 0)
+    data = client.escpos_raster(image)
+    width_bytes = 3
+    first = b'\x1dv0\x00' + struct.pack('<HH', width_bytes, client.ESCPOS_RASTER_BAND)
+    assert data.startswith(first)
+    assert data[len(first)] == 0x80   # MSB = primeiro ponto, preto
+    second_at = len(first) + width_bytes * client.ESCPOS_RASTER_BAND
+    assert data[second_at:second_at + 8] == b'\x1dv0\x00' + struct.pack('<HH', width_bytes, 10)
+    assert len(data) == 2 * 8 + width_bytes * image.height
+
+
+def test_graphic_define_and_print_commands(client):
+    image = Image.new('L', (16, 2), 0)
+    define = client.escpos_define_graphic('E0', image, 'nv')
+    params = bytes([48, 67, 48]) + b'E0' + bytes([1]) + struct.pack('<HH', 16, 2) + bytes([49]) + b'\xff' * 4
+    assert define == b'\x1d(L' + struct.pack('<H', len(params)) + params
+    assert client.escpos_print_graphic('E0', 'download') == b'\x1d(L\x06\x00' + bytes([48, 85]) + b'E0\x01\x01'
+
+
+def test_large_graphic_uses_extended_command(client):
+    command = client._escpos_graphics_command(b'\x00' * 0x10000)
+    assert command[:3] == b'\x1d8L' and struct.unpack('<I', command[3:7])[0] == 0x10000
+
+
+def test_qr_store_length_counts_header(client):
+    data = client.escpos_qr('https://edienai.com/p/123', 6)
+    store = b'\x1d(k' + struct.pack('<H', len('https://edienai.com/p/123') + 3) + b'1P0'
+    assert store + b'https://edienai.com/p/123' in data
+    assert data.endswith(b'\x1d(k\x03\x001Q0')
+
+
+def test_code128_uses_set_c_for_even_digits(client):
+    symbols = client.code128_symbols('123456')
+    assert symbols[:-1] == [client._CODE128_START_C, 12, 34, 56]
+    assert symbols[-1] == (105 + 1 * 12 + 2 * 34 + 3 * 56) % 103
+    assert client.escpos_barcode('123456', 2).endswith(b'\x1dkI\x05{C' + bytes([12, 34, 56]))
+
+
+def test_code128_set_b_escapes_brace(client):
+    assert client.escpos_barcode('A{1', 2).endswith(b'\x1dkI\x06{BA{{1')
+
+
+def test_pix_payload_crc(client):
+    assert client._crc16_ccitt(b'123456789') == 0x29B1
+    payload = client.pix_payload('chave@edienai.com', 'Edienai Lanches', 'São Paulo', 25.5, 'p-123')
+    assert '5303986' in payload and '540525.50' in payload and '6009Sao Paulo' in payload
+    assert payload[-4:] == f"{client._crc16_ccitt(payload[:-4].encode()):04X}"
+
+
+# GS ( L / GS 8 L com a função 67 (definir gráfico na memória NV)
+NV_DEFINE = re.compile(rb'\x1d(?:\(L..|8L....)0C0', re.DOTALL)
+
+
+class FlakyBackend:
+    """Backend ESC/POS que falha enquanto 'failing' estiver ligado"""
+
+    name = 'flaky'
+
+    def __init__(self):
+        self.failing = False
+        self.jobs = []
+
+    def print_raw(self, data, printer_name, job_name):
+        if self.failing:
+            raise OSError("sem papel")
+        self.jobs.append(data)
+
+    def print_raw_batch(self, chunks, printer_name, job_names):
+        for data, job_name in zip(chunks, job_names):
+            self.print_raw(data, printer_name, job_name)
+
+
+def escpos_processor(client, memory):
+    config = {**client.DEFAULT_CONFIG, 'force_bitmap': False, 'header_graphics': memory,
+              'archive_enabled': False, 'printer_name': 'CAIXA'}
+    backend = FlakyBackend()
+    processor = client.PrintCommandProcessor(config, lambda *a, **k: None, backend=backend,
+                                             graphics=client.GraphicsRegistry())
+    processor._async_confirm = lambda *args: None   # sem worker nos testes
+    return processor, backend, config
+
+
+def print_commands(count):
+    return [{'commandId': f"c{n}", 'type': 'print', 'printType': 'kitchen',
+             'orderData': make_order(f"p{n}", ('X-Burguer', 1))} for n in range(count)]
+
+
+def resident(processor, memory):
+    return dict(processor.graphics._printer('CAIXA')[memory])
+
+
+def test_print_failure_keeps_nv_graphics(client):
+    processor, backend, config = escpos_processor(client, 'nv')
+    order = make_order('p1', ('X-Burguer', 1))
+    assert processor._print_order(order, 'client', processor.config)
+    nv = resident(processor, 'nv')
+    assert nv
+
+    backend.failing = True
+    assert not processor._print_order(order, 'client', processor.config)
+    assert resident(processor, 'nv') == nv
+
+    backend.failing = False
+    assert processor._print_order(order, 'client', processor.config)
+    assert NV_DEFINE.search(backend.jobs[0])
+    assert not NV_DEFINE.search(backend.jobs[-1])   # a flash não é regravada
+
+
+def test_print_failure_forgets_download_graphics(client):
+    processor, backend, config = escpos_processor(client, 'download')
+    order = make_order('p1', ('X-Burguer', 1))
+    assert processor._print_order(order, 'client', processor.config)
+    assert resident(processor, 'download')
+    backend.failing = True
+    assert not processor._print_order(order, 'client', processor.config)
+    assert resident(processor, 'download') == {}
+
+
+def test_graphics_reset_forgets_every_memory(client):
+    registry = client.GraphicsRegistry()
+    registry.mark_resident('CAIXA', [('nv', 'E0', 'a'), ('download', 'E1', 'b')])
+    registry.invalidate('CAIXA', ('download',))
+    assert registry.is_resident('CAIXA', 'nv', 'E0', 'a')
+    registry.invalidate('CAIXA')
+    assert not registry.is_resident('CAIXA', 'nv', 'E0', 'a')
+
+
+def test_graphics_registry_persists_nv_and_reports_save_failure(client, tmp_path, capsys):
+    path = tmp_path / 'graphics.json'
+    registry = client.GraphicsRegistry(str(path))
+    registry.mark_resident('CAIXA', [('nv', registry.key_code('CAIXA', 'header'), 'a'), ('download', 'E1', 'b')])
+    reloaded = client.GraphicsRegistry(str(path))
+    assert reloaded.is_resident('CAIXA', 'nv', 'E0', 'a')
+    assert not reloaded.is_resident('CAIXA', 'download', 'E1', 'b')
+
+    path.unlink()
+    path.mkdir()   # os.replace sobre um diretório falha
+    assert not registry._save()
+    assert "[GRAPHICS] ❌ Erro ao salvar registro" in capsys.readouterr().out
+    assert [p.name for p in tmp_path.iterdir()] == ['graphics.json']
+
+
+def test_batch_marks_graphics_resident_only_after_printing(client):
+    processor, backend, config = escpos_processor(client, 'nv')
+    backend.failing = True
+    processor._handle_print_batch(print_commands(3))
+    assert resident(processor, 'nv') == {}
+
+    backend.failing = False
+    processor._handle_print_batch(print_commands(3))
+    assert resident(processor, 'nv')
+    # Um único envio do gráfico por job, mesmo com vários tickets
+    defined = len(resident(processor, 'nv'))
+    assert [len(NV_DEFINE.findall(job)) for job in backend.jobs] == [defined, 0, 0]
+
+
+class FakeDC:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def CreatePrinterDC(self, name):
+        pass
+
+    def StartDoc(self, name):
+        self.calls.append(('doc', name))
+
+    def StartPage(self):
+        self.calls.append(('page',))
+
+    def EndPage(self):
+        pass
+
+    def EndDoc(self):
+        pass
+
+    def DeleteDC(self):
+        pass
+
+    def GetHandleOutput(self):
+        return 0
+
+
+class FakeWin32:
+    """win32print/win32ui/ImageWin mínimos para observar os documentos GDI"""
+
+    def __init__(self):
+        self.calls = []
+
+    def OpenPrinter(self, name):
+        return name
+
+    def ClosePrinter(self, handle):
+        pass
+
+    def CreateDC(self):
+        return FakeDC(self.calls)
+
+    def Dib(self, img):
+        return self
+
+    def draw(self, handle, box):
+        pass
+
+
+def test_gdi_batch_cuts_every_ticket_unless_driver_cuts_pages(client, monkeypatch):
+    fake = FakeWin32()
+    for name in ('win32print', 'win32ui', 'ImageWin'):
+        monkeypatch.setattr(client, name, fake)
+    images = [Image.new('L', (8, 8), 255)] * 3
+    names = ['Pedido #1 - client', 'Pedido #2 - client', 'Pedido #3 - client']
+
+    client.create_printer_backend({'printer_backend': 'win32'}).print_image_batch(images, 'ELGIN', names)
+    assert [call for call in fake.calls if call[0] == 'doc'] == [('doc', name) for name in names]
+
+    fake.calls.clear()
+    backend = client.create_printer_backend({'printer_backend': 'win32', 'gdi_page_cut': True})
+    backend.print_image_batch(images, 'ELGIN', names)
+    assert fake.calls == [('doc', 'Pedido #1 - client (+2 tickets)'), ('page',), ('page',), ('page',)]
+
+
+def test_repeated_identical_edits_get_distinct_addendum_ids(client):
+    processor, backend, config = escpos_processor(client, 'nv')
+    changes = [{'action': 'ADICIONAR', 'quantity': 1, 'name': 'Coca', 'complements': [], 'notes': None}]
+    first = make_order('p1', ('X-Burguer', 1), ('Coca', 1), updatedAt='2026-10-19T12:00:00Z')
+    second = make_order('p1', ('X-Burguer', 1), ('Coca', 2), updatedAt='2026-10-19T12:05:00Z')
+    processor.enqueue_order_addendum(first, changes)
+    processor.enqueue_order_addendum(second, changes)
+    processor.enqueue_order_addendum(dict(second), changes)   # mesmo evento recebido de novo
+    ids = [processor.queue.get_nowait()['commandId'] for _ in range(3)]
+    assert ids[0] != ids[1] and ids[1] == ids[2]
+    assert '2026-10-19T12:05:00Z' in ids[1]
+
+    # Sem revisão no pedido, os itens resultantes ainda distinguem as edições
+    processor.enqueue_order_addendum(make_order('p2', ('Coca', 1)), changes)
+    processor.enqueue_order_addendum(make_order('p2', ('Coca', 2)), changes)
+    assert processor.queue.get_nowait()['commandId'] != processor.queue.get_nowait()['commandId']
+
+
+def test_qr_without_library_warns_and_prints_payload_as_text(client, monkeypatch, capsys):
+    monkeypatch.setattr(client, 'qrcode', None)
+    config = {**client.DEFAULT_CONFIG, 'force_bitmap': True, 'archive_enabled': False, 'printer_name': 'CAIXA',
+              'pix_key': 'chave@edienai.com', 'pix_merchant_name': 'Edienai Lanches', 'pix_merchant_city': 'São Paulo'}
+    processor = client.PrintCommandProcessor(config, lambda *a, **k: None, backend=FlakyBackend(),
+                                             graphics=client.GraphicsRegistry())
+    assert "'qrcode' não instalada" in capsys.readouterr().out
+
+    drawn = []
+    draw_block = processor._draw_block
+    monkeypatch.setattr(processor, '_draw_block', lambda lines, context: drawn.extend(lines) or draw_block(lines, context))
+    order = make_order('p1', ('X-Burguer', 1), total=25.5, paymentMethod='Pix')
+    assert processor.render_ticket(order, 'client') is not None
+    payload = client.build_order_view(order, 'client', processor.config)['pix_payload']
+    assert payload and ('center', payload, 'normal', '') in drawn
+
+    # Modo ESC/POS com QR nativo não depende da biblioteca: sem aviso
+    client.PrintCommandProcessor({**config, 'force_bitmap': False}, lambda *a, **k: None, backend=FlakyBackend(),
+                                 graphics=client.GraphicsRegistry())
+    assert "'qrcode'" not in capsys.readouterr().out
@@ -0,0 +1,171 @@
+import threading
+from collections import Counter
+
+from conftest import make_order
+
+
+def make_channel(client):
+    """Canal sem thread: os testes chamam _dispatch diretamente (thread única)"""
+    calls = {'commands': [], 'orders': [], 'updates': []}
+    channel = client.IngestionChannel(
+        on_command_callback=calls['commands'].append,
+        on_new_order_callback=calls['orders'].append,
+        on_order_update_callback=lambda order, changes: calls['updates'].append((order['id'], changes)),
+    )
+    return channel, calls
+
+
+def test_diff_unknown_order_starts_tracking(client):
+    snapshots = client.OrderSnapshots()
+    assert snapshots.diff(make_order('p1', ('X-Burguer', 1))) is None
+    assert snapshots.diff(make_order('p1', ('X-Burguer', 1))) == []
+
+
+def test_diff_reports_added_increased_and_cancelled_items(client):
+    snapshots = client.OrderSnapshots()
+    snapshots.seed(make_order('p1', ('X-Burguer', 1), ('Coca', 2), ('Batata', 1)))
+    changes = snapshots.diff(make_order('p1', ('X-Burguer', 2), ('Coca', 2), ('Suco', 1)))
+    summary = sorted((change['action'], change['name'], change['quantity']) for change in changes)
+    assert summary == [
+        ('ADICIONAR', 'Suco', 1),
+        ('ADICIONAR', 'X-Burguer', 1),
+        ('CANCELAR', 'Batata', 1),
+    ]
+
+
+def test_diff_reports_changed_notes(client):
+    snapshots = client.OrderSnapshots()
+    order = {'id': 'p1', 'items': [{'id': 'i1', 'name': 'X-Burguer', 'quantity': 1}]}
+    snapshots.seed(order)
+    order = {'id': 'p1', 'items': [{'id': 'i1', 'name': 'X-Burguer', 'quantity': 1, 'notes': 'sem cebola'}]}
+    changes = snapshots.diff(order)
+    assert [(change['action'], change['notes']) for change in changes] == [('ALTERAR', 'sem cebola')]
+
+
+def test_duplicate_commands_are_dispatched_once(client):
+    channel, calls = make_channel(client)
+    command = {'commandId': 'c1', 'type': 'print', 'orderId': 'p1'}
+    channel._dispatch('sse', 'command', command)
+    channel._dispatch('polling', 'command', dict(command))
+    channel._dispatch('sse', 'command', {'type': 'print'})   # sem ID: descartado
+    assert calls['commands'] == [command]
+    assert channel.stats['sse'] == {'received': 2, 'dispatched': 1, 'duplicates': 1}
+    assert channel.stats['polling']['duplicates'] == 1
+
+
+def test_duplicate_orders_are_dispatched_once(client):
+    channel, calls = make_channel(client)
+    order = make_order('p1', ('X-Burguer', 1))
+    channel._dispatch('orders-sse', 'order', order)
+    channel._dispatch('orders-sse', 'order', order)
+    assert calls['orders'] == [order]
+
+
+def test_update_dispatches_only_changes(client):
+    channel, calls = make_channel(client)
+    channel._dispatch('orders-sse', 'order', make_order('p1', ('X-Burguer', 1)))
+    channel._dispatch('orders-sse', 'order_update', make_order('p1', ('X-Burguer', 1)))
+    channel._dispatch('orders-sse', 'order_update', make_order('p1', ('X-Burguer', 1), ('Coca', 1)))
+    assert [(order_id, [c['name'] for c in changes]) for order_id, changes in calls['updates']] == [('p1', ['Coca'])]
+
+
+def test_reconnect_snapshot_prints_items_added_while_disconnected(client):
+    channel, calls = make_channel(client)
+    channel._dispatch('orders-sse', 'order_seed', make_order('p1', ('X-Burguer', 1)))
+    assert calls['updates'] == []
+
+    # Stream caiu; o item foi acrescentado e o snapshot da reconexão já o traz
+    channel._dispatch('orders-sse', 'order_seed', make_order('p1', ('X-Burguer', 1), ('Coca', 1)))
+    channel._dispatch('orders-sse', 'order_seed', make_order('p1', ('X-Burguer', 1), ('Coca', 1)))
+    assert [(order_id, [c['name'] for c in changes]) for order_id, changes in calls['updates']] == [('p1', ['Coca'])]
+
+
+def test_structured_notes_are_compared(client):
+    snapshots = client.OrderSnapshots()
+    order = {'id': 'p1', 'items': [{'id': 'i1', 'name': 'X-Burguer', 'quantity': 1, 'notes': ['sem cebola']}]}
+    snapshots.seed(order)
+    assert snapshots.diff(order) == []
+    order = {'id': 'p1', 'items': [{'id': 'i1', 'name': 'X-Burguer', 'quantity': 1, 'notes': {'remover': ['cebola', 'tomate']}}]}
+    changes = snapshots.diff(order)
+    assert [(c['action'], c['notes']) for c in changes] == [('ALTERAR', {'remover': ['cebola', 'tomate']})]
+
+
+def test_repeated_insert_does_not_reseed_snapshot(client):
+    channel, calls = make_channel(client)
+    first = make_order('p1', ('X-Burguer', 1))
+    channel._dispatch('orders-sse', 'order', first)
+    channel._dispatch('orders-sse', 'order_update', make_order('p1', ('X-Burguer', 1), ('Coca', 1)))
+    # Insert reentregue (polling/reconexão) com os itens originais
+    channel._dispatch('orders-polling', 'order', first)
+    channel._dispatch('orders-sse', 'order_update', make_order('p1', ('X-Burguer', 1), ('Coca', 1), ('Suco', 1)))
+    assert calls['orders'] == [first]
+    assert [[c['name'] for c in changes] for _, changes in calls['updates']] == [['Coca'], ['Suco']]
+
+
+def test_reconnect_snapshot_prints_orders_created_while_disconnected(client):
+    channel, calls = make_channel(client)
+    known = make_order('p1', ('X-Burguer', 1))
+    channel._dispatch('orders-sse', 'order_seed', known)
+    printed = make_order('p2', ('Coca', 1))
+    channel._dispatch('orders-sse', 'order', printed)
+
+    # O insert de p3 foi publicado com o stream fora do ar e só aparece no snapshot
+    missed = make_order('p3', ('Suco', 1))
+    for order in (known, printed, missed):
+        channel._dispatch('orders-sse', 'order_resync', order)
+    assert calls['orders'] == [printed, missed]
+    assert calls['updates'] == []
+
+    channel._dispatch('orders-sse', 'order', missed)   # insert reentregue depois
+    assert calls['orders'] == [printed, missed]
+
+
+def test_orders_client_resyncs_only_after_first_snapshot(client):
+    submitted = []
+
+    class Ingestion:
+        def submit(self, source, kind, data):
+            submitted.append((kind, data['id']))
+
+    orders_client = client.OrdersSSEClient(Ingestion(), lambda status: None, connections=object())
+    snapshot = {'event': 'orders:snapshot', 'orders': [make_order('p1', ('X-Burguer', 1))]}
+    orders_client._handle_event(snapshot)
+    orders_client._handle_event(snapshot)
+    assert submitted == [('order_seed', 'p1'), ('order_resync', 'p1')]
+
+
+def test_concurrent_producers_dispatch_each_id_once(client):
+    channel, calls = make_channel(client)
+    channel.start()
+    sources = ['sse', 'polling', 'orders-sse', 'orders-polling', 'manual', 'retry']
+    per_source = 2000
+    start = threading.Barrier(len(sources))
+
+    def produce(index, source):
+        start.wait()
+        for n in range(per_source):
+            # IDs se sobrepõem entre as origens e se repetem, sempre dentro da
+            # janela de deduplicação (ORDER_WINDOW)
+            key = (n // 2 + index * 50) % 400
+            if n % 2:
+                channel.submit(source, 'command', {'commandId': f"c{key}", 'type': 'print'})
+            else:
+                channel.submit(source, 'order', make_order(f"p{key}", ('X-Burguer', 1)))
+
+    threads = [threading.Thread(target=produce, args=(index, source)) for index, source in enumerate(sources)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    channel.join()
+    channel.stop()
+
+    commands = Counter(command['commandId'] for command in calls['commands'])
+    orders = Counter(order['id'] for order in calls['orders'])
+    assert len(commands) == len(orders) == 400
+    assert set(commands.values()) == {1} and set(orders.values()) == {1}
+    for source in sources:
+        stats = channel.stats[source]
+        assert stats['received'] == per_source
+        assert stats['dispatched'] + stats['duplicates'] == per_source
+    assert sum(stats['dispatched'] for stats in channel.stats.values()) == len(commands) + len(orders)
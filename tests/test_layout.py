@@ -0,0 +1,69 @@
+import unicodedata
+
+from PIL import ImageFont
+
+
+class MonoFont:
+    """Fonte fictícia: 10 px por caractere; 'AV' junto ganha 5 px (kerning invertido)"""
+
+    def getlength(self, text):
+        return 10.0 * len(text) + 5.0 * text.count('AV')
+
+    def getbbox(self, text):
+        return (0, 2, int(self.getlength(text)), 14)
+
+
+def lines_of(layout):
+    return [line for _, line, _ in layout]
+
+
+def test_wrap_breaks_at_last_space_that_fits(client):
+    engine = client.TextLayoutEngine()
+    assert lines_of(engine.wrap('abcde fghij', MonoFont(), 50)) == ['abcde', 'fghij']
+    # Cabe exatamente na largura: uma linha só
+    assert engine.wrap('abcde', MonoFont(), 50) == [(0, 'abcde', 50.0)]
+    assert lines_of(engine.wrap('abcde f', MonoFont(), 60)) == ['abcde', 'f']
+
+
+def test_continuation_lines_get_hanging_indent(client):
+    layout = client.TextLayoutEngine().wrap('aa bb cc dd', MonoFont(), 50, hang=20)
+    assert layout == [(0, 'aa bb', 50.0), (20, 'cc', 20.0), (20, 'dd', 20.0)]
+
+
+def test_long_word_without_spaces_is_split(client):
+    layout = client.TextLayoutEngine().wrap('abcdefghijkl', MonoFont(), 50)
+    assert lines_of(layout) == ['abcde', 'fghij', 'kl']
+
+
+def test_decomposed_accents_are_normalized(client):
+    engine = client.TextLayoutEngine()
+    decomposed = unicodedata.normalize('NFD', 'café com pão')
+    assert lines_of(engine.wrap(decomposed, MonoFont(), 40)) == ['café', 'com', 'pão']
+    # Acento combinante avulso não ocupa largura na soma em cache
+    assert engine.char_widths(MonoFont(), 'é') == [10.0, 0.0]
+
+
+def test_kerning_wider_than_cached_sum_is_corrected(client):
+    layout = client.TextLayoutEngine().wrap('AVAV AV', MonoFont(), 40)
+    # Soma em cache de 'AVAV' = 40, mas a medida real é 50: a linha recua
+    assert all(width <= 40 for _, _, width in layout)
+    assert ''.join(lines_of(layout)).replace(' ', '') == 'AVAVAV'
+
+
+def test_wrap_with_real_font_respects_width(client):
+    font = ImageFont.load_default(24)
+    text = 'Pão de queijo recheado com requeijão cremoso e orégano ' * 3
+    layout = client.TextLayoutEngine().wrap(text, font, 300, hang=30)
+    assert len(layout) > 1
+    assert all(offset + width <= 300 for offset, _, width in layout)
+    assert ' '.join(lines_of(layout)) == text.strip()
+
+
+def test_ink_box_cache_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(client.TextLayoutEngine, 'INK_BOX_CACHE_SIZE', 8)
+    engine = client.TextLayoutEngine()
+    font = MonoFont()
+    for n in range(50):
+        assert engine.ink_box(font, f"item {n}") == (2, 12)
+    assert len(engine.line_heights) == 8
+    assert (font, 'item 49') in engine.line_heights
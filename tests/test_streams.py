@@ -0,0 +1,87 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+
+class OneEventHandler(BaseHTTPRequestHandler):
+    """Aceita o stream, manda um único evento e fecha a conexão"""
+
+    protocol_version = 'HTTP/1.1'
+    connections = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.connections.append(time.monotonic())
+        body = b'data: {"event": "orders:snapshot", "orders": []}\n\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+
+@pytest.fixture
+def one_event_server():
+    connections = []
+    handler = type('Handler', (OneEventHandler,), {'connections': connections})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/stream", connections
+    server.shutdown()
+    server.server_close()
+
+
+def test_server_closing_after_one_event_backs_off(client, one_event_server, monkeypatch):
+    monkeypatch.setattr(client, 'STREAM_CHECK_INTERVAL', 0.05)
+    url, connections = one_event_server
+    payloads = []
+    stream = client.EventStream('TESTE', url, client.ConnectionManager(), payloads.append, lambda status: None, 'ok')
+    stream.start()
+    time.sleep(3)
+    stream.stop()
+
+    # Sem backoff eram ~100 conexões em 5 s; com espera mínima e backoff crescente, poucas
+    assert 2 <= len(connections) <= 6
+    gaps = [b - a for a, b in zip(connections, connections[1:])]
+    assert all(gap >= client.STREAM_MIN_RETRY * 0.9 for gap in gaps)
+    assert len(payloads) == len(connections)
+
+
+def test_pool_grows_with_tenant_count(client):
+    assert client.ConnectionManager().pool_size == client.ConnectionManager.POOL_SIZE
+    manager = client.ConnectionManager(tenants=10)
+    adapter = manager.session.get_adapter('https://workers.example.com')
+    assert manager.pool_size == 10 * client.ConnectionManager.CONNECTIONS_PER_TENANT
+    assert adapter.poolmanager.connection_pool_kw['maxsize'] == manager.pool_size
+
+
+def test_connections_resolve_through_dns_cache(client, one_event_server, monkeypatch):
+    url, connections = one_event_server
+    resolved = []
+    cache = client.DnsCache()
+    original = cache.resolve
+    monkeypatch.setattr(cache, 'resolve', lambda host, port: resolved.append((host, port)) or original(host, port))
+    monkeypatch.setattr(client, 'dns_cache', cache)
+    session = client.ConnectionManager().session
+    # O servidor fecha cada conexão: duas requisições abrem duas conexões
+    for _ in range(2):
+        assert session.get(url, timeout=5).status_code == 200
+    # Se o urllib3 deixar de chamar _new_conn, o DNS volta a ser consultado sempre
+    assert len(connections) == 2
+    assert resolved == [('127.0.0.1', urlsplit(url).port)] * 2
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_unvalidated_urllib3_keeps_stock_pools(client, monkeypatch):
+    monkeypatch.setattr(client.urllib3, '__version__', '3.0.0')
+    adapter = client.ConnectionManager().session.get_adapter('https://workers.example.com')
+    assert adapter.poolmanager.pool_classes_by_scheme['https'] is client.urllib3.HTTPSConnectionPool
+    assert adapter.poolmanager.connection_pool_kw['ssl_context'] is not None
@@ -0,0 +1,121 @@
+import importlib.util
+import os
+from datetime import datetime
+
+import pytest
+
+BENCH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench_render.py')
+
+
+@pytest.fixture(scope='module')
+def bench():
+    spec = importlib.util.spec_from_file_location('bench_render', BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def compile_lines(client, source, scope):
+    template = client.CompiledTemplate(source, 'teste')
+    return template.expand_static(template.render(scope))
+
+
+def test_default_template_matches_legacy_line_building(client, bench):
+    template = client.load_receipt_template()
+    for index, spec in enumerate(bench.ORDER_SIZES.values()):
+        for payment in ('Pix', 'Dinheiro'):
+            order = {**bench.generate_order(seed=index, **spec), 'paymentMethod': payment}
+            if payment == 'Dinheiro':
+                order['trocoPara'] = float(int(order['total'] // 50 + 1) * 50)
+            for print_type in bench.PRINT_TYPES:
+                compiled = template.expand_static(template.render(client.build_order_view(order, print_type)))
+                # Sem 'logo_path' a diretiva 'logo' não desenha nada; a montagem
+                # manual é anterior ao código de barras do pedido
+                compiled = [entry for entry in compiled if entry[0] not in ('logo', 'barcode')]
+                assert compiled == bench.legacy_receipt_lines(order, print_type)
+
+
+def test_conditions_loops_and_filters(client):
+    source = """
+    if vip
+        center bold | VIP
+    else
+        center bold | Cliente
+    end
+    if status == 'pago'
+        left normal | Pago em {paid_at|date}
+    end
+    if not items
+        left normal | Sem itens
+    end
+    for item in items
+        left normal hang="  " | {item.qty}x {item.name}
+        for comp in item.extras
+            left normal |   + {comp}
+        end
+    end
+    right total | {total|money}
+    qr {missing.path}
+    """
+    scope = {
+        'vip': False, 'status': 'pago', 'paid_at': datetime(2026, 1, 15, 20, 30), 'total': 12.5,
+        'items': [{'qty': 2, 'name': 'X-Burguer', 'extras': ['Bacon']}, {'qty': 1, 'name': 'Coca'}],
+    }
+    assert compile_lines(client, source, scope) == [
+        ('center', 'Cliente', 'bold', ''),
+        ('left', 'Pago em 15/01/2026 20:30', 'normal', ''),
+        ('left', '2x X-Burguer', 'normal', '  '),
+        ('left', '  + Bacon', 'normal', ''),
+        ('left', '1x Coca', 'normal', '  '),
+        ('right', 'R$ 12,50', 'total', ''),
+        ('qr', '', '', ''),
+    ]
+    assert compile_lines(client, source, {'vip': True, 'items': []})[:2] == [
+        ('center', 'VIP', 'bold', ''), ('left', 'Sem itens', 'normal', '')]
+
+
+def test_static_blocks_are_referenced_then_expanded(client):
+    template = client.CompiledTemplate("""
+    static topo
+        center title | Loja
+        rule
+    end
+    left normal | {name}
+    """, 'teste')
+    lines = template.render({'name': 'Ana'})
+    assert lines == [('static', 'topo', '', ''), ('left', 'Ana', 'normal', '')]
+    assert template.expand_static(lines) == [
+        ('center', 'Loja', 'title', ''), ('rule', client.RULE_TEXT, 'normal', ''), ('left', 'Ana', 'normal', '')]
+
+
+def test_literal_text_is_not_code(client):
+    text = "'), __import__('os').getcwd(), ('"
+    assert compile_lines(client, f"left normal | {text}", {}) == [('left', text, 'normal', '')]
+
+
+@pytest.mark.parametrize('source, message', [
+    ("if vip\n  left normal | x", "sem 'end'"),
+    ("for item in items\n  left normal | x", "sem 'end'"),
+    ("end", "'end' sem bloco aberto"),
+    ("else", "'else' fora de 'if'"),
+    ("if a\nelse\nelse\nend", "'else' fora de 'if'"),
+    ("if a ==\nend", "condição inválida"),
+    ("if a == \"b\"\nend", "condição inválida"),
+    ("for item items\nend", "'for' inválido"),
+    ("bold | texto", "diretiva inválida"),
+    ("left normal texto", "diretiva inválida"),
+    ("left gigante | texto", "fonte desconhecida"),
+    ("left normal | {total|euro}", "filtro desconhecido"),
+    ("qr {total|euro}", "filtro desconhecido"),
+    ("static topo\n  left normal | {name}\nend", "bloco 'static'"),
+    ("static topo\nend\nstatic topo\nend", "'static' inválido ou repetido"),
+])
+def test_syntax_errors_are_reported_at_compile_time(client, source, message):
+    with pytest.raises(client.TemplateError, match=message):
+        client.CompiledTemplate(source, 'teste')
+
+
+def test_broken_template_file_falls_back_to_default(client, tmp_path):
+    path = tmp_path / 'recibo.txt'
+    path.write_text("if vip\n  left normal | x\n", encoding='utf-8')
+    assert client.load_receipt_template(str(path)) is client.compile_template(client.DEFAULT_RECEIPT_TEMPLATE)